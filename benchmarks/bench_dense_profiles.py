@@ -0,0 +1,139 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from utils.milvus_connection import get_milvus_client
+from env_utils import COLLECTION_NAME, MILVUS_URI
+from llm_utils import openai_embedding
+from utils.embedding_cache import cached_query_embeddings
+from documents.dense_profile import DENSE_PROFILES, DenseProfile
+from documents.collection_profile import CollectionProfile, ensure_collection
+from benchmarks.calibrate_search_params import load_corpus, summarize
+
+"""
+比较 dense 字段各存储/索引方案 (documents/dense_profile.py) 在同一份语料上的表现
+从已导入数据的集合中读出全部稠密向量, 为每个 profile 建一个只有 id + dense 的临时集合, 报告:
+- 内存: 按向量类型/维度/索引结构估算的查询节点内存 (Milvus 没有提供单个索引的内存统计)
+- 构建耗时: 写入 + 等待索引构建完成 + load
+- 检索延迟 p50 / p95
+- recall@k: 以 float32 全维度的暴力内积 top-k 为真值
+python benchmarks/bench_dense_profiles.py --k 10 --queries 200 --profiles fp32_hnsw fp16_hnsw hnsw_sq8 ivf_pq
+"""
+
+
+def wait_for_index(client, collection_name: str, index_name: str, timeout: float = 1800.0):
+    """等待索引构建完成 describe_index 中没有构建进度的后端 (例如本地向量库) 直接返回"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = client.describe_index(collection_name=collection_name, index_name=index_name) or {}
+        if "pending_index_rows" not in info and "state" not in info:
+            return
+        if info.get("pending_index_rows", 0) == 0 and info.get("state", "Finished") == "Finished":
+            return
+        time.sleep(1.0)
+    raise TimeoutError(f"集合 {collection_name} 的索引在 {timeout} 秒内没有构建完成")
+
+
+def build_collection(client, name: str, profile: DenseProfile, vectors: np.ndarray, batch_size: int) -> float:
+    """建表并写入全部向量 返回构建耗时(秒)"""
+    bench_profile = CollectionProfile.from_dict(f"bench_{profile.name}", {
+        "fields": [{"name": "id", "type": "INT64", "is_primary": True}],
+        "dense_profile": profile,
+    })
+    ensure_collection(client, bench_profile, collection_name=name, recreate=True)
+
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch_size):
+        encoded = profile.encode(vectors[offset:offset + batch_size])
+        client.insert(collection_name=name, data=[{"id": offset + i, "dense": v} for i, v in enumerate(encoded)])
+    client.flush(collection_name=name)
+    wait_for_index(client, name, "dense_vector_index")
+    client.load_collection(collection_name=name)
+    return time.perf_counter() - start
+
+
+def evaluate(client, name: str, profile: DenseProfile, query_vectors: np.ndarray, truth: list, k: int, ef: int):
+    latencies, recalls = [], []
+    search_params = {"params": profile.dense_param({"ef": max(ef, k)})}
+    for vector, expected in zip(query_vectors, truth):
+        data = profile.encode(vector[None, :])
+        start = time.perf_counter()
+        hits = client.search(collection_name=name, data=data, anns_field="dense", search_params=search_params,
+                             limit=k)[0]
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len({hit["id"] for hit in hits} & expected) / k)
+    p50, p95 = summarize(latencies)
+    return float(np.mean(recalls)), p50, p95
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="比较 dense 字段的 float16 / 量化索引 / 维度截断方案")
+    arg_parser.add_argument("--uri", default=MILVUS_URI)
+    arg_parser.add_argument("--collection", default=COLLECTION_NAME, help="读取语料向量的源集合")
+    arg_parser.add_argument("--pk-field", default="id")
+    arg_parser.add_argument("--dense-field", default="dense")
+    arg_parser.add_argument("--text-field", default="text")
+    arg_parser.add_argument("--profiles", nargs="+", default=list(DENSE_PROFILES), choices=list(DENSE_PROFILES))
+    arg_parser.add_argument("--k", type=int, default=10)
+    arg_parser.add_argument("--ef", type=int, default=64, help="HNSW 系列的 ef, IVF 系列使用 profile 的 nprobe")
+    arg_parser.add_argument("--queries", type=int, default=200)
+    arg_parser.add_argument("--max-rows", type=int, default=200_000)
+    arg_parser.add_argument("--batch-size", type=int, default=1000)
+    arg_parser.add_argument("--keep", action="store_true", help="保留各 profile 的临时集合")
+    arg_parser.add_argument("--output", default=None, help="默认写到 cache/dense_profiles_<集合名>.json")
+    args = arg_parser.parse_args()
+
+    client = get_milvus_client(args.uri)
+    client.load_collection(args.collection)
+    _, vectors, titles = load_corpus(client, args.collection, args.pk_field, args.dense_field, args.text_field,
+                                     args.max_rows)
+    print(f"读入 {len(vectors)} 行 维度 {vectors.shape[1]}")
+
+    random.seed(0)
+    queries = random.sample(titles, min(args.queries, len(titles)))
+    query_vectors = np.asarray(cached_query_embeddings(openai_embedding).embed_queries(queries), dtype=np.float32)
+    # 真值: float32 全维度暴力内积, 临时集合的主键就是行号
+    truth = [set(np.argsort(-row)[:args.k].tolist()) for row in query_vectors @ vectors.T]
+
+    results = []
+    for profile_name in args.profiles:
+        profile = DENSE_PROFILES[profile_name]
+        name = f"{args.collection}_bench_{profile_name}"
+        try:
+            build_seconds = build_collection(client, name, profile, vectors, args.batch_size)
+            recall, p50, p95 = evaluate(client, name, profile, query_vectors, truth, args.k, args.ef)
+        except Exception as e:   # 例如 Milvus 版本不支持 HNSW_SQ / BFLOAT16
+            print(f"{profile_name:<18} 失败: {e}")
+            continue
+        finally:
+            if not args.keep and client.has_collection(name):
+                client.drop_collection(name)
+        results.append({
+            "profile": profile_name,
+            "vector_type": profile.vector_type,
+            "dim": profile.dim,
+            "index_type": profile.index_type,
+            "memory_mb": profile.memory_bytes(len(vectors)) / 2 ** 20,
+            "build_seconds": build_seconds,
+            "recall": recall,
+            "p50_ms": p50,
+            "p95_ms": p95,
+        })
+        r = results[-1]
+        print(f"{profile_name:<18} 内存≈{r['memory_mb']:.1f}MB 构建={build_seconds:.1f}s "
+              f"recall@{args.k}={recall:.4f} p50={p50:.1f}ms p95={p95:.1f}ms")
+
+    output = args.output or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache",
+                                         f"dense_profiles_{args.collection}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"collection": args.collection, "rows": len(vectors), "k": args.k, "profiles": results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {output}")
@@ -0,0 +1,103 @@
+import sys
+import os
+import time
+import random
+import argparse
+import tempfile
+import importlib
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from documents.markdown_parser import MarkdownParser, BACKENDS
+
+"""
+对比 MarkdownParser 两种解析后端(unstructured / native)的性能与输出一致性
+python benchmarks/bench_markdown_parser.py --md-dir E:\\Workspace\\ai\\RAG\\datas\\md
+python benchmarks/bench_markdown_parser.py --synthetic 200      # 没有语料时生成一批模拟的技术报告
+"""
+
+
+def make_sample_corpus(dir_path: str, n_files: int, seed: int = 42) -> list[str]:
+    """生成模拟的技术报告 多级标题 + 段落 + 列表 + 表格"""
+    rng = random.Random(seed)
+    words = ["刻蚀", "晶圆", "光刻", "沉积", "清洗", "良率", "工艺", "设备", "纳米", "薄膜", "掺杂", "封装"]
+
+    def sentence():
+        return "".join(rng.choice(words) for _ in range(rng.randint(8, 30))) + "。"
+
+    paths = []
+    for i in range(n_files):
+        lines = [f"# 技术报告 {i}", "", sentence(), ""]
+        for s in range(rng.randint(3, 8)):
+            lines += [f"## 第{s + 1}章 {rng.choice(words)}", "", " ".join(sentence() for _ in range(3)), ""]
+            for t in range(rng.randint(1, 4)):
+                lines += [f"### {s + 1}.{t + 1} {rng.choice(words)}", ""]
+                lines += [f"- **{rng.choice(words)}**: {sentence()}" for _ in range(rng.randint(2, 10))]
+                lines += ["", " ".join(sentence() for _ in range(rng.randint(1, 5))), ""]
+            lines += ["| 参数 | 数值 |", "| --- | --- |", f"| 温度 | {rng.randint(20, 400)} |", ""]
+        path = os.path.join(dir_path, f"report_{i:05d}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        paths.append(path)
+    return paths
+
+
+def run_backend(backend: str, md_files: list[str]) -> dict:
+    import_start = time.perf_counter()
+    if backend == "unstructured":
+        importlib.import_module("langchain_community.document_loaders")   # 统计导入耗时
+    import_seconds = time.perf_counter() - import_start
+
+    parser = MarkdownParser(backend=backend)
+    elements = 0
+    merged = 0
+    titles = set()
+    parse_start = time.perf_counter()
+    for md_file in md_files:
+        documents = parser.parse_markdown(md_file)
+        elements += len(documents)
+        for document in parser.merge_title_content(documents):
+            merged += 1
+            titles.add((os.path.basename(md_file), document.metadata.get("title"), document.metadata.get("category")))
+    parse_seconds = time.perf_counter() - parse_start
+    return {
+        "backend": backend,
+        "import_seconds": import_seconds,
+        "parse_seconds": parse_seconds,
+        "files_per_second": len(md_files) / parse_seconds if parse_seconds else 0.0,
+        "elements": elements,
+        "merged": merged,
+        "titles": titles,
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="MarkdownParser 解析后端基准测试")
+    arg_parser.add_argument("--md-dir", default=None, help="Markdown 语料目录")
+    arg_parser.add_argument("--synthetic", type=int, default=100, help="未指定语料目录时生成的模拟文件数")
+    arg_parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    args = arg_parser.parse_args()
+
+    tmp_dir = None
+    if args.md_dir:
+        md_files = sorted(os.path.join(args.md_dir, f) for f in os.listdir(args.md_dir) if f.endswith(".md"))
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        md_files = make_sample_corpus(tmp_dir.name, args.synthetic)
+    print(f"语料: {len(md_files)} 个 Markdown 文件")
+
+    results = [run_backend(backend, md_files) for backend in args.backends]
+    print(f"{'backend':<14}{'import(s)':>10}{'parse(s)':>10}{'files/s':>10}{'elements':>10}{'merged':>10}")
+    for r in results:
+        print(f"{r['backend']:<14}{r['import_seconds']:>10.2f}{r['parse_seconds']:>10.2f}"
+              f"{r['files_per_second']:>10.1f}{r['elements']:>10}{r['merged']:>10}")
+
+    # 输出一致性: 比较两种后端合并后得到的 (文件, 标题, category) 集合
+    if len(results) == 2:
+        a, b = results[0]["titles"], results[1]["titles"]
+        overlap = len(a & b) / max(1, len(a | b))
+        print(f"标题/category 一致率: {overlap:.1%} (仅在 {results[0]['backend']}: {len(a - b)}, 仅在 {results[1]['backend']}: {len(b - a)})")
+
+    if tmp_dir is not None:
+        tmp_dir.cleanup()
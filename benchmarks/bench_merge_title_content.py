@@ -0,0 +1,107 @@
+import sys
+import os
+import time
+import copy
+import argparse
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from documents.markdown_parser import MarkdownParser
+
+"""
+merge_title_content 的微基准测试 验证合并耗时随元素数量线性增长
+wide: 一个标题下挂 n 个列表项(旧实现每追加一项都要重建父标题字符串, 是 O(n²))
+deep: 6 级嵌套的标题树重复出现, 每个标题下挂若干内容, 总元素数为 n
+python benchmarks/bench_merge_title_content.py --sizes 2000 4000 8000 16000 32000
+"""
+
+
+def element(text: str, category: str, element_id: str, parent_id: str = None, depth: int = None) -> Document:
+    metadata = {"category": category, "element_id": element_id}
+    if parent_id is not None:
+        metadata["parent_id"] = parent_id
+    if depth is not None:
+        metadata["category_depth"] = depth
+    return Document(page_content=text, metadata=metadata)
+
+
+def wide_elements(n: int) -> list[Document]:
+    docs = [element("宽文档标题", "Title", "t0", depth=0)]
+    docs += [element(f"列表项{i} 晶圆清洗工艺参数说明", "ListItem", f"l{i}", "t0") for i in range(n)]
+    return docs
+
+
+def deep_elements(n: int, depth: int = 6, items_per_title: int = 20) -> list[Document]:
+    docs = []
+    i = 0
+    while len(docs) < n:
+        parent_id = None
+        for level in range(depth):
+            title_id = f"t{i}_{level}"
+            docs.append(element(f"第{level + 1}级标题{i}", "Title", title_id, parent_id, level))
+            docs += [element(f"内容{i}_{level}_{j} 刻蚀速率与选择比", "NarrativeText", f"c{i}_{level}_{j}", title_id)
+                     for j in range(items_per_title)]
+            parent_id = title_id
+        i += 1
+    return docs[:n]
+
+
+def merge_naive(datas: list[Document]) -> list[Document]:
+    """旧实现: 每个子元素都直接拼接父标题的 page_content"""
+    merged_data = []
+    parent_dict = {}
+    for document in datas:
+        metadata = document.metadata
+        parent_id = metadata.get('parent_id', None)
+        category = metadata.get('category', None)
+        element_id = metadata.get('element_id', None)
+        if category == 'NarrativeText' and parent_id is None:
+            merged_data.append(document)
+        if category == 'Title':
+            document.metadata['title'] = document.page_content
+            if parent_id and parent_id in parent_dict:
+                document.page_content = parent_dict[parent_id].page_content + ' -> ' + document.page_content
+            parent_dict[element_id] = document
+        if category != 'Title' and parent_id:
+            if parent_id in parent_dict:
+                parent_dict[parent_id].page_content = parent_dict[parent_id].page_content + '->' + document.page_content
+                parent_dict[parent_id].metadata['category'] = 'TitleWithContent'
+            else:
+                merged_data.append(document)
+    merged_data.extend(parent_dict.values())
+    return merged_data
+
+
+def timed(func, datas: list[Document], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        docs = copy.deepcopy(datas)   # 合并会修改 Document, 每次都用新的副本
+        start = time.perf_counter()
+        func(docs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="merge_title_content 微基准测试")
+    arg_parser.add_argument("--sizes", nargs="+", type=int, default=[2000, 4000, 8000, 16000, 32000])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    parser = MarkdownParser(backend="native")
+    for shape, make in (("wide", wide_elements), ("deep", deep_elements)):
+        print(f"\n[{shape}]")
+        print(f"{'n':>8}{'buffered(ms)':>14}{'us/elem':>10}{'naive(ms)':>12}{'us/elem':>10}")
+        for n in args.sizes:
+            datas = make(n)
+            # 输出必须与旧实现完全一致
+            expected = [(d.page_content, d.metadata) for d in merge_naive(copy.deepcopy(datas))]
+            actual = [(d.page_content, d.metadata) for d in parser.merge_title_content(copy.deepcopy(datas))]
+            assert expected == actual, f"{shape} n={n} 合并结果与旧实现不一致"
+
+            buffered = timed(parser.merge_title_content, datas, args.repeat)
+            naive = timed(merge_naive, datas, args.repeat)
+            print(f"{n:>8}{buffered * 1e3:>14.2f}{buffered / n * 1e6:>10.2f}{naive * 1e3:>12.2f}{naive / n * 1e6:>10.2f}")
+    print("\nus/elem 基本不随 n 变化说明耗时线性增长")
@@ -0,0 +1,91 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+import random
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""
+RAG 流式问答服务压测 先启动服务:
+python documents/rag_server.py --port 8080 --stub --max-concurrency 32
+再运行:
+python benchmarks/bench_rag_server.py --port 8080 --requests 500 --concurrency 64 --cancel-ratio 0.1
+统计首字耗时(TTFT) 总耗时的 p50/p95 和 QPS; cancel-ratio 比例的请求在收到第一个答案片段后主动断开, 验证取消逻辑
+"""
+
+QUESTIONS = ["干法刻蚀的优势？", "湿法刻蚀的优势", "先进纳米级清洗技术", "光刻胶的作用", "化学气相沉积的原理"]
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def one_request(host: str, port: int, question: str, cancel: bool) -> dict:
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps({"question": question}, ensure_ascii=False).encode("utf-8")
+    writer.write(f"POST /chat HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+    first_token = None
+    tokens = 0
+    status = "ok"
+    try:
+        async for line in reader:
+            line = line.decode("utf-8").strip()
+            if line.startswith("event: error"):
+                status = "error"
+            if not line.startswith("data: "):
+                continue
+            data = json.loads(line[len("data: "):])
+            if "token" in data:
+                tokens += 1
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                    if cancel:
+                        status = "cancelled"
+                        break
+    finally:
+        writer.close()
+    return {"status": status, "ttft": first_token, "total": time.perf_counter() - start, "tokens": tokens}
+
+
+async def run(host: str, port: int, requests: int, concurrency: int, cancel_ratio: float):
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def bounded(i: int):
+        async with limiter:
+            return await one_request(host, port, QUESTIONS[i % len(QUESTIONS)], random.random() < cancel_ratio)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(i) for i in range(requests)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if isinstance(r, Exception) or r["status"] == "error"]
+    ok = [r for r in results if not isinstance(r, Exception) and r["status"] == "ok"]
+    cancelled = [r for r in results if not isinstance(r, Exception) and r["status"] == "cancelled"]
+    ttft = [r["ttft"] for r in ok if r["ttft"] is not None]
+    total = [r["total"] for r in ok]
+    print(f"请求 {requests}, 客户端并发 {concurrency}, 耗时 {elapsed:.2f}s, QPS {len(ok) / elapsed:.1f}")
+    print(f"完成 {len(ok)}, 主动取消 {len(cancelled)}, 失败 {len(failed)}")
+    print(f"TTFT  p50={percentile(ttft, 0.5) * 1e3:.0f}ms p95={percentile(ttft, 0.95) * 1e3:.0f}ms")
+    print(f"总耗时 p50={percentile(total, 0.5) * 1e3:.0f}ms p95={percentile(total, 0.95) * 1e3:.0f}ms")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="RAG 流式问答服务压测")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--requests", type=int, default=200)
+    arg_parser.add_argument("--concurrency", type=int, default=64, help="客户端同时发起的请求数")
+    arg_parser.add_argument("--cancel-ratio", type=float, default=0.0, help="收到首个片段后主动断开的请求比例")
+    args = arg_parser.parse_args()
+    asyncio.run(run(args.host, args.port, args.requests, args.concurrency, args.cancel_ratio))
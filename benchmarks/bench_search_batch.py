@@ -0,0 +1,75 @@
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_tool.hybrid_retriever import HybridRetriever
+from search_tool.query_coalescer import QueryCoalescer
+
+"""
+批量检索吞吐测试 需要一个已经导入数据的 Milvus 集合
+1. QPS vs 批大小: 每批一次 embed_documents + 一次多向量 hybrid_search, 分别统计 embedding 和检索耗时
+2. 请求合并: 多个线程各自发起单条查询, 由 QueryCoalescer 在时间窗口内合并
+python benchmarks/bench_search_batch.py --queries 256 --batch-sizes 1 4 16 64 --threads 32
+"""
+
+SAMPLE_QUERIES = [
+    "湿法刻蚀的优势", "干法刻蚀", "先进纳米级清洗技术", "光刻胶的作用", "化学气相沉积的原理",
+    "晶圆良率提升方法", "等离子体刻蚀的选择比", "薄膜沉积的均匀性", "离子注入的掺杂浓度", "先进封装技术",
+]
+
+
+def make_queries(n: int) -> list[str]:
+    # 加编号避免完全相同的查询 让每条查询都真实地走一遍 embedding 和检索
+    return [f"{SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]} {i}" for i in range(n)]
+
+
+def bench_batch_sizes(retriever: HybridRetriever, queries: list[str], batch_sizes: list[int]):
+    print(f"{'batch':>6}{'QPS':>10}{'embed(ms)/批':>14}{'search(ms)/批':>15}")
+    for batch_size in batch_sizes:
+        embed_seconds = 0.0
+        search_seconds = 0.0
+        start = time.perf_counter()
+        for i in range(0, len(queries), batch_size):
+            part = queries[i:i + batch_size]
+            t0 = time.perf_counter()
+            vectors = retriever.embedding.embed_documents(part)
+            t1 = time.perf_counter()
+            retriever.hybrid_search(vectors, part)
+            t2 = time.perf_counter()
+            embed_seconds += t1 - t0
+            search_seconds += t2 - t1
+        elapsed = time.perf_counter() - start
+        batches = (len(queries) + batch_size - 1) // batch_size
+        print(f"{batch_size:>6}{len(queries) / elapsed:>10.1f}"
+              f"{embed_seconds / batches * 1e3:>14.1f}{search_seconds / batches * 1e3:>15.1f}")
+
+
+def bench_coalescer(retriever: HybridRetriever, queries: list[str], threads: int, window_ms: float):
+    coalescer = QueryCoalescer(retriever, window_ms=window_ms, max_batch_size=retriever.max_batch_size)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(coalescer.search, queries))
+    elapsed = time.perf_counter() - start
+    coalescer.close()
+    print(f"请求合并: {threads} 个并发线程, 窗口 {window_ms}ms, QPS={len(queries) / elapsed:.1f}, "
+          f"平均批大小={coalescer.queries / max(1, coalescer.batches):.1f}")
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="批量检索吞吐测试")
+    arg_parser.add_argument("--queries", type=int, default=256)
+    arg_parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32, 64])
+    arg_parser.add_argument("--threads", type=int, default=32, help="请求合并测试的并发线程数")
+    arg_parser.add_argument("--window-ms", type=float, default=5.0)
+    args = arg_parser.parse_args()
+
+    retriever = HybridRetriever.from_uri(max_batch_size=max(args.batch_sizes))
+    queries = make_queries(args.queries)
+    retriever.search_batch(queries[:2])   # 预热 建立连接
+    bench_batch_sizes(retriever, queries, args.batch_sizes)
+    bench_coalescer(retriever, queries, args.threads, args.window_ms)
@@ -0,0 +1,150 @@
+import sys
+import os
+import json
+import time
+import random
+import argparse
+from typing import Union
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from pymilvus import MilvusClient
+from utils.milvus_connection import get_milvus_client
+from env_utils import COLLECTION_NAME, MILVUS_URI
+from llm_utils import openai_embedding
+from utils.embedding_cache import cached_query_embeddings
+from search_tool.search_params import calibration_path
+from documents.dense_profile import DENSE_PROFILES, DenseProfile, get_dense_profile
+
+"""
+检索参数标定 在已导入数据的集合上测量 recall@k 与延迟的关系, 结果供 SearchParamPolicy 使用
+- dense: 把集合中的全部稠密向量读到内存, 用 NumPy 暴力计算内积得到精确 top-k 作为真值, 再对每个 ef 测 HNSW 的召回率和延迟
+- sparse: drop_ratio_search=0 时倒排索引的 BM25 检索是精确的, 以它为真值测其他 drop_ratio_search
+查询默认从集合中随机抽取文档的标题/开头作为问题, 也可以用 --query-file 指定(每行一个问题)
+集合的 dense 字段不是 fp32 全维度时 (float16 / bfloat16 / Matryoshka 截断) 用 --dense-profile 指定建表时的方案:
+读出的向量按它解码, 查询向量按它编码, 真值与 Milvus 比较的是同一份数据; IVF 系列使用 profile 的 nprobe, 不随 ef 变化
+python benchmarks/calibrate_search_params.py --k 10 --queries 200 --efs 16 32 64 128 256 --drop-ratios 0 0.1 0.2 0.3 0.5
+"""
+
+
+def load_corpus(client: MilvusClient, collection_name: str, pk_field: str, dense_field: str, text_field: str,
+                max_rows: int, dense_profile: Union[str, DenseProfile, None] = None):
+    """分批读出主键 稠密向量和文本 稠密向量按集合的 dense profile 解码为 float32"""
+    iterator = client.query_iterator(collection_name=collection_name, batch_size=1000, limit=max_rows,
+                                     output_fields=[pk_field, dense_field, text_field, "title"])
+    ids, vectors, texts = [], [], []
+    while True:
+        rows = iterator.next()
+        if not rows:
+            iterator.close()
+            break
+        for row in rows:
+            ids.append(row[pk_field])
+            vectors.append(row[dense_field])
+            texts.append(row.get("title") or row[text_field][:60])
+    return np.asarray(ids), get_dense_profile(dense_profile).decode(vectors), texts
+
+
+def summarize(latencies: list[float]) -> tuple[float, float]:
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1e3, latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1e3
+
+
+def calibrate_dense(client, args, query_vectors: np.ndarray, ids: np.ndarray, vectors: np.ndarray) -> list[dict]:
+    profile = get_dense_profile(args.dense_profile)
+    encoded = profile.encode(query_vectors)
+    if args.metric == "COSINE":
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    # 真值用编码后再解码的查询向量 (截断/半精度) 与 Milvus 实际比较的数据一致
+    scores = profile.decode(encoded) @ vectors.T
+    truth = [set(ids[np.argsort(-row)[:args.k]].tolist()) for row in scores]
+
+    points = []
+    for ef in sorted(e for e in args.efs if e >= args.k):   # HNSW 要求 ef >= limit
+        latencies, recalls = [], []
+        search_params = {"params": profile.dense_param({"ef": ef})}
+        for vector, expected in zip(encoded, truth):
+            start = time.perf_counter()
+            hits = client.search(collection_name=args.collection, data=[vector], anns_field=args.dense_field,
+                                 search_params=search_params, limit=args.k)[0]
+            latencies.append(time.perf_counter() - start)
+            recalls.append(len({hit["id"] for hit in hits} & expected) / args.k)
+        p50, p95 = summarize(latencies)
+        points.append({"ef": ef, "recall": float(np.mean(recalls)), "p50_ms": p50, "p95_ms": p95})
+        print(f"dense  ef={ef:<6} recall@{args.k}={points[-1]['recall']:.4f} p50={p50:.1f}ms p95={p95:.1f}ms")
+    return points
+
+
+def calibrate_sparse(client, args, queries: list[str]) -> list[dict]:
+    def search(query: str, drop_ratio: float):
+        return client.search(collection_name=args.collection, data=[query], anns_field=args.sparse_field,
+                             search_params={"params": {"drop_ratio_search": drop_ratio}}, limit=args.k)[0]
+
+    truth = [{hit["id"] for hit in search(q, 0.0)} for q in queries]
+    points = []
+    for drop_ratio in sorted(args.drop_ratios):
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = search(query, drop_ratio)
+            latencies.append(time.perf_counter() - start)
+            if expected:
+                recalls.append(len({hit["id"] for hit in hits} & expected) / len(expected))
+        p50, p95 = summarize(latencies)
+        points.append({"drop_ratio_search": drop_ratio, "recall": float(np.mean(recalls)) if recalls else 1.0,
+                       "p50_ms": p50, "p95_ms": p95})
+        print(f"sparse drop_ratio_search={drop_ratio:<4} recall@{args.k}={points[-1]['recall']:.4f} "
+              f"p50={p50:.1f}ms p95={p95:.1f}ms")
+    return points
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="标定 ef / drop_ratio_search 的召回率和延迟")
+    arg_parser.add_argument("--uri", default=MILVUS_URI)
+    arg_parser.add_argument("--collection", default=COLLECTION_NAME)
+    arg_parser.add_argument("--pk-field", default="id", help="langchain Milvus 创建的集合主键为 pk")
+    arg_parser.add_argument("--dense-field", default="dense")
+    arg_parser.add_argument("--sparse-field", default="sparse")
+    arg_parser.add_argument("--text-field", default="text")
+    arg_parser.add_argument("--metric", default="IP", choices=["IP", "COSINE"])
+    arg_parser.add_argument("--dense-profile", default=None, choices=list(DENSE_PROFILES),
+                            help="集合 dense 字段的方案 (documents/dense_profile.py), 默认 fp32_hnsw")
+    arg_parser.add_argument("--k", type=int, default=10)
+    arg_parser.add_argument("--queries", type=int, default=200)
+    arg_parser.add_argument("--query-file", default=None)
+    arg_parser.add_argument("--max-rows", type=int, default=200_000, help="读入内存计算真值的最大行数")
+    arg_parser.add_argument("--efs", nargs="+", type=int, default=[16, 32, 64, 128, 256, 512])
+    arg_parser.add_argument("--drop-ratios", nargs="+", type=float, default=[0.0, 0.1, 0.2, 0.3, 0.5])
+    arg_parser.add_argument("--output", default=None, help="默认写到 cache/search_params_<集合名>.json")
+    args = arg_parser.parse_args()
+
+    client = get_milvus_client(args.uri)
+    client.load_collection(args.collection)
+    ids, vectors, titles = load_corpus(client, args.collection, args.pk_field, args.dense_field, args.text_field,
+                                       args.max_rows, args.dense_profile)
+    print(f"读入 {len(ids)} 行 维度 {vectors.shape[1]}")
+
+    if args.query_file:
+        with open(args.query_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()][:args.queries]
+    else:
+        random.seed(0)
+        queries = random.sample(titles, min(args.queries, len(titles)))
+    query_vectors = np.asarray(cached_query_embeddings(openai_embedding).embed_queries(queries), dtype=np.float32)
+
+    result = {
+        "collection": args.collection,
+        "k": args.k,
+        "rows": len(ids),
+        "queries": len(queries),
+        "dense_profile": get_dense_profile(args.dense_profile).name,
+        "dense": calibrate_dense(client, args, query_vectors, ids, vectors),
+        "sparse": calibrate_sparse(client, args, queries),
+    }
+    output = args.output or calibration_path(args.collection)
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"标定结果已写入 {output}")
@@ -1,7 +1,7 @@
-from pymilvus import MilvusClient
-from env_utils import COLLECTION_NAME, MILVUS_URI
+from env_utils import COLLECTION_NAME
+from utils.milvus_connection import get_milvus_client
 
-client = MilvusClient(uri=MILVUS_URI)
+client = get_milvus_client()
 if client.has_collection(COLLECTION_NAME):
     schema = client.describe_collection(COLLECTION_NAME)
     print('集合 schema 信息:')
@@ -0,0 +1,184 @@
+import sys
+import os
+import time
+import json
+import uuid
+import threading
+from typing import Any, List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from env_utils import COLLECTION_NAME
+from utils.log_utils import log
+
+# 获得当前项目的绝对路径
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cache_dir = os.path.join(root_dir, "cache")  # 存放缓存文件目录的绝对路径
+
+
+def collection_version_path(collection_name: str = COLLECTION_NAME) -> str:
+    return os.path.join(cache_dir, f"collection_version_{collection_name}.txt")
+
+
+def bump_collection_version(collection_name: str = COLLECTION_NAME) -> str:
+    """集合数据发生变化(重新导入/增量导入)后调用 写入一个新的版本号, 让所有答案缓存失效"""
+    os.makedirs(cache_dir, exist_ok=True)
+    version = f"{time.time():.6f}-{uuid.uuid4().hex[:8]}"
+    with open(collection_version_path(collection_name), "w", encoding="utf-8") as f:
+        f.write(version)
+    return version
+
+
+def read_collection_version(collection_name: str = COLLECTION_NAME) -> Optional[str]:
+    path = collection_version_path(collection_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+# 决定检索结果的检索器属性 不同取值检索到的文档不同, 答案不能互相复用
+SCOPE_ATTRIBUTES = ("collection_name", "expr", "k", "partition_key", "partition_names", "output_fields")
+
+
+def retrieval_scope(retrieval: Any, **search_kwargs) -> str:
+    """
+    检索范围的 key: 检索器类型 + 集合 / 过滤条件 / 分区 / k + 本次检索的参数 (expr, partition_values, k ...)
+    同一个问题在不同范围内检索 (例如限定不同的文件) 不能命中对方的答案
+    """
+    scope = {"retriever": type(retrieval).__name__}
+    for name in SCOPE_ATTRIBUTES:
+        value = getattr(retrieval, name, None)
+        if value is not None:
+            scope[name] = value
+    scope.update({k: v for k, v in search_kwargs.items() if v is not None})
+    return json.dumps(scope, ensure_ascii=False, sort_keys=True, default=str)
+
+
+class SemanticAnswerCache:
+    """
+    RagChain 的语义答案缓存
+    以问题的向量为 key, 新问题与某个已回答问题的余弦相似度超过阈值时直接返回缓存的答案和检索到的文档, 不再调用 llm
+    只在检索范围 (retrieval_scope) 相同的答案中查找
+    向量保存在内存中的 NumPy 矩阵里(已归一化), 一次矩阵乘法完成查找
+    """
+
+    def __init__(self, embeddings: Embeddings, threshold: float = 0.95, ttl_seconds: Optional[float] = 3600,
+                 max_entries: int = 2000, collection_name: str = COLLECTION_NAME, version_check_interval: float = 1.0):
+        """
+        :param embeddings: 计算问题向量的 embedding 对象 建议与检索器共用带查询缓存的 embedding, 避免重复计算
+        :param threshold: 命中所需的最小余弦相似度
+        :param ttl_seconds: 答案的有效期 None 表示永不过期
+        :param max_entries: 最多缓存的答案数 超出时淘汰最早写入的
+        :param collection_name: 检索的集合 集合版本号变化(重新导入)后缓存全部失效
+        :param version_check_interval: 检查集合版本文件的最小间隔 秒 lookup / store 在异步请求中调用, 不能每次都读文件
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.collection_name = collection_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None   # (n, dim) 归一化后的问题向量
+        self._entries: List[dict] = []               # 与 _vectors 的行一一对应
+        self.version_check_interval = version_check_interval
+        self._version_path = collection_version_path(collection_name)
+        self._version_mtime = self._mtime()
+        self._version_checked_at = time.monotonic()
+        self._version = read_collection_version(collection_name)
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def invalidate(self):
+        """清空所有缓存的答案"""
+        with self._lock:
+            self._vectors = None
+            self._entries = []
+        log.info("答案缓存已清空")
+
+    def _mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self._version_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_version(self):
+        """版本文件的修改时间变化后才重新读取 两次检查至少间隔 version_check_interval 秒"""
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        mtime = self._mtime()
+        if mtime == self._version_mtime:
+            return
+        self._version_mtime = mtime
+        version = read_collection_version(self.collection_name)
+        if version != self._version:
+            log.info(f"集合 {self.collection_name} 已重新导入 (版本 {self._version} -> {version}), 答案缓存失效")
+            self._version = version
+            self.invalidate()
+
+    def _drop(self, keep: np.ndarray):
+        """只保留 keep 为 True 的行"""
+        self._vectors = self._vectors[keep] if keep.any() else None
+        self._entries = [e for e, k in zip(self._entries, keep) if k]
+
+    def lookup(self, question: str, vector: Optional[List[float]] = None, scope: str = "") -> Optional[dict]:
+        """
+        查找语义相近的已回答问题
+        :param question: 问题
+        :param vector: 问题的向量 不传则用 embeddings 计算
+        :param scope: 检索范围 只匹配 store 时范围相同的答案
+        :return: 命中时返回 {"question", "answer", "docs", "similarity"}, 否则返回 None
+        """
+        self._check_version()
+        query = self._normalize(vector if vector is not None else self.embeddings.embed_query(question))
+        with self._lock:
+            if self._vectors is not None and self.ttl_seconds is not None:
+                now = time.time()
+                alive = np.array([now - e["created"] < self.ttl_seconds for e in self._entries])
+                if not alive.all():
+                    self._drop(alive)
+            if self._vectors is None:
+                self.misses += 1
+                return None
+            similarities = self._vectors @ query
+            same_scope = np.array([e["scope"] == scope for e in self._entries])
+            similarities = np.where(same_scope, similarities, -np.inf)
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry = self._entries[best]
+        return {"question": entry["question"], "answer": entry["answer"], "docs": entry["docs"], "similarity": similarity}
+
+    def store(self, question: str, answer: str, docs: List[Document], vector: Optional[List[float]] = None,
+              scope: str = ""):
+        """缓存一个问题的答案和检索到的文档 scope 为检索时的 retrieval_scope"""
+        self._check_version()
+        row = self._normalize(vector if vector is not None else self.embeddings.embed_query(question))[None, :]
+        with self._lock:
+            self._vectors = row if self._vectors is None else np.vstack([self._vectors, row])
+            self._entries.append({"question": question, "answer": answer, "docs": docs, "scope": scope,
+                                  "created": time.time()})
+            if len(self._entries) > self.max_entries:
+                keep = np.ones(len(self._entries), dtype=bool)
+                keep[:len(self._entries) - self.max_entries] = False
+                self._drop(keep)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0, "size": len(self._entries)}
@@ -0,0 +1,203 @@
+import sys
+import os
+import re
+import copy
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import numpy as np
+
+"""
+切片策略 MarkdownParser.text_chunker 对超过阈值的标题段落调用这里的策略继续切分
+- recursive: 按结构/句子边界递归切分, 不需要任何网络请求
+- semantic:  与 SemanticChunker 相同的算法(句子窗口 embedding + 相邻窗口余弦距离的百分位断点),
+             但会把一批文档的所有句子窗口合并成尽量大的批次并发请求 embedding, 断点在本地用 NumPy 计算
+- hybrid:    先按结构边界切分, 只有切完之后仍然超长(没有结构边界可用)的片段才交给 semantic
+
+semantic / hybrid 切分后仍然超过 max_chars 的片段(断点太少)再按句子边界递归切分, 保证不超过 text 字段的长度
+semantic 使用的 embeddings 建议是 CachedEmbeddings: 句子窗口向量写入磁盘缓存, 同一个文件重新导入时不必再次请求
+(切片由多个句子拼成, 与窗口的文本不同, 写入阶段切片的稠密向量仍需单独计算)
+"""
+
+CHUNK_STRATEGIES = ("recursive", "semantic", "hybrid")
+
+# merge_title_content 用 '->' 连接标题下的各个元素, 是最可靠的结构边界; 其次是段落/换行, 最后才是句子
+STRUCTURE_SEPARATORS = ["->", "\n\n", "\n"]
+SENTENCE_SEPARATORS = ["。", "！", "？", "；", ". ", "! ", "? ", "; ", "，", ", ", " ", ""]
+
+
+# 英文句号后需要有空白才算句子结束(避免切开小数), 中文句末标点直接切
+SENTENCE_SPLIT_REGEX = r"(?<=[.?!])\s+|(?<=[。！？])"
+
+
+class ChunkStrategy(ABC):
+    """切片策略的基类 子类实现 split_documents; 需要在文档之间合并请求的子类同时重写 split_batch"""
+
+    def split_batch(self, documents: List[Document]) -> List[List[Document]]:
+        """
+        切分一批文档 返回与输入一一对应的切片列表
+        """
+        return [self.split_documents([d]) for d in documents]
+
+    @abstractmethod
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """切分文档 返回所有切片"""
+
+
+class RecursiveChunkStrategy(ChunkStrategy):
+    """按结构和句子边界递归切分 不调用 embedding"""
+
+    def __init__(self, chunk_size: int = 2000, chunk_overlap: int = 100):
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            separators=STRUCTURE_SEPARATORS + SENTENCE_SEPARATORS,
+        )
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        return self.splitter.split_documents(documents)
+
+
+class SemanticChunkStrategy(ChunkStrategy):
+    """
+    批量语义切分
+    1. 每篇文档切成句子, 每个句子与前后 buffer_size 个句子拼成一个窗口
+    2. 所有文档的窗口去重后按 embed_batch_size 分批, 并发调用 embed_documents
+    3. 每篇文档在本地计算相邻窗口的余弦距离, 距离超过 breakpoint_percentile 百分位的位置作为断点
+    4. 超过 max_chars 的切片按句子边界递归切分
+    """
+
+    def __init__(self, embeddings: Embeddings, breakpoint_percentile: float = 95.0, buffer_size: int = 1,
+                 embed_batch_size: int = 64, max_workers: int = 4, sentence_split_regex: str = SENTENCE_SPLIT_REGEX,
+                 max_chars: Optional[int] = None):
+        """
+        :param embeddings: embedding 对象
+        :param breakpoint_percentile: 断点阈值的百分位 与 SemanticChunker 的 percentile 模式默认值相同
+        :param buffer_size: 窗口中当前句子前后各拼接几个句子
+        :param embed_batch_size: 每次 embed_documents 请求的最大文本数
+        :param max_workers: 并发请求数
+        :param sentence_split_regex: 切分句子的正则
+        :param max_chars: 切片的最大字符数 None 表示不限制
+        """
+        self.embeddings = embeddings
+        self.breakpoint_percentile = breakpoint_percentile
+        self.buffer_size = buffer_size
+        self.embed_batch_size = embed_batch_size
+        self.max_workers = max_workers
+        self.sentence_split_regex = sentence_split_regex
+        self.max_chars = max_chars
+        self.fallback = RecursiveChunkStrategy(chunk_size=max_chars, chunk_overlap=0) if max_chars else None
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        return [chunk for chunks in self.split_batch(documents) for chunk in chunks]
+
+    def _sentences(self, text: str) -> List[str]:
+        return [s.strip() for s in re.split(self.sentence_split_regex, text) if s and s.strip()]
+
+    def _windows(self, sentences: List[str]) -> List[str]:
+        b = self.buffer_size
+        return [" ".join(sentences[max(0, i - b): i + b + 1]) for i in range(len(sentences))]
+
+    def _embed_all(self, texts: List[str]) -> dict:
+        """把所有窗口按最大批次切分后并发请求 返回 文本 -> 向量"""
+        unique = list(dict.fromkeys(texts))
+        batches = [unique[i:i + self.embed_batch_size] for i in range(0, len(unique), self.embed_batch_size)]
+        vectors = {}
+        if not batches:
+            return vectors
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            for batch, batch_vectors in zip(batches, executor.map(self.embeddings.embed_documents, batches)):
+                vectors.update(zip(batch, batch_vectors))
+        return vectors
+
+    def _limit(self, chunk: Document) -> List[Document]:
+        """超过 max_chars 的切片按句子边界继续切分"""
+        if self.fallback is not None and len(chunk.page_content) > self.max_chars:
+            return self.fallback.split_documents([chunk])
+        return [chunk]
+
+    def _breakpoints(self, embeddings: np.ndarray) -> List[int]:
+        """相邻窗口的余弦距离超过百分位阈值的位置"""
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        normalized = embeddings / np.where(norms == 0, 1, norms)
+        distances = 1.0 - np.sum(normalized[:-1] * normalized[1:], axis=1)
+        threshold = np.percentile(distances, self.breakpoint_percentile)
+        return np.nonzero(distances > threshold)[0].tolist()
+
+    def split_batch(self, documents: List[Document]) -> List[List[Document]]:
+        sentences_per_doc = [self._sentences(d.page_content) for d in documents]
+        windows_per_doc = [self._windows(s) if len(s) > 1 else [] for s in sentences_per_doc]
+        vectors = self._embed_all([w for windows in windows_per_doc for w in windows])
+
+        results = []
+        for document, sentences, windows in zip(documents, sentences_per_doc, windows_per_doc):
+            if len(sentences) <= 1:   # 只有一个句子 无法按语义切分
+                results.append(self._limit(document))
+                continue
+            breakpoints = self._breakpoints(np.array([vectors[w] for w in windows], dtype=np.float32))
+            chunks = []
+            start = 0
+            for index in breakpoints + [len(sentences) - 1]:
+                if index < start:
+                    continue
+                chunks.extend(self._limit(Document(page_content=" ".join(sentences[start:index + 1]),
+                                                   metadata=copy.deepcopy(document.metadata))))
+                start = index + 1
+            results.append(chunks)
+        return results
+
+
+class HybridChunkStrategy(ChunkStrategy):
+    """
+    先按结构边界切分到 max_chars 以内; 仍然超长的片段说明内部没有结构边界(例如一整段长文),
+    只有这些片段才调用语义切分, 语义切分后依旧超长的再按句子兜底切分
+    """
+
+    def __init__(self, embeddings: Embeddings, max_chars: int = 5000):
+        self.max_chars = max_chars
+        self.structure_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=max_chars, chunk_overlap=0, separators=STRUCTURE_SEPARATORS,
+        )
+        self.semantic = SemanticChunkStrategy(embeddings, max_chars=max_chars)
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        return [chunk for chunks in self.split_batch(documents) for chunk in chunks]
+
+    def split_batch(self, documents: List[Document]) -> List[List[Document]]:
+        # 先按结构切分, 记录下所有仍然超长的片段, 最后一次性交给语义切分 (句子 embedding 跨文档合批)
+        results = []
+        ambiguous = []   # (结果下标, 片段下标, 片段)
+        for document in documents:
+            pieces = self.structure_splitter.split_documents([document])
+            for piece_index, piece in enumerate(pieces):
+                if len(piece.page_content) > self.max_chars:
+                    ambiguous.append((len(results), piece_index, piece))
+            results.append([[piece] for piece in pieces])
+
+        semantic_results = self.semantic.split_batch([piece for _, _, piece in ambiguous])
+        for (doc_index, piece_index, _), semantic_pieces in zip(ambiguous, semantic_results):
+            results[doc_index][piece_index] = semantic_pieces
+        return [[chunk for chunks in pieces for chunk in chunks] for pieces in results]
+
+
+def create_chunk_strategy(name: str, embeddings: Embeddings, max_chars: int = 5000) -> ChunkStrategy:
+    """
+    根据名称创建切片策略
+    :param name: recursive / semantic / hybrid
+    :param embeddings: 语义切分使用的 embedding 对象
+    :param max_chars: 切片的最大字符数
+    """
+    if name == "recursive":
+        return RecursiveChunkStrategy(chunk_size=max_chars)
+    if name == "semantic":
+        return SemanticChunkStrategy(embeddings, max_chars=max_chars)
+    if name == "hybrid":
+        return HybridChunkStrategy(embeddings, max_chars=max_chars)
+    raise ValueError(f"不支持的切片策略: {name}, 可选值: {CHUNK_STRATEGIES}")
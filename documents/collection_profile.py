@@ -0,0 +1,494 @@
+import sys
+import os
+import copy
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from env_utils import COLLECTION_NAME
+from utils.log_utils import log
+from utils.milvus_connection import milvus_manager
+from documents.dense_profile import DenseProfile, get_dense_profile
+
+"""
+声明式的集合 profile: 字段 / 分词器 / BM25 参数 / 向量索引参数 / 分区 集中在一处描述, 由 ensure_collection 创建或校验集合
+- 内置 profile 见 BUILTIN_PROFILES, 与原来各脚本中手写的 schema 一致
+- 部署时可以在 config/collection_profiles/<name>.yaml (或 .json) 中覆盖任意部分, 不需要改代码;
+  文件内容与内置 profile 深度合并, 例如只调大 HNSW 的 efConstruction:
+    indexes:
+      - field_name: dense
+        params: {M: 32, efConstruction: 200}
+- YAML 需要安装 pyyaml, JSON 不需要额外依赖
+profile 格式:
+    collection_name: 集合名 不写时使用 env_utils.COLLECTION_NAME
+    auto_id / enable_dynamic_field: 与 create_schema 的同名参数一致
+    fields: [{name, type, is_primary, max_length, dim, analyzer_params, ...}]   type 为 DataType 的名称
+    dense_profile: dense 字段的方案名 (documents/dense_profile.py) 决定 dense_field 的类型/维度/索引
+    bm25: {input_field, output_field, k1, b, inverted_index_algo, client_side}
+          client_side 为 true 时不定义 BM25 Function, 稀疏索引的度量为 IP (utils/sparse_encoder.py)
+    indexes: 其余字段的索引 [{field_name, index_name, index_type, metric_type, params}]
+    partition: {key_field, num_partitions, isolation}   分区键 (VARCHAR / INT64 标量字段, 例如 source / 租户 / 部门)
+               Milvus 按键的哈希把数据分到 num_partitions 个分区, 过滤条件中有 key == / key in 时只检索命中的分区;
+               isolation 为 true 时每个分区单独建向量索引, 检索只访问一个分区, 此时过滤条件只能用 key == 单个值;
+               同时自动为分区键建 INVERTED 标量索引, 按文件删除 / 过滤不需要扫描全表
+分区键在建集合时确定, 之后不能修改 (需要重建集合并重新导入)
+"""
+
+# 获得当前项目的绝对路径
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROFILE_DIR = os.path.join(root_dir, "config", "collection_profiles")
+PARTITION_KEY_TYPES = ("VARCHAR", "INT64")
+DEFAULT_NUM_PARTITIONS = 64
+
+_RAG_SCALARS = [
+    {"name": "category", "type": "VARCHAR", "max_length": 1000},
+    {"name": "source", "type": "VARCHAR", "max_length": 1000},
+    {"name": "category_depth", "type": "INT64"},
+    {"name": "filename", "type": "VARCHAR", "max_length": 1000},
+    {"name": "filetype", "type": "VARCHAR", "max_length": 1000},
+    {"name": "title", "type": "VARCHAR", "max_length": 1000},
+]
+
+BUILTIN_PROFILES: Dict[str, dict] = {
+    # MilvusVectorSave (milvus_db_with_schema.py) 与 write_milvus.py 使用的集合
+    "rag_chunks": {
+        "auto_id": True,
+        "fields": [
+            {"name": "id", "type": "INT64", "is_primary": True},
+            *_RAG_SCALARS,
+            # 语料是中文 需要开启 jieba 分词器
+            {"name": "text", "type": "VARCHAR", "max_length": 6000, "enable_analyzer": True,
+             "analyzer_params": {"tokenizer": "jieba"}},
+            {"name": "sparse", "type": "SPARSE_FLOAT_VECTOR"},
+        ],
+        "dense_profile": "fp32_hnsw",
+        "dense_field": "dense",
+        "bm25": {"input_field": "text", "output_field": "sparse", "k1": 1.2, "b": 0.75,
+                 "inverted_index_algo": "DAAT_MAXSCORE", "index_name": "sparse_inverted_index"},
+        # 增量导入按 source 删除旧 chunk, 标量索引避免每次删除都扫描全表
+        "indexes": [{"field_name": "source", "index_name": "source_index", "index_type": "INVERTED"}],
+        "partition": None,
+    },
+    # test_sparse_search.sparse_search 的全文检索示例
+    "fulltext_demo": {
+        "collection_name": "my_collection",
+        "auto_id": True,
+        "fields": [
+            {"name": "id", "type": "INT64", "is_primary": True},
+            {"name": "category", "type": "VARCHAR", "max_length": 1000},
+            {"name": "text", "type": "VARCHAR", "max_length": 6000, "enable_analyzer": True,
+             "analyzer_params": {"tokenizer": "jieba"}},
+            {"name": "sparse", "type": "SPARSE_FLOAT_VECTOR"},
+        ],
+        "dense_profile": None,
+        "bm25": {"input_field": "text", "output_field": "sparse", "k1": 1.2, "b": 0.75,
+                 "inverted_index_algo": "DAAT_MAXSCORE"},
+        "indexes": [],
+        "partition": None,
+    },
+    # test_hybrid_search 的多向量示例 (文本稠密 + 文本稀疏 + 图片稠密)
+    "hybrid_demo": {
+        "collection_name": "my_hybrid_collection",
+        "auto_id": False,
+        "fields": [
+            {"name": "id", "type": "INT64", "is_primary": True, "description": "product id"},
+            {"name": "text", "type": "VARCHAR", "max_length": 1000, "enable_analyzer": True,
+             "description": "raw text of product description"},
+            {"name": "text_dense", "type": "FLOAT_VECTOR", "dim": 1024, "description": "text dense embedding"},
+            {"name": "text_sparse", "type": "SPARSE_FLOAT_VECTOR",
+             "description": "text sparse embedding auto-generated by the built-in BM25 function"},
+            {"name": "image_dense", "type": "FLOAT_VECTOR", "dim": 512, "description": "image dense embedding"},
+        ],
+        "dense_profile": None,
+        "bm25": {"input_field": "text", "output_field": "text_sparse", "inverted_index_algo": "DAAT_MAXSCORE",
+                 "index_name": "text_sparse_index"},
+        "indexes": [
+            {"field_name": "text_dense", "index_name": "text_dense_index", "index_type": "AUTOINDEX", "metric_type": "IP"},
+            {"field_name": "image_dense", "index_name": "image_dense_index", "index_type": "AUTOINDEX", "metric_type": "IP"},
+        ],
+        "partition": None,
+    },
+}
+
+
+class ProfileMismatchError(ValueError):
+    """已存在的集合与 profile 不一致"""
+
+
+def _deep_merge(base: dict, override: dict) -> dict:
+    """字典递归合并; indexes / fields 这类列表按 field_name / name 对齐后合并, 其他列表直接替换"""
+    result = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = _deep_merge(result[key], value)
+        elif key in ("fields", "indexes") and isinstance(value, list) and isinstance(result.get(key), list):
+            name_key = "name" if key == "fields" else "field_name"
+            merged = {item[name_key]: item for item in result[key]}
+            for item in value:
+                merged[item[name_key]] = _deep_merge(merged.get(item[name_key], {}), item)
+            result[key] = list(merged.values())
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+
+def _read_profile_file(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml   # 可选依赖 只有使用 YAML 配置时才需要
+            return yaml.safe_load(f) or {}
+        return json.load(f)
+
+
+@dataclass
+class CollectionProfile:
+    name: str
+    fields: List[dict]
+    collection_name: str = COLLECTION_NAME
+    auto_id: bool = False
+    enable_dynamic_field: bool = False
+    dense_profile: Union[str, DenseProfile, None] = None
+    dense_field: str = "dense"
+    bm25: Optional[dict] = None
+    indexes: List[dict] = field(default_factory=list)
+    partition: Optional[dict] = None
+
+    @classmethod
+    def from_dict(cls, name: str, data: dict) -> "CollectionProfile":
+        known = set(cls.__dataclass_fields__) - {"name"}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"collection profile {name} 中有未知的配置项: {sorted(unknown)}")
+        data = {k: v for k, v in data.items() if v is not None or k in ("dense_profile", "bm25", "partition")}
+        profile = cls(name=name, **data)
+        profile.check()
+        return profile
+
+    def to_dict(self) -> dict:
+        return {k: copy.deepcopy(getattr(self, k)) for k in self.__dataclass_fields__ if k != "name"}
+
+    def check(self):
+        """profile 自身的一致性检查"""
+        names = [f["name"] for f in self.all_fields()]
+        if len(names) != len(set(names)):
+            raise ValueError(f"collection profile {self.name} 中有重复的字段名: {names}")
+        if sum(1 for f in self.fields if f.get("is_primary")) != 1:
+            raise ValueError(f"collection profile {self.name} 需要且只能有一个主键字段")
+        if self.bm25:
+            for key in ("input_field", "output_field"):
+                if self.bm25[key] not in names:
+                    raise ValueError(f"collection profile {self.name} 的 bm25.{key} 字段 {self.bm25[key]} 不存在")
+        for index in self.indexes:
+            if index["field_name"] not in names:
+                raise ValueError(f"collection profile {self.name} 的索引字段 {index['field_name']} 不存在")
+        if self.partition:
+            key_field = next((f for f in self.fields if f["name"] == self.partition.get("key_field")), None)
+            if key_field is None:
+                raise ValueError(f"collection profile {self.name} 的分区键字段 {self.partition.get('key_field')} 不存在")
+            if key_field["type"] not in PARTITION_KEY_TYPES or key_field.get("is_primary"):
+                raise ValueError(f"collection profile {self.name} 的分区键 {key_field['name']} 必须是非主键的 "
+                                 f"{' / '.join(PARTITION_KEY_TYPES)} 字段")
+
+    # ---- 变体 ----
+    def override(self, **changes) -> "CollectionProfile":
+        """返回合并了 changes 的新 profile 例如 override(dense_profile="fp16_hnsw")"""
+        return CollectionProfile.from_dict(self.name, _deep_merge(self.to_dict(), changes))
+
+    def with_client_sparse(self) -> "CollectionProfile":
+        """稀疏向量由客户端计算: 文本字段不再需要分词器"""
+        if not self.bm25:
+            return self
+        text_field = self.bm25["input_field"]
+        fields = [{k: v for k, v in f.items() if f["name"] != text_field or k not in ("enable_analyzer", "analyzer_params")}
+                  for f in self.fields]
+        profile = self.override(bm25={"client_side": True})
+        profile.fields = fields
+        return profile
+
+    def with_partition_key(self, key_field: str, num_partitions: int = DEFAULT_NUM_PARTITIONS,
+                           isolation: bool = False) -> "CollectionProfile":
+        """按 key_field 分区 例如 with_partition_key("source") 后按文件检索和删除只访问对应的分区"""
+        return self.override(partition={"key_field": key_field, "num_partitions": num_partitions,
+                                        "isolation": isolation})
+
+    # ---- 派生信息 ----
+    @property
+    def partition_key(self) -> Optional[str]:
+        return self.partition["key_field"] if self.partition else None
+
+    @property
+    def client_side_bm25(self) -> bool:
+        return bool(self.bm25 and self.bm25.get("client_side"))
+
+    def dense(self) -> Optional[DenseProfile]:
+        return get_dense_profile(self.dense_profile) if self.dense_profile else None
+
+    def all_fields(self) -> List[dict]:
+        """声明的字段 + dense_profile 决定的 dense 字段"""
+        fields = [dict(f) for f in self.fields]
+        dense = self.dense()
+        if dense is not None:
+            fields.append({"name": self.dense_field, "type": dense.vector_type, "dim": dense.dim})
+        if self.partition:
+            for f in fields:
+                if f["name"] == self.partition["key_field"]:
+                    f["is_partition_key"] = True
+        return fields
+
+    def all_indexes(self) -> List[dict]:
+        """稀疏 / dense / 其他字段的索引参数 格式与 index_params.add_index 的参数一致"""
+        indexes = []
+        if self.bm25:
+            bm25 = self.bm25
+            if self.client_side_bm25:
+                metric, params = "IP", {"inverted_index_algo": bm25.get("inverted_index_algo", "DAAT_MAXSCORE")}
+            else:
+                metric = "BM25"
+                params = {"inverted_index_algo": bm25.get("inverted_index_algo", "DAAT_MAXSCORE")}
+                if "k1" in bm25:
+                    params["bm25_k1"] = bm25["k1"]   # 数值越高，专业术语词频在文档排名中的重要性越大。取值范围：[1.2, 2.0]。
+                if "b" in bm25:
+                    params["bm25_b"] = bm25["b"]
+            indexes.append({"field_name": bm25["output_field"],
+                            "index_name": bm25.get("index_name", f"{bm25['output_field']}_index"),
+                            "index_type": "SPARSE_INVERTED_INDEX", "metric_type": metric, "params": params})
+        dense = self.dense()
+        if dense is not None:
+            indexes.append({"field_name": self.dense_field, "index_name": "dense_vector_index",
+                            "index_type": dense.index_type, "metric_type": dense.metric_type,
+                            "params": dict(dense.index_params)})
+        if self.partition_key:
+            indexes.append({"field_name": self.partition_key, "index_name": f"{self.partition_key}_index",
+                            "index_type": "INVERTED"})
+        # indexes 中显式写出的同名字段索引覆盖上面的默认值
+        explicit = {index["field_name"]: index for index in self.indexes}
+        indexes = [_deep_merge(index, explicit.pop(index["field_name"])) if index["field_name"] in explicit else index
+                   for index in indexes]
+        return indexes + [dict(index) for index in explicit.values()]
+
+    def route(self, values: Optional[list] = None, expr: Optional[str] = None) -> Optional[str]:
+        """把分区键的取值和其他过滤条件合成一个表达式 Milvus 据此只检索命中的分区"""
+        if not values:
+            return expr
+        if not self.partition_key:
+            raise ValueError(f"collection profile {self.name} 没有配置分区键")
+        return and_filters(key_filter(self.partition_key, values), expr)
+
+    def langchain_index_params(self, vector_fields: Optional[List[str]] = None) -> List[dict]:
+        """langchain_milvus.Milvus 的 index_params 与 vector_field 一一对应"""
+        indexes = {index["field_name"]: index for index in self.all_indexes()}
+        vector_fields = vector_fields or list(indexes)
+        return [indexes[name] for name in vector_fields]
+
+    # ---- 构建 ----
+    def build_schema(self, client):
+        from pymilvus import DataType, Function, FunctionType
+        schema = client.create_schema(auto_id=self.auto_id, enable_dynamic_field=self.enable_dynamic_field)
+        for f in self.all_fields():
+            kwargs = {k: v for k, v in f.items() if k not in ("name", "type")}
+            schema.add_field(f["name"], DataType[f["type"]], **kwargs)
+        if self.bm25 and not self.client_side_bm25:
+            # bm25 Function 把文本字段转化为稀疏向量字段 用于全文检索
+            schema.add_function(Function(
+                name=self.bm25.get("function_name", f"{self.bm25['input_field']}_bm25_emb"),
+                input_field_names=[self.bm25["input_field"]],
+                output_field_names=[self.bm25["output_field"]],
+                function_type=FunctionType.BM25,
+            ))
+        return schema
+
+    def build_index_params(self, client):
+        index_params = client.prepare_index_params()
+        for index in self.all_indexes():
+            index_params.add_index(**index)
+        return index_params
+
+
+def quote_filter_value(value) -> str:
+    """过滤表达式中的常量 字符串中的反斜杠和引号需要转义"""
+    if isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+    return str(value)
+
+
+def key_filter(field_name: str, values: list) -> str:
+    """field == value 或 field in [...] 单个值时用 ==, 分区键隔离 (partitionkey.isolation) 只支持这种写法"""
+    values = list(dict.fromkeys(values))
+    if len(values) == 1:
+        return f"{field_name} == {quote_filter_value(values[0])}"
+    return f"{field_name} in [{', '.join(quote_filter_value(v) for v in values)}]"
+
+
+def and_filters(*exprs: Optional[str]) -> Optional[str]:
+    """用 && 连接多个过滤条件 空条件忽略"""
+    parts = [expr for expr in exprs if expr and expr.strip()]
+    if len(parts) <= 1:
+        return parts[0] if parts else None
+    return " && ".join(f"({expr})" for expr in parts)
+
+
+def load_profile(name: str = "rag_chunks", path: Optional[str] = None, **changes) -> CollectionProfile:
+    """
+    加载 collection profile
+    :param name: 内置 profile 名称, 或者配置文件路径 (.yaml / .yml / .json)
+    :param path: 部署覆盖文件 默认查找 config/collection_profiles/<name>.yaml|.yml|.json
+    :param changes: 代码中的额外覆盖 优先级最高
+    """
+    if name.endswith((".yaml", ".yml", ".json")):
+        data = _read_profile_file(name)
+        name = os.path.splitext(os.path.basename(name))[0]
+        data = _deep_merge(BUILTIN_PROFILES.get(data.pop("extends", ""), {}), data)
+    elif name in BUILTIN_PROFILES:
+        data = BUILTIN_PROFILES[name]
+    else:
+        raise ValueError(f"未知的 collection profile: {name}, 内置: {list(BUILTIN_PROFILES)}")
+
+    candidates = [path] if path else [os.path.join(PROFILE_DIR, f"{name}{ext}") for ext in (".yaml", ".yml", ".json")]
+    for candidate in candidates:
+        if candidate and os.path.exists(candidate):
+            data = _deep_merge(data, _read_profile_file(candidate))
+            log.info(f"collection profile {name} 已合并部署配置 {candidate}")
+            break
+    if changes:
+        data = _deep_merge(data, changes)
+    return CollectionProfile.from_dict(name, data)
+
+
+def _normalize_field(f: dict) -> dict:
+    """describe_collection 返回的字段 (pymilvus 把 dim / max_length 放在 params 中, 类型为枚举) 统一成 profile 的格式"""
+    merged = {**(f.get("params") or {}), **f}
+    result = {"name": merged["name"], "type": str(getattr(merged["type"], "name", merged["type"])).upper()}
+    for key in ("dim", "max_length"):
+        if merged.get(key) is not None:
+            result[key] = int(merged[key])
+    result["is_partition_key"] = bool(merged.get("is_partition_key"))
+    return result
+
+
+def validate_collection(client, profile: CollectionProfile, collection_name: Optional[str] = None) -> List[str]:
+    """比较已存在的集合与 profile 返回不一致之处 (字段名/类型/维度/长度, BM25 Function) 空列表表示一致"""
+    name = collection_name or profile.collection_name
+    description = client.describe_collection(collection_name=name)
+    actual = {f["name"]: _normalize_field(f) for f in description.get("fields", [])}
+    problems = []
+    for expected in profile.all_fields():
+        found = actual.get(expected["name"])
+        if found is None:
+            problems.append(f"缺少字段 {expected['name']}")
+            continue
+        if found["type"] != expected["type"]:
+            problems.append(f"字段 {expected['name']} 类型为 {found['type']}, profile 为 {expected['type']}")
+        for key in ("dim", "max_length"):
+            if key in expected and found.get(key) != expected[key]:
+                problems.append(f"字段 {expected['name']} 的 {key} 为 {found.get(key)}, profile 为 {expected[key]}")
+        if found["is_partition_key"] != bool(expected.get("is_partition_key")):
+            problems.append(f"字段 {expected['name']} 的分区键设置为 {found['is_partition_key']}, "
+                            f"profile 为 {bool(expected.get('is_partition_key'))}")
+    extra = set(actual) - {f["name"] for f in profile.all_fields()}
+    if extra:
+        problems.append(f"集合中有 profile 未声明的字段 {sorted(extra)}")
+    has_bm25_function = any(str(getattr(fn.get("type"), "name", fn.get("type"))).upper() == "BM25"
+                            for fn in description.get("functions", []) or [])
+    if bool(profile.bm25) and not profile.client_side_bm25 and not has_bm25_function:
+        problems.append("profile 使用服务端 BM25 Function, 集合中没有")
+    if profile.client_side_bm25 and has_bm25_function:
+        problems.append("profile 为客户端 BM25, 集合中定义了 BM25 Function")
+    return problems
+
+
+def drop_collection(client, profile: CollectionProfile, collection_name: Optional[str] = None):
+    """释放并删除集合及其索引"""
+    name = collection_name or profile.collection_name
+    if not client.has_collection(name):
+        return
+    client.release_collection(collection_name=name)
+    for index in profile.all_indexes():
+        try:
+            client.drop_index(collection_name=name, index_name=index["index_name"])
+        except Exception as e:   # 索引名与 profile 不一致时 drop_collection 仍会一并删除
+            log.warning(f"删除索引 {index['index_name']} 失败: {e}")
+    client.drop_collection(collection_name=name)
+    milvus_manager.invalidate_collection(name)
+    log.info(f"已删除集合 {name}")
+
+
+def create_missing_indexes(client, profile: CollectionProfile, collection_name: Optional[str] = None) -> List[str]:
+    """
+    为已存在的集合补建 profile 中新增的索引 (例如后来加入的 source_index) 已经有索引的字段不动
+    :return: 新建的索引名
+    """
+    name = collection_name or profile.collection_name
+    indexed_fields = set()
+    for index_name in client.list_indexes(collection_name=name):
+        info = client.describe_index(collection_name=name, index_name=index_name) or {}
+        indexed_fields.add(info.get("field_name"))
+    created = []
+    for index in profile.all_indexes():
+        if index["field_name"] in indexed_fields:
+            continue
+        index_name = index.get("index_name", index["field_name"])
+        index_params = client.prepare_index_params()
+        index_params.add_index(**index)
+        try:
+            client.create_index(collection_name=name, index_params=index_params)
+            created.append(index_name)
+            log.info(f"集合 {name} 已补建索引 {index_name} ({index.get('index_type')})")
+        except Exception as e:   # 例如当前 Milvus 版本不支持在已加载的集合上建该类型的索引
+            log.warning(f"集合 {name} 补建索引 {index_name} 失败: {e}")
+    return created
+
+
+def ensure_collection(client, profile: Union[str, CollectionProfile], collection_name: Optional[str] = None,
+                      recreate: bool = False, strict: bool = True) -> str:
+    """
+    按 profile 创建集合 集合已存在时校验 schema
+    :param client: MilvusClient 或本地向量库客户端
+    :param profile: CollectionProfile 或 profile 名称
+    :param collection_name: 覆盖 profile 中的集合名
+    :param recreate: True 时先删除已存在的集合再重建
+    :param strict: 已存在的集合与 profile 不一致时抛出 ProfileMismatchError, False 时只记录警告
+    集合已存在时会补建 profile 中有而集合中没有的索引
+    :return: "created" 或 "exists"
+    """
+    if isinstance(profile, str):
+        profile = load_profile(profile)
+    name = collection_name or profile.collection_name
+    if recreate:
+        drop_collection(client, profile, name)
+    elif client.has_collection(name):
+        problems = validate_collection(client, profile, name)
+        if problems:
+            message = f"集合 {name} 与 collection profile {profile.name} 不一致: " + "; ".join(problems)
+            if strict:
+                raise ProfileMismatchError(message)
+            log.warning(message)
+        create_missing_indexes(client, profile, name)
+        return "exists"
+
+    kwargs = {}
+    if profile.partition:
+        kwargs["num_partitions"] = profile.partition.get("num_partitions") or DEFAULT_NUM_PARTITIONS
+        if profile.partition.get("isolation"):
+            kwargs["properties"] = {"partitionkey.isolation": True}
+    client.create_collection(collection_name=name, schema=profile.build_schema(client),
+                             index_params=profile.build_index_params(client), **kwargs)
+    log.info(f"已按 collection profile {profile.name} 创建集合 {name}")
+    return "created"
+
+
+if __name__ == "__main__":
+    from utils.milvus_connection import get_milvus_client
+    # 部署覆盖文件示例 config/collection_profiles/rag_chunks.yaml:
+    #   dense_profile: hnsw_sq8
+    #   bm25: {k1: 1.5}
+    #   indexes:
+    #     - field_name: dense
+    #       params: {M: 32, efConstruction: 200}
+    #   partition: {key_field: source, num_partitions: 64}
+    rag_profile = load_profile("rag_chunks", dense_profile="fp16_hnsw")
+    print(json.dumps(rag_profile.all_indexes(), ensure_ascii=False, indent=2))
+    print(rag_profile.with_partition_key("source").route(["a.md", "b.md"], 'category == "TitleWithContent"'))
+    print(ensure_collection(get_milvus_client(), rag_profile, strict=False))
@@ -0,0 +1,157 @@
+import sys
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+"""
+RagChain 的上下文构建
+merge_title_content 生成的 chunk 以 '父标题 -> 子标题 -> 内容' 的形式带着完整的标题链(子标题还会带上父标题下已有的内容),
+检索到同一章节的多个 chunk 时, 直接拼接会把相同的标题路径和父级内容重复很多遍。这里按相关度顺序:
+1. 按 '->' 把 chunk 拆成片段, 已经出现在上下文中的片段(共享的标题前缀/父级内容)不再重复输出
+2. 去重后剩余内容的字符 3-gram 大部分已经出现在上下文中(近似重复)的 chunk 直接丢弃
+3. 在 token 预算内依次装入, 最后一个装不下的 chunk 截断
+"""
+
+SEGMENT_SPLIT_REGEX = r"\s*->\s*"
+CJK_REGEX = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def heuristic_token_count(text: str) -> int:
+    """没有 tiktoken 时的估算: 中日韩字符约 1 token/字, 其余约 4 字符/token"""
+    cjk = len(CJK_REGEX.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def create_token_counter(encoding_name: str = "cl100k_base") -> Callable[[str], int]:
+    """优先使用 tiktoken 精确计数 未安装时退回估算"""
+    try:
+        import tiktoken
+    except ImportError:
+        return heuristic_token_count
+    encoding = tiktoken.get_encoding(encoding_name)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class PackedContext:
+    """构建好的上下文"""
+    text: str
+    docs: List[Document]                       # 实际装入上下文的文档 按相关度排序
+    stats: dict = field(default_factory=dict)  # 原始/实际 token 数, 节省的 token 数, 丢弃的 chunk 数
+
+
+class ContextBuilder:
+    """按 token 预算打包检索结果 去掉重复的标题前缀和近似重复的 chunk"""
+
+    def __init__(self, max_tokens: int = 3000, near_duplicate_threshold: float = 0.85, min_chunk_tokens: int = 32,
+                 token_counter: Optional[Callable[[str], int]] = None, chunk_separator: str = "\n\n"):
+        """
+        :param max_tokens: 上下文的 token 预算
+        :param near_duplicate_threshold: chunk 的 3-gram 中已出现在上下文里的比例超过该值即视为重复
+        :param min_chunk_tokens: 预算剩余不足这个数时不再截断装入
+        :param token_counter: token 计数函数 默认 tiktoken, 未安装时按字符估算
+        :param chunk_separator: chunk 之间的分隔符 与 RagChain.format_docs 相同
+        """
+        self.max_tokens = max_tokens
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.min_chunk_tokens = min_chunk_tokens
+        self.count_tokens = token_counter or create_token_counter()
+        self.chunk_separator = chunk_separator
+
+    @staticmethod
+    def _normalize(segment: str) -> str:
+        return re.sub(r"\s+", " ", segment).strip().lower()
+
+    @staticmethod
+    def _shingles(text: str, n: int = 3) -> set:
+        text = re.sub(r"\s+", "", text)
+        if len(text) <= n:
+            return {text} if text else set()
+        return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+    def _is_near_duplicate(self, shingles: set, kept: set) -> bool:
+        # 用包含度而不是 Jaccard: 短 chunk 的内容被长 chunk 覆盖时同样视为重复
+        return bool(shingles) and len(shingles & kept) / len(shingles) >= self.near_duplicate_threshold
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """二分查找预算内能保留的最长前缀"""
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_tokens(text[:mid]) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+    def build(self, docs: List[Document]) -> PackedContext:
+        """
+        :param docs: 检索结果 按相关度从高到低排列
+        :return: 打包后的上下文
+        """
+        original_tokens = self.count_tokens(self.chunk_separator.join(d.page_content for d in docs))
+        seen_segments = set()
+        kept_shingles = set()   # 已装入上下文的所有 3-gram
+        parts, used_docs = [], []
+        used_tokens = 0
+        duplicates = over_budget = truncated = 0
+
+        for index, doc in enumerate(docs):
+            segments = [s for s in re.split(SEGMENT_SPLIT_REGEX, doc.page_content) if s.strip()]
+            fresh = [s for s in segments if self._normalize(s) not in seen_segments]
+            if not fresh:   # 所有片段都已经在上下文中
+                duplicates += 1
+                continue
+            # 去掉了共享前缀时 用 chunk 自己的标题标明它属于哪一节
+            title = doc.metadata.get("title")
+            if title and len(fresh) < len(segments) and self._normalize(fresh[0]) != self._normalize(title):
+                fresh.insert(0, title)
+            text = "->".join(fresh)
+
+            shingles = self._shingles("".join(s for s in fresh if s != title))
+            if self._is_near_duplicate(shingles, kept_shingles):
+                duplicates += 1
+                continue
+
+            separator_tokens = self.count_tokens(self.chunk_separator) if parts else 0
+            tokens = self.count_tokens(text) + separator_tokens
+            if used_tokens + tokens > self.max_tokens:
+                remaining = self.max_tokens - used_tokens - separator_tokens
+                if remaining >= self.min_chunk_tokens:
+                    text = self._truncate(text, remaining)
+                    tokens = self.count_tokens(text) + separator_tokens
+                    truncated = 1
+                else:
+                    text = ""
+                over_budget = len(docs) - index - (1 if text else 0)
+                if text:
+                    parts.append(text)
+                    used_docs.append(doc)
+                    used_tokens += tokens
+                break
+
+            parts.append(text)
+            used_docs.append(doc)
+            used_tokens += tokens
+            kept_shingles |= shingles
+            seen_segments.update(self._normalize(s) for s in segments)
+
+        context = self.chunk_separator.join(parts)
+        context_tokens = self.count_tokens(context)
+        stats = {
+            "original_tokens": original_tokens,
+            "context_tokens": context_tokens,
+            "saved_tokens": original_tokens - context_tokens,
+            "chunks_in": len(docs),
+            "chunks_used": len(used_docs),
+            "dropped_duplicates": duplicates,
+            "dropped_over_budget": over_budget,
+            "truncated": truncated,
+        }
+        return PackedContext(text=context, docs=used_docs, stats=stats)
@@ -0,0 +1,135 @@
+import sys
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence, Union
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+
+"""
+dense 字段的存储/索引方案 (profile)
+查询节点的内存主要被 dense 向量和它的索引占用, 1024 维 FLOAT_VECTOR + HNSW(M=16) 每条约 4.2KB:
+- FLOAT16_VECTOR / BFLOAT16_VECTOR: 原始向量减半, 召回率几乎不变
+- HNSW_SQ / IVF_SQ8: 索引内的向量量化为 8 bit, 约为 float32 的 1/4
+- IVF_PQ: 乘积量化, m 个子空间各 nbits, 压缩比最高, 召回率损失也最大
+- Matryoshka 截断: 只保留 embedding 的前 dim 维后重新归一化; 只适用于按 Matryoshka 方式训练的模型
+  (例如 text-embedding-3 / Qwen3-Embedding), 其他模型截断后召回率会明显下降, 需要先用 bench_dense_profiles.py 验证
+写入和查询必须使用同一个 profile 编码, 集合建好之后不能更换 (需要重建集合并重新导入)
+"""
+
+SOURCE_DIM = 1024   # embedding 模型输出的维度
+BYTES_PER_VALUE = {"FLOAT_VECTOR": 4, "FLOAT16_VECTOR": 2, "BFLOAT16_VECTOR": 2}
+
+
+def to_bfloat16_bytes(vector: np.ndarray) -> bytes:
+    """float32 -> bfloat16 (就近舍入到偶数) pymilvus 的 BFLOAT16_VECTOR 字段接受小端字节串"""
+    bits = np.asarray(vector, dtype=np.float32).view(np.uint32)
+    rounded = bits + 0x7FFF + ((bits >> 16) & 1)
+    return (rounded >> 16).astype("<u2").tobytes()
+
+
+def from_bfloat16_bytes(data: bytes) -> np.ndarray:
+    return (np.frombuffer(data, dtype="<u2").astype(np.uint32) << 16).view(np.float32)
+
+
+@dataclass
+class DenseProfile:
+    """一种 dense 字段方案: 向量类型 + 维度 + 索引"""
+    name: str
+    vector_type: str = "FLOAT_VECTOR"   # FLOAT_VECTOR / FLOAT16_VECTOR / BFLOAT16_VECTOR
+    dim: int = SOURCE_DIM               # 小于 SOURCE_DIM 时在客户端做 Matryoshka 截断
+    index_type: str = "HNSW"
+    metric_type: str = "IP"
+    index_params: dict = field(default_factory=lambda: {"M": 16, "efConstruction": 100})
+    search_params: dict = field(default_factory=dict)   # IVF 系列的 nprobe 等; HNSW 的 ef 由 SearchParamPolicy 决定
+
+    @property
+    def is_ivf(self) -> bool:
+        return self.index_type.startswith("IVF")
+
+    def _prepare(self, vectors: Sequence[Sequence[float]]) -> np.ndarray:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.dim < matrix.shape[1]:
+            matrix = matrix[:, :self.dim]
+            if self.metric_type in ("IP", "COSINE"):   # 截断后重新归一化, 内积仍然等于余弦相似度
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix = matrix / np.where(norms == 0, 1, norms)
+        return matrix
+
+    def encode(self, vectors: Sequence[Sequence[float]]) -> List[Union[List[float], np.ndarray, bytes]]:
+        """把 embedding 转换成可以直接写入/查询该字段的格式 (写入和查询使用同一个转换)"""
+        if not len(vectors):
+            return []
+        matrix = self._prepare(vectors)
+        if self.vector_type == "FLOAT16_VECTOR":
+            return list(matrix.astype(np.float16))
+        if self.vector_type == "BFLOAT16_VECTOR":
+            return [to_bfloat16_bytes(row) for row in matrix]
+        return matrix.tolist()
+
+    def decode(self, values: Sequence) -> np.ndarray:
+        """encode 的逆过程 把从该字段读出的向量还原成 float32 矩阵 (维度为 self.dim)
+        pymilvus 把 FLOAT16_VECTOR / BFLOAT16_VECTOR 读成小端字节串 (可能包在单元素列表中), 本地向量库读成数组"""
+        rows = []
+        for value in values:
+            if isinstance(value, (list, tuple)) and len(value) == 1 and isinstance(value[0], (bytes, bytearray)):
+                value = value[0]
+            if isinstance(value, (bytes, bytearray)):
+                if self.vector_type == "BFLOAT16_VECTOR":
+                    value = from_bfloat16_bytes(bytes(value))
+                else:
+                    value = np.frombuffer(value, dtype="<f2" if self.vector_type == "FLOAT16_VECTOR" else "<f4")
+            rows.append(np.asarray(value, dtype=np.float32))
+        return np.stack(rows) if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+    def dense_param(self, policy_param: dict) -> dict:
+        """检索参数: HNSW 系列使用策略给出的 ef, IVF 系列使用 profile 自己的 nprobe"""
+        if self.is_ivf:
+            return dict(self.search_params or {"nprobe": 16})
+        return {**policy_param, **self.search_params}
+
+    def memory_bytes(self, rows: int) -> int:
+        """查询节点上该字段的内存估算 (向量 + 索引结构), 用于比较各方案, 不是精确值"""
+        raw = rows * self.dim * BYTES_PER_VALUE[self.vector_type]
+        graph = rows * self.index_params.get("M", 16) * 2 * 4   # HNSW 每层平均 2M 个 int32 邻居
+        if self.index_type == "HNSW":
+            return raw + graph
+        if self.index_type == "HNSW_SQ":
+            return rows * self.dim + graph
+        if self.index_type == "IVF_FLAT":
+            return raw
+        if self.index_type == "IVF_SQ8":
+            return rows * self.dim
+        if self.index_type == "IVF_PQ":
+            return rows * self.index_params.get("m", 64) * self.index_params.get("nbits", 8) // 8
+        return raw
+
+
+DENSE_PROFILES: Dict[str, DenseProfile] = {p.name: p for p in [
+    DenseProfile("fp32_hnsw"),   # 现有方案
+    DenseProfile("fp16_hnsw", vector_type="FLOAT16_VECTOR"),
+    DenseProfile("bf16_hnsw", vector_type="BFLOAT16_VECTOR"),
+    DenseProfile("hnsw_sq8", index_type="HNSW_SQ", index_params={"M": 16, "efConstruction": 100, "sq_type": "SQ8"}),
+    DenseProfile("ivf_sq8", index_type="IVF_SQ8", index_params={"nlist": 1024}, search_params={"nprobe": 32}),
+    DenseProfile("ivf_pq", index_type="IVF_PQ", index_params={"nlist": 1024, "m": 64, "nbits": 8},
+                 search_params={"nprobe": 32}),
+    DenseProfile("mrl512_fp16_hnsw", vector_type="FLOAT16_VECTOR", dim=512),
+]}
+DEFAULT_DENSE_PROFILE = "fp32_hnsw"
+
+
+def get_dense_profile(profile: Union[str, DenseProfile, None] = None) -> DenseProfile:
+    if isinstance(profile, DenseProfile):
+        return profile
+    name = profile or DEFAULT_DENSE_PROFILE
+    if name not in DENSE_PROFILES:
+        raise ValueError(f"不支持的 dense profile: {name}, 可选值: {list(DENSE_PROFILES)}")
+    return DENSE_PROFILES[name]
+
+
+if __name__ == "__main__":
+    rows = 1_000_000
+    for profile in DENSE_PROFILES.values():
+        print(f"{profile.name:<18} {profile.vector_type:<16} dim={profile.dim:<5} {profile.index_type:<8} "
+              f"约 {profile.memory_bytes(rows) / 2 ** 30:.2f} GiB / {rows} 条")
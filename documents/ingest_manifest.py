@@ -0,0 +1,86 @@
+import sys
+import os
+import json
+import hashlib
+from typing import List, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.log_utils import log
+
+
+class IngestManifest:
+    """
+    增量导入清单 记录每个已导入文件的 路径/mtime/大小/内容哈希
+    再次导入时只需要处理新增或内容发生变化的文件, 以及清理已删除文件的旧数据
+    """
+
+    def __init__(self, manifest_path: str):
+        """
+        :param manifest_path: 清单文件路径 (json)
+        """
+        self.manifest_path = manifest_path
+        self.entries: dict = {}   # 文件路径 -> {"mtime":..., "size":..., "sha256":...}
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+            log.info(f"已加载导入清单 {self.manifest_path}, 共 {len(self.entries)} 个文件")
+
+    def save(self):
+        """先写临时文件再替换 避免写到一半中断导致清单损坏"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def fingerprint(file_path: str) -> dict:
+        stat = os.stat(file_path)
+        return {"mtime": stat.st_mtime, "size": stat.st_size, "sha256": IngestManifest.file_hash(file_path)}
+
+    def diff(self, file_paths: List[str]) -> Tuple[List[str], List[str], List[str]]:
+        """
+        对比当前目录中的文件和清单
+        mtime 和大小都没变的文件直接认为未变化; 否则再比较内容哈希, 只是被 touch 过的文件不会重新导入
+        :param file_paths: 当前需要导入的所有文件路径
+        :return: (新增的文件, 内容变化的文件, 已被删除的文件)
+        """
+        new_files, changed_files = [], []
+        for file_path in file_paths:
+            entry = self.entries.get(file_path)
+            if entry is None:
+                new_files.append(file_path)
+                continue
+            stat = os.stat(file_path)
+            if stat.st_mtime == entry["mtime"] and stat.st_size == entry["size"]:
+                continue
+            if stat.st_size == entry["size"] and self.file_hash(file_path) == entry["sha256"]:
+                entry["mtime"] = stat.st_mtime   # 内容没变 只刷新 mtime
+                continue
+            changed_files.append(file_path)
+
+        current = set(file_paths)
+        removed_files = [p for p in self.entries if p not in current]
+        log.info(f"增量对比: 新增 {len(new_files)} 个, 变化 {len(changed_files)} 个, "
+                 f"删除 {len(removed_files)} 个, 未变化 {len(file_paths) - len(new_files) - len(changed_files)} 个")
+        return new_files, changed_files, removed_files
+
+    def update(self, file_path: str):
+        """文件导入成功后记录其最新指纹"""
+        self.entries[file_path] = self.fingerprint(file_path)
+
+    def remove(self, file_path: str):
+        self.entries.pop(file_path, None)
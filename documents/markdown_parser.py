@@ -4,28 +4,67 @@ import os
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from langchain_community.document_loaders import UnstructuredMarkdownLoader
 from langchain_core.documents import Document
 from utils.log_utils import log
-from typing import List
+from utils.embedding_cache import CachedEmbeddings
+from typing import List, Iterable, Iterator
 from llm_utils import openai_embedding
-from langchain_experimental.text_splitter import SemanticChunker
+from documents.native_markdown import iter_markdown_elements
+from documents.chunking import create_chunk_strategy, CHUNK_STRATEGIES
+
+BACKENDS = ("unstructured", "native")
+
+
+class SectionBuffer:
+    """
+    标题文档的内容缓冲区
+    子元素的内容先追加到列表里, 需要完整文本时(子标题要拼接父标题前缀、标题结束时)才一次性 join,
+    避免每追加一个子元素就重建一次父文档字符串(O(n²))
+    """
+    __slots__ = ("parts",)
+
+    def __init__(self, text: str):
+        self.parts = [text]
+
+    def append(self, text: str):
+        self.parts.append(text)
+
+    def text(self) -> str:
+        if len(self.parts) > 1:
+            self.parts = ['->'.join(self.parts)]   # join 后合并为一段, 重复调用不会重复拼接
+        return self.parts[0]
+
 
 class MarkdownParser:
     """
     Markdown解析器 处理解析与切片
     """
     
-    def __init__(self):
-        self.text_splitter = SemanticChunker(
-            openai_embedding, breakpoint_threshold_type="percentile"
-        )
+    def __init__(self, backend: str = "unstructured", chunk_strategy: str = "semantic", max_chunk_chars: int = 5000):
+        """
+        :param backend: 元素解析后端 "unstructured" 使用 UnstructuredMarkdownLoader;
+                        "native" 使用纯 Python 的标题感知解析器(documents/native_markdown.py), 导入和解析都更快
+        :param chunk_strategy: 超长段落的切片策略 recursive / semantic / hybrid, 见 documents/chunking.py
+        :param max_chunk_chars: 段落超过这个字符数才继续切分
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"不支持的解析后端: {backend}, 可选值: {BACKENDS}")
+        if chunk_strategy not in CHUNK_STRATEGIES:
+            raise ValueError(f"不支持的切片策略: {chunk_strategy}, 可选值: {CHUNK_STRATEGIES}")
+        self.backend = backend
+        self.max_chunk_chars = max_chunk_chars
+        # 语义切分需要对句子窗口做 embedding, 通过磁盘缓存包装后, 重复解析同一份文档时不会重复请求
+        self.embeddings = CachedEmbeddings(openai_embedding)
+        self.text_splitter = create_chunk_strategy(chunk_strategy, self.embeddings, max_chunk_chars)
         
     def text_chunker(self, datas: List[Document]) -> List[Document]:
+        # 内容超出了阈值的文档一次性交给切片策略, 语义切分时所有文档的句子可以合并成大批次请求 embedding
+        oversized = [d for d in datas if len(d.page_content) > self.max_chunk_chars]
+        split_results = iter(self.text_splitter.split_batch(oversized))
         new_docs = []
         for d in datas:
-            if len(d.page_content) > 5000:  # 内容超出了阈值，则按照语义再切割
-                new_docs.extend(self.text_splitter.split_documents([d]))
+            if len(d.page_content) > self.max_chunk_chars:
+                new_docs.extend(next(split_results))
                 continue
             new_docs.append(d)
         return new_docs
@@ -49,6 +88,34 @@ class MarkdownParser:
 
         return  chunk_documents  # 添加返回语句
 
+    def iter_documents(self, md_file_path: str, encoding: str = "utf-8", chunk_batch_docs: int = 8) -> Iterator[Document]:
+        """
+        流式解析Markdown文件 逐个产出切分后的Document对象
+        与 parse_markdown_to_documents 得到的Document集合相同, 只是顺序不同:
+        每个标题在其子树结束(遇到同级或更高级的标题)时就被产出, 而不是等整个文件解析完
+        :param md_file_path: Markdown文件路径
+        :param encoding: 文件编码 默认utf-8
+        :param chunk_batch_docs: 超长段落攒够这么多个再一起切分, 让语义切分的 embedding 请求合批
+        :return: Document对象生成器
+        """
+        count = 0
+        oversized = []
+        for document in self.iter_merged_documents(self.iter_elements(md_file_path, encoding)):
+            if len(document.page_content) <= self.max_chunk_chars:
+                count += 1
+                yield document
+                continue
+            oversized.append(document)
+            if len(oversized) >= chunk_batch_docs:
+                for chunk in self.text_chunker(oversized):
+                    count += 1
+                    yield chunk
+                oversized = []
+        for chunk in self.text_chunker(oversized):
+            count += 1
+            yield chunk
+        log.info(f"流式解析Markdown文件 {md_file_path} 完成，共产出 {count} 个Document对象")
+
     def parse_markdown(self, md_file_path: str, encoding: str = "utf-8") -> list[Document]:
         """
         解析Markdown文件为Document对象列表
@@ -56,17 +123,28 @@ class MarkdownParser:
         :param encoding: 文件编码，默认utf-8
         :return: Document对象列表
         """
+        return list(self.iter_elements(md_file_path, encoding))
+
+    def iter_elements(self, md_file_path: str, encoding: str = "utf-8") -> Iterator[Document]:
+        """
+        逐个产出Markdown文件中的元素(Title、NarrativeText、ListItem 等)
+        :param md_file_path: Markdown文件路径
+        :param encoding: 文件编码，默认utf-8
+        :return: Document对象生成器
+        """
+        if self.backend == "native":
+            yield from iter_markdown_elements(md_file_path, encoding)
+            return
+
+        # unstructured 导入很重, 只有用到时才导入
+        from langchain_community.document_loaders import UnstructuredMarkdownLoader
         loader = UnstructuredMarkdownLoader(
             file_path=md_file_path,
             mode="elements",  # 使用elements模式，文档将拆分为诸如 Title 和 NarrativeText 等元素
             strategy="fast",
             encoding=encoding
         )
-        docs = []
-        for doc in loader.lazy_load():
-            docs.append(doc)
-
-        return docs
+        yield from loader.lazy_load()
     def merge_title_content(self, datas: List[Document]) -> List[Document]:
         """
         这个函数的主要目的是重组使用 unstructured 库解析的 Markdown 文档，
@@ -78,6 +156,7 @@ class MarkdownParser:
         """
         merged_data = []
         parent_dict = {}  # parent_dict 是一个字典（dictionary），用于存储所有标题类型的文档（category 为 'Title' 的文档）。
+        buffers = {}      # element_id -> SectionBuffer 标题文档的内容缓冲区 最后再写回 page_content
         for document in datas:
             metadata = document.metadata
             if 'languages' in metadata:          # 获取每个文档的元数据，并移除其中的 'languages' 字段 因为这个是列表类型，不支持milvus存储
@@ -95,14 +174,15 @@ class MarkdownParser:
                 document.metadata['title'] = document.page_content # Document里面就metadata跟page_content，我们直接在metadata中添加title字段 内容
                 # 检查parent_id是否存在于parent_dict中，避免KeyError
                 if parent_id and parent_id in parent_dict:
-                    document.page_content = parent_dict[parent_id].page_content + ' -> ' + document.page_content
+                    document.page_content = buffers[parent_id].text() + ' -> ' + document.page_content
                 parent_dict[element_id] = document  # parent_id key为element_id，value为document 包含新的字段 title 
+                buffers[element_id] = SectionBuffer(document.page_content)
             # 条件3：有父级的内容文档  遇到非标题类型（如 NarrativeText、ListItem 等）且有父元素ID的文档时 将该文档的内容追加到其父标题文档的内容中
             # 将父文档的类别标记为 'content'，表示它现在包含了内容信息
             if category != 'Title' and parent_id:
                 # 检查parent_id是否存在于parent_dict中，避免KeyError
                 if parent_id in parent_dict:
-                    parent_dict[parent_id].page_content = parent_dict[parent_id].page_content + '->' + document.page_content
+                    buffers[parent_id].append(document.page_content)
                     parent_dict[parent_id].metadata['category'] = 'TitleWithContent' # 标题文档被附加了子内容（如 NarrativeText、ListItem 等），表示这是一个“带内容的标题”
                 else:
                     # 如果找不到父文档，将当前文档作为独立文档添加到结果中
@@ -111,11 +191,66 @@ class MarkdownParser:
     
         # 将parent_dict中包含内容的文档添加到merged_data
         # 将parent_dict中的所有文档添加到merged_data（包括纯标题）
-        for doc in parent_dict.values():
+        for element_id, doc in parent_dict.items():
+            doc.page_content = buffers[element_id].text()
             merged_data.append(doc)
         
         return merged_data
 
+    def iter_merged_documents(self, elements: Iterable[Document]) -> Iterator[Document]:
+        """
+        merge_title_content 的流式版本 合并规则相同
+        用一个栈维护当前打开的标题链: 新标题到来时, 栈中不是它祖先的标题都已经结束, 立即产出;
+        内容元素只会追加到仍然打开的父标题上。这样不需要等整个文件解析完才能产出第一个Document
+        :param elements: 元素Document生成器 例如 iter_elements 的返回值
+        :return: 合并后的Document对象生成器
+        """
+        open_titles = {}   # element_id -> 尚未结束的标题文档
+        buffers = {}       # element_id -> SectionBuffer 尚未结束的标题的内容缓冲区
+        stack = []         # 打开的标题 element_id, 栈底是最外层标题
+
+        def close_until(ancestor_id):
+            # 弹出并返回所有不是 ancestor_id 的标题 (ancestor_id 为 None 时全部弹出) 结束时才拼接完整内容
+            closed = []
+            while stack and stack[-1] != ancestor_id:
+                closed_id = stack.pop()
+                document = open_titles.pop(closed_id)
+                document.page_content = buffers.pop(closed_id).text()
+                closed.append(document)
+            return closed
+
+        for document in elements:
+            metadata = document.metadata
+            if 'languages' in metadata:          # 列表类型，不支持milvus存储
+                metadata.pop('languages')
+
+            parent_id = metadata.get('parent_id', None)
+            category = metadata.get('category', None)
+            element_id = metadata.get('element_id', None)
+            # 条件1：独立的内容文档（没有父级的NarrativeText）
+            if category == 'NarrativeText' and parent_id is None:
+                yield document
+            # 条件2：标题文档 先结束所有不是它祖先的标题
+            if category == 'Title':
+                yield from close_until(parent_id if parent_id in open_titles else None)
+                document.metadata['title'] = document.page_content
+                if parent_id and parent_id in open_titles:
+                    document.page_content = buffers[parent_id].text() + ' -> ' + document.page_content
+                open_titles[element_id] = document
+                buffers[element_id] = SectionBuffer(document.page_content)
+                stack.append(element_id)
+            # 条件3：有父级的内容文档 追加到仍然打开的父标题中
+            if category != 'Title' and parent_id:
+                if parent_id in open_titles:
+                    buffers[parent_id].append(document.page_content)
+                    open_titles[parent_id].metadata['category'] = 'TitleWithContent'
+                else:
+                    log.warning(f"找不到parent_id为 {parent_id} 的父文档，将当前文档作为独立文档处理")
+                    yield document
+
+        # 文件结束 剩余的标题全部结束
+        yield from close_until(None)
+
     def get_logger(self):
         return self.logger
 
@@ -2,14 +2,20 @@ import sys
 import os
 # 添加上级目录到 Python 路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from pymilvus import IndexType, MilvusClient
-from pymilvus.client.types import MetricType
 from llm_utils import qwen_embeddings, openai_embedding, llm
 from langchain_core.documents import Document
 from env_utils import MILVUS_URI, COLLECTION_NAME
 from langchain_milvus import Milvus, BM25BuiltInFunction
 from typing import List, Optional
-from .markdown_parser import MarkdownParser
+from documents.markdown_parser import MarkdownParser
+from utils.embedding_cache import CachedEmbeddings, cached_query_embeddings
+from documents.answer_cache import bump_collection_version
+from search_tool.search_params import default_policy
+from utils.milvus_connection import get_milvus_client, get_vector_store
+from documents.collection_profile import drop_collection, load_profile
+
+# 文档向量走磁盘缓存(重复导入未变化的文档不会重复计算), 查询向量走进程内 LRU 缓存(重复的问题不会重复计算)
+rag_embeddings = cached_query_embeddings(CachedEmbeddings(openai_embedding))
 
 
 class MilvusVectorSave:
@@ -19,50 +25,24 @@ class MilvusVectorSave:
         # 类型注解：明确声明属性类型，提供IDE智能提示和类型检查
         self.vector_stored_saved: Optional[Milvus] = None
         """放一些索引的配置参数 __init__ 应该只负责初始化状态，而不是执行“创建集合”这种业务动作  注意配置好了字段参数vector_field之后一定要配置对应的索引参数index_params"""
-        self.params = [
-            {
-                "field_name": "sparse",
-                "index_name": "sparse_inverted_index",
-                "index_type": "SPARSE_INVERTED_INDEX",
-                "metric_type": "BM25",
-                "params": {
-                    "inverted_index_algo": "DAAT_MAXSCORE", # （默认）：采用 MaxScore 算法优化的文档逐次（DAAT）查询处理。
-                    "bm25_k1": 1.2,       # 数值越高，专业术语词频在文档排名中的重要性越大。取值范围：[1.2, 2.0]。
-                    "bm25_b": 0.75 
-                }
-            },
-            {
-                "field_name": "dense",
-                "index_name": "dense_vector_index",        # 向量索引 HNSW 矢量索引
-                "index_type": IndexType.HNSW,              # 矢量索引类型  也可以直接用"AUTOINDEX" 这样就省的配置参数了
-                "metric_type": MetricType.IP,         # 用于计算向量间距离的方法。支持的取值包括 COSINE 、 L2 和 IP 。详情请参阅度量类型。
-                "params":{
-                    "M": 16,            # 数值越大，精度越高但内存消耗越大
-                    "efConstruction": 100 # 索引构建过程中考虑连接的候选邻居数量 数值越大，索引质量越高但构建时间越长
-                }
-            }
-        ]
+        # 索引参数来自 rag_chunks collection profile (BM25 的 k1/b, HNSW 的 M/efConstruction), 与 vector_field 的顺序一一对应
+        self.profile = load_profile("rag_chunks")
+        self.params = self.profile.langchain_index_params(["sparse", "dense"])
     
     def create_connection(self,collection_name: str = COLLECTION_NAME, uri: str = MILVUS_URI, is_first: bool = False):
         """创建一个connection milvus + langchain"""
         # 检查集合是否已存在，如果存在先释放collection，然后再删除索引和集合  
 
         if is_first:  
-            client = MilvusClient(uri=MILVUS_URI)
-            if COLLECTION_NAME in client.list_collections():
-                client.release_collection(collection_name=COLLECTION_NAME)
-                client.drop_index(collection_name=COLLECTION_NAME, index_name="sparse_inverted_index")
-                client.drop_index(collection_name=COLLECTION_NAME, index_name="dense_vector_index")
-                client.drop_collection(collection_name=COLLECTION_NAME)
+            drop_collection(get_milvus_client(uri), self.profile, collection_name)
 
         # 利用 langchain 提供的 milvus 工具创建存储向量的collection
         # BM25BuiltInFunction() 是专门为 LangChain 的 Milvus.from_documents() 方法设计的
-        self.vector_stored_saved = Milvus(
-            embedding_function=openai_embedding,
+        # 同一个进程内复用同一个实例, 避免每次调用都重新握手和初始化
+        self.vector_stored_saved = get_vector_store(
             collection_name=collection_name,
-            connection_args={
-                "uri": uri,
-            },
+            embedding_function=rag_embeddings,
+            uri=uri,
             # 自动将文本字段（TEXT_FIELD）通过 内置的 BM25 函数 转换为 稀疏向量（SPARSE_FLOAT_VECTOR）
             builtin_function=BM25BuiltInFunction( 
                 input_field_names="text",      # 输入：原始文本字段 	VARCHAR
@@ -72,7 +52,15 @@ class MilvusVectorSave:
             index_params=self.params,          # 索引参数   vector_field和index_params的配置参数要一一对应，不能混淆
             consistency_level="Strong",          # 一致性级别
             auto_id=True,                       # 是否主键自动生成ID   
+            **self.partition_kwargs(),
         )
+
+    def partition_kwargs(self) -> dict:
+        """profile 配置了分区键时 (config/collection_profiles/rag_chunks.yaml 中的 partition) 由 langchain 建分区键字段"""
+        if not self.profile.partition_key:
+            return {}
+        return {"partition_key_field": self.profile.partition_key,
+                "num_partitions": self.profile.partition.get("num_partitions") or 64}
     def add_documents(self, documents: list[Document]):
         """
         添加新的 document 数据到数据库
@@ -82,6 +70,7 @@ class MilvusVectorSave:
         # 1.调用内置的 BM25BuiltInFunction 然后 Milvus 用 analyzer 处理这个 `text` 字段，生成 sparse 向量
         # 2.调用 embedding_function 将 page_content 转换成 dense 向量 存到你定义的 "dense" 字段
         self.vector_stored_saved.add_documents(documents)
+        bump_collection_version(self.vector_stored_saved.collection_name)   # 数据变化后让答案缓存失效
 
 if __name__ == "__main__":
     file_path = r"E:\Workspace\ai\RAG\datas\md\tech_report_z7tx05vt.md"
@@ -132,10 +121,8 @@ if __name__ == "__main__":
     # print("-----" * 10)
     # 基于向量字段进行向量查询
     query = "干法刻蚀"
-    query_vector = qwen_embeddings.embed_query(query)
-    search_params = {
-        "params": {"nprobe": 10}
-    }
+    query_vector = cached_query_embeddings(qwen_embeddings).embed_query(query)
+    search_params = default_policy.dense_search_params(limit=1)   # HNSW 索引使用 ef, nprobe 对 HNSW 无效
     vector_results = client.search(
         collection_name=COLLECTION_NAME,
         data=[query_vector],  # 查询向量
@@ -2,14 +2,32 @@ import sys
 import os
 # 添加上级目录到 Python 路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
-from pymilvus import IndexType, MilvusClient, DataType, Function, FunctionType
-from pymilvus.client.types import MetricType
+from pymilvus import MilvusClient
 from llm_utils import qwen_embeddings, openai_embedding
 from langchain_core.documents import Document
 from env_utils import MILVUS_URI, COLLECTION_NAME
 from langchain_milvus import Milvus, BM25BuiltInFunction
-from typing import  Optional
+from typing import  Optional, List
 from markdown_parser import MarkdownParser
+from utils.embedding_cache import cached_query_embeddings
+from search_tool.search_params import default_policy
+from utils.milvus_connection import get_milvus_client, get_vector_store
+from utils.sparse_encoder import CorpusStats
+from documents.dense_profile import DenseProfile, get_dense_profile
+from documents.collection_profile import CollectionProfile, ensure_collection, key_filter, load_profile
+from typing import Union
+
+# rag_chunks profile 中定义的标量字段及其缺省值 直接用 MilvusClient.insert 写入时, 每一行都必须包含这些字段
+SCALAR_FIELDS = {
+    "category": "",
+    "source": "",
+    "category_depth": 0,
+    "filename": "",
+    "filetype": "",
+    "title": "",
+}
+VARCHAR_MAX_LENGTH = 1000   # 标量 VARCHAR 字段的 max_length
+TEXT_MAX_LENGTH = 6000      # text 字段的 max_length
 
 
 class MilvusVectorSave:
@@ -19,87 +37,49 @@ class MilvusVectorSave:
     def __init__(self):
         # 类型注解：明确声明属性类型，提供IDE智能提示和类型检查
         self.vector_stored_saved: Optional[Milvus] = None
-    def create_collection(self,collection_name: str = COLLECTION_NAME, uri: str = MILVUS_URI, is_first: bool = False):
-        """创建一个collection milvus + langchain"""
-         # 1. 创建一个 Milvus 连接
-        client = MilvusClient(uri=MILVUS_URI)
+        self.client: Optional[MilvusClient] = None
+    def create_collection(self,collection_name: str = COLLECTION_NAME, uri: str = MILVUS_URI, is_first: bool = False,
+                          client_sparse: bool = False, dense_profile: Union[str, DenseProfile, None] = None,
+                          profile: Union[str, CollectionProfile] = "rag_chunks", partition_key: Optional[str] = None,
+                          num_partitions: int = 64):
+        """
+        创建一个collection milvus + langchain 字段和索引定义在 collection profile 中 (documents/collection_profile.py)
+        :param is_first: True 时删除已存在的集合后重建; False 时保留已有集合, 校验 schema 是否与 profile 一致并补建缺少的索引;
+                         显式传入了 client_sparse / dense_profile / partition_key / profile 对象时, 不一致直接抛出
+                         ProfileMismatchError (否则写入的向量格式与集合不符, 每个批次都会失败)
+        :param client_sparse: True 时 sparse 字段由客户端的 BM25SparseEncoder 计算后直接写入 (utils/sparse_encoder.py),
+                              集合不再定义 BM25 Function, 分词不占用 Milvus 节点; 稀疏索引的度量改为 IP
+        :param dense_profile: dense 字段的存储/索引方案 见 documents/dense_profile.py, 默认使用 profile 中的设置;
+                              写入时 documents_to_rows 和检索时 HybridRetriever 需要使用同一个 profile
+        :param profile: collection profile 名称或对象 部署时可以用 config/collection_profiles/rag_chunks.yaml 覆盖
+        :param partition_key: 分区键字段 例如 "source": 按文件检索 (HybridRetriever 的 partition_values) 和
+                              delete_by_sources 只访问对应的分区, 集合变大后延迟基本不变; 只能在建集合时设置
+        :param num_partitions: 分区键哈希到的分区数
+        """
+        # 1. 获取共享的 Milvus 连接
+        client = get_milvus_client(uri)
         print("Milvus 数据库连接已建立")
-        # 2. 定义schema
-        schema = client.create_schema()
-
-        schema.add_field("id", DataType.INT64, is_primary=True, auto_id=True)
-        schema.add_field("category", DataType.VARCHAR, max_length=1000)
-        schema.add_field("source", DataType.VARCHAR, max_length=1000)
-        schema.add_field("category_depth", DataType.INT64)
-        schema.add_field("filename", DataType.VARCHAR, max_length=1000)
-        schema.add_field("filetype", DataType.VARCHAR, max_length=1000)
-        schema.add_field("title", DataType.VARCHAR, max_length=1000)
-        # schema.add_field("text", DataType.VARCHAR, max_length=6000, enable_analyzer=True, analyzer_params={"type": "chinese"}) # 注意如果语料是中文，需要开启分词器为中文
-        schema.add_field("text", DataType.VARCHAR, max_length=6000, enable_analyzer=True, analyzer_params={"tokenizer": "jieba"}) # 注意如果语料是中文，需要开启分词器为中文
-        schema.add_field("sparse", DataType.SPARSE_FLOAT_VECTOR)
-        schema.add_field("dense", DataType.FLOAT_VECTOR, dim=1024 )
-
-        # 3 构建用于全文搜索的 bm25 Function
-        # bm25用于将文本字段转化为稀疏向量字段 用于全文检索
-        bm25_function = Function(
-            name = "text_bm25_emb",
-            input_field_names=["text"], # # 需要进行文本到稀疏向量转换的 VARCHAR 字段名称。对于 FunctionType.BM25 ，此参数仅接受一个字段名称。
-            output_field_names=["sparse"], # # 存储内部生成稀疏向量的字段名称。对于 FunctionType.BM25 ，此参数仅接受一个字段名。
-            function_type=FunctionType.BM25 # # 要使用的函数类型。将该值设置为 FunctionType.BM25
-        )
-        schema.add_function(bm25_function)
-
-        # 4 配置索引
-        index_params = client.prepare_index_params()
-        # 稀疏向量索引
-        index_params.add_index(
-            field_name="sparse",
-
-            index_type="SPARSE_INVERTED_INDEX",
-            index_name="sparse_inverted_index",
-            metric_type="BM25",
-            params={
-                "inverted_index_algo": "DAAT_MAXSCORE", # （默认）：采用 MaxScore 算法优化的文档逐次（DAAT）查询处理。
-                "bm25_k1": 1.2,       # 数值越高，专业术语词频在文档排名中的重要性越大。取值范围：[1.2, 2.0]。
-                "bm25_b": 0.75 
-            }
-        )
-        # 稠密向量索引
-        index_params.add_index(
-            field_name="dense",
-            index_type=IndexType.HNSW,              # 矢量索引类型  也可以直接用"AUTOINDEX" 这样就省的配置参数了
-            index_name="dense_vector_index",
-            metric_type=MetricType.IP,         # 用于计算向量间距离的方法。支持的取值包括 COSINE 、 L2 和 IP 。详情请参阅度量类型。
-            params={
-                "M": 16,            # 数值越大，精度越高但内存消耗越大
-                "efConstruction": 100 # 索引构建过程中考虑连接的候选邻居数量 数值越大，索引质量越高但构建时间越长
-            }
-        )
-
-        #  5. 创建集合
-        # 检查集合是否已存在，如果存在先释放collection，然后再删除索引和集合  
-        if is_first:  
-            if COLLECTION_NAME in client.list_collections():
-                client.release_collection(collection_name=COLLECTION_NAME)
-                client.drop_index(collection_name=COLLECTION_NAME, index_name="sparse_inverted_index")
-                client.drop_index(collection_name=COLLECTION_NAME, index_name="dense_vector_index")
-                client.drop_collection(collection_name=COLLECTION_NAME)
-
-        client.create_collection(
-            collection_name=COLLECTION_NAME,
-            schema=schema,
-            index_params=index_params,
-        )
+        # 2. 按 profile 生成 schema / BM25 Function / 索引参数
+        collection_profile = load_profile(profile) if isinstance(profile, str) else profile
+        if dense_profile is not None:
+            collection_profile = collection_profile.override(dense_profile=get_dense_profile(dense_profile))
+        if client_sparse:
+            collection_profile = collection_profile.with_client_sparse()
+        if partition_key is not None:
+            collection_profile = collection_profile.with_partition_key(partition_key, num_partitions)
+        # 3. 创建集合 is_first 时先释放并删除已有集合和索引; 增量导入时保留已有集合和数据
+        explicit = client_sparse or dense_profile is not None or partition_key is not None or not isinstance(profile, str)
+        status = ensure_collection(client, collection_profile, collection_name, recreate=is_first, strict=explicit)
+        if status == "exists":
+            print(f"集合 {collection_name} 已存在, 跳过创建")
 
     def create_connection(self,collection_name: str = COLLECTION_NAME, uri: str = MILVUS_URI):
         """创建一个connection milvus + langchain"""
-        # 利用 langchain 提供的 milvus 工具连接到已存在的collection
-        self.vector_stored_saved = Milvus(
-            embedding_function=openai_embedding,
+        # 利用 langchain 提供的 milvus 工具连接到已存在的collection 同一个进程内复用同一个实例
+        self.vector_stored_saved = get_vector_store(
             collection_name=collection_name,
-            connection_args={
-                "uri": uri,
-            },
+            embedding_function=cached_query_embeddings(openai_embedding),   # 查询向量走进程内 LRU 缓存
+            uri=uri,
             # 自动将文本字段（TEXT_FIELD）通过 内置的 BM25 函数 转换为 稀疏向量（SPARSE_FLOAT_VECTOR）
             builtin_function=BM25BuiltInFunction( 
                 input_field_names="text",      # 输入：原始文本字段 	VARCHAR
@@ -119,6 +99,80 @@ class MilvusVectorSave:
         # 2.调用 embedding_function 将 page_content 转换成 dense 向量 存到你定义的 "dense" 字段
         self.vector_stored_saved.add_documents(documents)
 
+    def create_client(self, uri: str = MILVUS_URI):
+        """获取共享的原生 MilvusClient 用于直接写入已经计算好向量的数据 (不经过 langchain 的 embedding)"""
+        self.client = get_milvus_client(uri)
+
+    @staticmethod
+    def documents_to_rows(documents: List[Document], vectors: List[List[float]],
+                          dense_profile: Union[str, DenseProfile, None] = None) -> List[dict]:
+        """
+        把 Document 和预先计算好的稠密向量转换成符合 create_collection 中 schema 的行数据
+        sparse 字段由集合内置的 BM25 Function 在服务端根据 text 字段生成, 这里不需要提供;
+        client_sparse 集合的稀疏向量由解析进程预先计算好放在 metadata['sparse'] 中
+        :param documents: LangChain Document 列表
+        :param vectors: 与 documents 一一对应的稠密向量 应该基于截断到 TEXT_MAX_LENGTH 之后的 page_content 计算,
+                        否则超长文档的向量与写入的 text 不一致 (write_milvus 在解析阶段就已截断)
+        :param dense_profile: 与 create_collection 相同的 dense profile 向量按它截断维度/转换类型
+        :return: 可以直接传给 MilvusClient.insert 的行数据
+        """
+        if dense_profile is not None:
+            vectors = get_dense_profile(dense_profile).encode(vectors)
+        rows = []
+        for doc, vector in zip(documents, vectors):
+            row = {}
+            for field, default in SCALAR_FIELDS.items():
+                value = doc.metadata.get(field, default)
+                if value is None:
+                    value = default
+                if isinstance(default, str):
+                    value = str(value)[:VARCHAR_MAX_LENGTH]
+                else:
+                    value = int(value)
+                row[field] = value
+            row["text"] = doc.page_content[:TEXT_MAX_LENGTH]
+            row["dense"] = vector
+            if "sparse" in doc.metadata:
+                row["sparse"] = doc.metadata["sparse"]
+            rows.append(row)
+        return rows
+
+    def insert_rows(self, rows: List[dict], collection_name: str = COLLECTION_NAME):
+        """
+        用原生的 MilvusClient 写入行数据 (向量已在上游计算好)
+        :param rows: documents_to_rows 生成的行数据
+        :param collection_name: 集合名称
+        """
+        if self.client is None:
+            self.create_client()
+        return self.client.insert(collection_name=collection_name, data=rows)
+
+    @staticmethod
+    def source_filter(sources: List[str]) -> str:
+        """构造按 source 字段(原始文件路径)过滤的表达式 路径中的反斜杠和引号需要转义"""
+        return key_filter("source", sources)
+
+    def delete_by_sources(self, sources: List[str], collection_name: str = COLLECTION_NAME, batch_size: int = 100,
+                          sparse_stats: Optional[CorpusStats] = None):
+        """
+        删除指定源文件的所有 chunk 用于增量导入时清理已修改或已删除文件的旧数据
+        :param sources: 源文件路径列表 与 Document.metadata['source'] 一致
+        :param collection_name: 集合名称
+        :param batch_size: 每次删除的文件数 避免过滤表达式过长
+        :param sparse_stats: client_sparse 集合的 BM25 语料统计 删除前读回这些 chunk 的稀疏向量并从统计中扣除
+        以 source 为分区键的集合只访问这些文件所在的分区; 否则由 source 字段的标量索引定位
+        """
+        if self.client is None:
+            self.create_client()
+        for i in range(0, len(sources), batch_size):
+            part = sources[i:i + batch_size]
+            if sparse_stats is not None:
+                rows = self.client.query(collection_name=collection_name, filter=self.source_filter(part),
+                                         output_fields=["sparse"])
+                for row in rows:
+                    sparse_stats.remove(int(tid) for tid in (row.get("sparse") or {}))
+            self.client.delete(collection_name=collection_name, filter=self.source_filter(part))
+
 if __name__ == "__main__":
     file_path = r"E:\Workspace\ai\RAG\datas\md\tech_report_z7tx05vt.md"
     parser = MarkdownParser()
@@ -169,10 +223,8 @@ if __name__ == "__main__":
     # print("-----" * 10)
     # 基于向量字段进行向量查询
     query = "干法刻蚀"
-    query_vector = qwen_embeddings.embed_query(query)
-    search_params = {
-        "params": {"nprobe": 10}
-    }
+    query_vector = cached_query_embeddings(qwen_embeddings).embed_query(query)
+    search_params = default_policy.dense_search_params(limit=1)   # HNSW 索引使用 ef, nprobe 对 HNSW 无效
     vector_results = client.search(
         collection_name=COLLECTION_NAME,
         data=[query_vector],  # 查询向量
@@ -0,0 +1,192 @@
+import sys
+import os
+import re
+import hashlib
+from datetime import datetime
+from typing import Iterator, List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.documents import Document
+
+"""
+纯 Python 的 Markdown 元素解析器 作为 UnstructuredMarkdownLoader(mode="elements") 的轻量替代
+只识别我们需要的结构: 标题层级、段落、列表项、表格和代码块, 一次线性扫描产出元素,
+元素的 metadata(category/element_id/parent_id/category_depth/source/filename...) 与 unstructured 的输出保持一致,
+因此可以直接交给 MarkdownParser.merge_title_content 合并
+"""
+
+HEADING_RE = re.compile(r"^ {0,3}(#{1,6})[ \t]+(.*?)[ \t]*#*[ \t]*$")
+SETEXT_RE = re.compile(r"^ {0,3}(=+|-+)[ \t]*$")
+LIST_ITEM_RE = re.compile(r"^(\s*)(?:[-*+]|\d+[.)])[ \t]+(.*)$")
+FENCE_RE = re.compile(r"^ {0,3}(```|~~~)")
+HR_RE = re.compile(r"^ {0,3}([-*_])([ \t]*\1){2,}[ \t]*$")
+TABLE_RE = re.compile(r"^\s*\|")
+
+IMAGE_RE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+LINK_RE = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+EMPHASIS_RE = re.compile(r"(\*\*|__|~~|`)")
+HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.S)
+
+
+def strip_inline(text: str) -> str:
+    """去掉行内 Markdown 标记 只保留可读文本"""
+    text = IMAGE_RE.sub(r"\1", text)
+    text = LINK_RE.sub(r"\1", text)
+    text = EMPHASIS_RE.sub("", text)
+    return text.strip()
+
+
+class _ElementBuilder:
+    """负责生成元素 Document 并维护标题栈, 用来确定每个元素的 parent_id"""
+
+    def __init__(self, md_file_path: str):
+        self.base_metadata = {
+            "source": md_file_path,
+            "filename": os.path.basename(md_file_path),
+            "file_directory": os.path.dirname(md_file_path),
+            "filetype": "text/markdown",
+            "last_modified": datetime.fromtimestamp(os.path.getmtime(md_file_path)).isoformat(),
+        }
+        self.index = 0
+        self.title_stack: List[tuple] = []   # (标题级别, element_id)
+
+    def _element_id(self, text: str) -> str:
+        raw = f"{self.base_metadata['filename']}:{self.index}:{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _make(self, text: str, category: str, parent_id: Optional[str], depth: Optional[int]) -> Document:
+        metadata = dict(self.base_metadata)
+        metadata["category"] = category
+        metadata["element_id"] = self._element_id(text)
+        if parent_id is not None:
+            metadata["parent_id"] = parent_id
+        if depth is not None:
+            metadata["category_depth"] = depth
+        self.index += 1
+        return Document(page_content=text, metadata=metadata)
+
+    def title(self, text: str, level: int) -> Document:
+        # 弹出所有同级或更低级的标题 栈顶剩下的就是父标题
+        while self.title_stack and self.title_stack[-1][0] >= level:
+            self.title_stack.pop()
+        parent_id = self.title_stack[-1][1] if self.title_stack else None
+        document = self._make(text, "Title", parent_id, level - 1)   # unstructured 中一级标题的 depth 为 0
+        self.title_stack.append((level, document.metadata["element_id"]))
+        return document
+
+    def content(self, text: str, category: str, depth: Optional[int] = None) -> Document:
+        parent_id = self.title_stack[-1][1] if self.title_stack else None
+        return self._make(text, category, parent_id, depth)
+
+
+def iter_markdown_elements(md_file_path: str, encoding: str = "utf-8") -> Iterator[Document]:
+    """
+    逐行扫描 Markdown 文件 产出元素 Document
+    :param md_file_path: Markdown文件路径
+    :param encoding: 文件编码 默认utf-8
+    :return: 元素 Document 生成器 category 为 Title / NarrativeText / ListItem / Table
+    """
+    builder = _ElementBuilder(md_file_path)
+    with open(md_file_path, "r", encoding=encoding) as f:
+        text = HTML_COMMENT_RE.sub("", f.read())
+
+    paragraph: List[str] = []
+    list_item: List[str] = []
+    list_depth = 0
+    table: List[str] = []
+    fence: Optional[str] = None
+    code: List[str] = []
+
+    def flush_paragraph():
+        if paragraph:
+            content = strip_inline(" ".join(paragraph))
+            paragraph.clear()
+            if content:
+                yield builder.content(content, "NarrativeText")
+
+    def flush_list_item():
+        if list_item:
+            content = strip_inline(" ".join(list_item))
+            list_item.clear()
+            if content:
+                yield builder.content(content, "ListItem", list_depth)
+
+    def flush_table():
+        if table:
+            # 去掉表头分隔行 |---|---|, 所有单元格用空格连接 (与 unstructured 的 Table 文本一致)
+            rows = [row for row in table if not re.fullmatch(r"[\s|:\-]+", row)]
+            table.clear()
+            content = " ".join(" ".join(cell.strip() for cell in row.strip().strip("|").split("|")) for row in rows)
+            if content.strip():
+                yield builder.content(strip_inline(content), "Table")
+
+    def flush_all():
+        yield from flush_paragraph()
+        yield from flush_list_item()
+        yield from flush_table()
+
+    for line in text.splitlines():
+        # 代码块: 原样保留内容, 作为一个 NarrativeText
+        if fence is not None:
+            if line.strip().startswith(fence):
+                content = "\n".join(code).strip()
+                code.clear()
+                fence = None
+                if content:
+                    yield builder.content(content, "NarrativeText")
+            else:
+                code.append(line)
+            continue
+        fence_match = FENCE_RE.match(line)
+        if fence_match:
+            yield from flush_all()
+            fence = fence_match.group(1)
+            continue
+
+        if not line.strip():
+            yield from flush_all()
+            continue
+
+        heading = HEADING_RE.match(line)
+        if heading:
+            yield from flush_all()
+            title = strip_inline(heading.group(2))
+            if title:
+                yield builder.title(title, len(heading.group(1)))
+            continue
+
+        # Setext 标题: 段落只有一行, 下一行全是 = 或 -
+        if SETEXT_RE.match(line) and len(paragraph) == 1 and not list_item and not table:
+            title = strip_inline(paragraph.pop())
+            yield builder.title(title, 1 if line.strip().startswith("=") else 2)
+            continue
+
+        if HR_RE.match(line):
+            yield from flush_all()
+            continue
+
+        if TABLE_RE.match(line):
+            yield from flush_paragraph()
+            yield from flush_list_item()
+            table.append(line)
+            continue
+        yield from flush_table()
+
+        item = LIST_ITEM_RE.match(line)
+        if item:
+            yield from flush_paragraph()
+            yield from flush_list_item()
+            list_depth = len(item.group(1).expandtabs(4)) // 2
+            list_item.append(item.group(2))
+            continue
+        if list_item:
+            list_item.append(line.strip())   # 列表项的续行
+            continue
+
+        paragraph.append(line.strip().lstrip(">").strip())   # 引用块按普通段落处理
+
+    if code:
+        yield builder.content("\n".join(code).strip(), "NarrativeText")
+    yield from flush_all()
@@ -1,14 +1,18 @@
 import sys
 import os
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator, List, Optional, Tuple, Union
 # 添加上级目录到 Python 路径
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from llm_utils import qwen_embeddings, openai_embedding, llm
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from milvus_db import MilvusVectorSave
-from langchain.prompts import PromptTemplate
-from markdown_parser import MarkdownParser
+from langchain_core.documents import Document
+from langchain_core.prompts import PromptTemplate
+from answer_cache import SemanticAnswerCache, retrieval_scope
+from context_builder import ContextBuilder
+# llm / Milvus 相关的模块在用到时再导入, rag_server --stub 只依赖 langchain_core
 
 
 # Define the prompt template for generating AI responses
@@ -33,40 +37,234 @@ prompt = PromptTemplate(
     template=PROMPT_TEMPLATE, input_variables=["context", "question"]
 )
 
+@dataclass
+class RagResult:
+    """
+    run_chain / arun_chain 的结构化结果
+    answer 是答案的流式迭代器(异步接口返回异步迭代器), 只能消费一次; 消费完之后 text 为完整答案, timings 补齐生成阶段的耗时
+    """
+    question: str
+    source_docs: List[Document]
+    answer: Union[Iterator[str], AsyncIterator[str]]
+    timings: dict = field(default_factory=dict)   # retrieve_ms / first_token_ms / generate_ms / total_ms
+    from_cache: bool = False
+    text: str = ""
+    context_stats: dict = field(default_factory=dict)   # ContextBuilder 的统计 (节省的 token 数等)
+    scope: str = ""   # 检索范围 (answer_cache.retrieval_scope) 答案按范围缓存
+    question_vector: Optional[List[float]] = None   # 查找答案缓存时算出的问题向量 写入缓存时复用
+
+    def __iter__(self):
+        return iter(self.answer)
+
+    def get_text(self) -> str:
+        """消费完答案流 返回完整答案"""
+        for _ in self.answer:
+            pass
+        return self.text
+
+    def __aiter__(self):
+        return self.answer.__aiter__()
+
+    async def aget_text(self) -> str:
+        """异步消费完答案流 返回完整答案"""
+        async for _ in self.answer:
+            pass
+        return self.text
+
+
 class RagChain:
-    """自定义ragchain"""
+    """自定义ragchain 每个问题只检索一次, 检索到的文档同时交给调用方(引用/日志)和 prompt"""
+    def __init__(self, answer_cache: SemanticAnswerCache = None, chat_model=None, max_concurrency: int = 32,
+                 context_builder: ContextBuilder = None):
+        """
+        :param answer_cache: 语义答案缓存 相似问题命中时直接返回缓存的答案, 不再检索和调用 llm
+        :param context_builder: 上下文构建器 按 token 预算打包并去重检索结果; 不传则与 format_docs 一样直接拼接
+        :param chat_model: 生成答案的模型 默认使用 llm_utils.llm, 压测时可以换成假模型
+        :param max_concurrency: 异步接口同时处理的最大问题数 超出的请求在信号量上排队
+        """
+        self.answer_cache = answer_cache
+        self.context_builder = context_builder
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        if chat_model is None:
+            from llm_utils import llm
+            chat_model = llm
+        # 生成链只接收已经检索好的 context, 不再包含检索器
+        self.generate_chain = prompt | chat_model | StrOutputParser()
+
     @staticmethod
     def format_docs(docs):
         return "\n\n".join(doc.page_content for doc in docs)
-    
-    def run_chain(self, retrieval, question):
-        # 首先获取检索结果
-        retrieved_docs = retrieval.invoke(question)
-        
+
+    def build_context(self, result: RagResult) -> str:
+        """把检索到的文档整理成 prompt 的 context"""
+        if self.context_builder is None:
+            return RagChain.format_docs(result.source_docs)
+        packed = self.context_builder.build(result.source_docs)
+        result.context_stats = packed.stats
+        return packed.text
+
+    def _cached_result(self, question: str, cached: dict, start: float, scope: str) -> RagResult:
+        elapsed = (time.perf_counter() - start) * 1000
+        timings = {"retrieve_ms": 0.0, "first_token_ms": elapsed, "generate_ms": 0.0, "total_ms": elapsed,
+                   "cache_similarity": cached["similarity"]}
+        return RagResult(question=question, source_docs=cached["docs"], answer=iter([cached["answer"]]),
+                         timings=timings, from_cache=True, text=cached["answer"], scope=scope)
+
+    def _stream_answer(self, result: RagResult, start: float) -> Iterator[str]:
+        """流式生成答案 边产出边记录首字耗时, 结束后写入答案缓存"""
+        generate_start = time.perf_counter()
+        chunks = []
+        for chunk in self.generate_chain.stream(
+                {"context": self.build_context(result), "question": result.question}):
+            if not chunks:
+                result.timings["first_token_ms"] = (time.perf_counter() - start) * 1000
+            chunks.append(chunk)
+            yield chunk
+        end = time.perf_counter()
+        result.timings["generate_ms"] = (end - generate_start) * 1000
+        result.timings["total_ms"] = (end - start) * 1000
+        result.timings.setdefault("first_token_ms", result.timings["total_ms"])   # llm 没有产出任何片段
+        result.text = "".join(chunks)
+        if self.answer_cache is not None:
+            self.answer_cache.store(result.question, result.text, result.source_docs, vector=result.question_vector,
+                                    scope=result.scope)
+
+    def answer(self, retrieval, question: str, **search_kwargs) -> RagResult:
+        """
+        检索一次并返回结构化结果 答案以流的形式惰性生成
+        :param retrieval: 检索器 任意 LangChain Retriever / Runnable
+        :param question: 问题
+        :param search_kwargs: 传给 retrieval.invoke 的检索参数 例如 HybridRetriever 的 expr / partition_values / k
+        """
+        start = time.perf_counter()
+        scope = retrieval_scope(retrieval, **search_kwargs)
+        vector = None
+        if self.answer_cache is not None:
+            vector = self.answer_cache.embeddings.embed_query(question)
+            cached = self.answer_cache.lookup(question, vector=vector, scope=scope)
+            if cached is not None:
+                return self._cached_result(question, cached, start, scope)
+
+        source_docs = retrieval.invoke(question, **search_kwargs)
+        result = RagResult(question=question, source_docs=source_docs, answer=iter(()), scope=scope,
+                           question_vector=vector)
+        result.timings["retrieve_ms"] = (time.perf_counter() - start) * 1000
+        result.answer = self._stream_answer(result, start)
+        return result
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # 在事件循环中第一次使用时再创建
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _alookup_cache(self, question: str, scope: str) -> Tuple[Optional[dict], List[float]]:
+        """返回 (命中的缓存, 问题向量) 问题向量走异步接口; 查找会检查集合版本文件, 放到线程中执行"""
+        vector = await self.answer_cache.embeddings.aembed_query(question)
+        cached = await asyncio.to_thread(self.answer_cache.lookup, question, vector=vector, scope=scope)
+        return cached, vector
+
+    async def _astream_answer(self, result: RagResult, start: float) -> AsyncIterator[str]:
+        """_stream_answer 的异步版本"""
+        generate_start = time.perf_counter()
+        chunks = []
+        async for chunk in self.generate_chain.astream(
+                {"context": self.build_context(result), "question": result.question}):
+            if not chunks:
+                result.timings["first_token_ms"] = (time.perf_counter() - start) * 1000
+            chunks.append(chunk)
+            yield chunk
+        end = time.perf_counter()
+        result.timings["generate_ms"] = (end - generate_start) * 1000
+        result.timings["total_ms"] = (end - start) * 1000
+        result.timings.setdefault("first_token_ms", result.timings["total_ms"])   # llm 没有产出任何片段
+        result.text = "".join(chunks)
+        if self.answer_cache is not None:
+            await asyncio.to_thread(self.answer_cache.store, result.question, result.text, result.source_docs,
+                                    vector=result.question_vector, scope=result.scope)
+
+    async def _aiter_cached(self, text: str) -> AsyncIterator[str]:
+        yield text
+
+    async def aanswer(self, retrieval, question: str, **search_kwargs) -> RagResult:
+        """
+        answer 的异步版本 检索使用 retrieval.ainvoke, 生成使用 llm.astream
+        注意: 返回的结果不占用并发名额, 需要限流时使用 astream / arun_chain
+        """
+        start = time.perf_counter()
+        scope = retrieval_scope(retrieval, **search_kwargs)
+        vector = None
+        if self.answer_cache is not None:
+            cached, vector = await self._alookup_cache(question, scope)
+            if cached is not None:
+                result = self._cached_result(question, cached, start, scope)
+                result.answer = self._aiter_cached(cached["answer"])
+                return result
+
+        source_docs = await retrieval.ainvoke(question, **search_kwargs)
+        result = RagResult(question=question, source_docs=source_docs, answer=iter(()), scope=scope,
+                           question_vector=vector)
+        result.timings["retrieve_ms"] = (time.perf_counter() - start) * 1000
+        result.answer = self._astream_answer(result, start)
+        return result
+
+    async def astream(self, retrieval, question: str, **search_kwargs) -> AsyncIterator[Union[RagResult, str]]:
+        """
+        在并发限制内检索并流式生成
+        第一个产出的是 RagResult (包含检索到的文档, 用于引用), 之后依次产出答案片段
+        调用方取消任务或提前关闭生成器时, 底层的 llm 流会随之关闭并释放并发名额
+        """
+        async with self.semaphore:
+            result = await self.aanswer(retrieval, question, **search_kwargs)
+            yield result
+            stream = result.answer
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+
+    async def arun_chain(self, retrieval, question: str, **search_kwargs) -> RagResult:
+        """异步问答 在并发限制内完成检索和生成, 返回答案已经生成完毕的结果"""
+        async with self.semaphore:
+            result = await self.aanswer(retrieval, question, **search_kwargs)
+            await result.aget_text()
+            return result
+
+    def run_chain(self, retrieval, question, **search_kwargs) -> RagResult:
+        result = self.answer(retrieval, question, **search_kwargs)
+
         # 打印检索结果
-        print("🔍 检索结果:")
+        if result.from_cache:
+            print(f"💾 命中答案缓存 (相似度 {result.timings['cache_similarity']:.4f})")
+        else:
+            print("🔍 检索结果:")
         print("=" * 40)
-        for i, doc in enumerate(retrieved_docs, 1):
+        for i, doc in enumerate(result.source_docs, 1):
             print(f"文档片段 {i}:")
             print(f"内容: {doc.page_content}")
             print("-" * 30)
-        
-        # 构建RAG链
-        rag_chain = (
-            {"context": retrieval | RagChain.format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | llm
-            | StrOutputParser()
-        )
-        
+
         # 生成答案
         print("\n🤖 生成答案:")
-        # res = rag_chain.invoke(question)
-        # print(res)
-        for chunk in rag_chain.stream(question):
+        for chunk in result:
             print(chunk, end="", flush=True)
+        timings = result.timings
+        print(f"\n⏱ 检索 {timings['retrieve_ms']:.0f}ms, 首字 {timings['first_token_ms']:.0f}ms, "
+              f"生成 {timings['generate_ms']:.0f}ms, 总计 {timings['total_ms']:.0f}ms")
+        if result.context_stats:
+            stats = result.context_stats
+            print(f"📦 上下文 {stats['context_tokens']} tokens (原始 {stats['original_tokens']}, 节省 {stats['saved_tokens']}), "
+                  f"使用 {stats['chunks_used']}/{stats['chunks_in']} 个文档片段")
+        return result
 
 if __name__ == "__main__":
+    from milvus_db import MilvusVectorSave, rag_embeddings
+    from markdown_parser import MarkdownParser
+    from search_tool.hybrid_retriever import HybridRetriever
+
     # 1. 加载文档数据
     file_path = r"E:\Workspace\ai\RAG\datas\md\tech_report_z7tx05vt.md"
     parser = MarkdownParser()
@@ -79,18 +277,30 @@ if __name__ == "__main__":
     mv.add_documents(docs)
     print("文档已添加到向量数据库")
 
-    # 3. 创建 RAG 链并测试
-    rag = RagChain()
+    # 3. 创建 RAG 链并测试 问题向量与检索器共用查询缓存, 查答案缓存不会多调用一次 embedding
+    rag = RagChain(answer_cache=SemanticAnswerCache(rag_embeddings, threshold=0.95, ttl_seconds=3600),
+                   context_builder=ContextBuilder(max_tokens=3000))
     
-    # 4. 设置检索器 - 使用向量相似度搜索
-    retriever = mv.vector_stored_saved.as_retriever(
-        search_type="similarity",
-        search_kwargs={"k": 1}  # 返回最相似的1个文档块
-    )
+    # 4. 设置检索器 - 稠密向量 + BM25 混合检索, 复用 langchain Milvus 已经建立的客户端
+    use_hybrid = True
+    if use_hybrid:
+        retriever = HybridRetriever(
+            client=mv.vector_stored_saved.client,
+            embedding=rag_embeddings,   # 与 langchain Milvus 共用带缓存的 embedding
+            k=1,    # 返回最相关的1个文档块
+            output_fields=["text"],
+        )
+    else:
+        # 使用向量相似度搜索
+        retriever = mv.vector_stored_saved.as_retriever(
+            search_type="similarity",
+            search_kwargs={"k": 1}  # 返回最相似的1个文档块
+        )
     
     # 5. 测试问题
     test_questions = [
         "干法刻蚀的优势？",
+        "干法刻蚀有什么优势？",   # 与上一个问题语义相近, 预期命中答案缓存
     ]
     
     print("\n开始测试 RAG 系统:")
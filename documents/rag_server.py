@@ -0,0 +1,210 @@
+import sys
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.retrievers import BaseRetriever
+from rag_chain import RagChain, RagResult
+from utils.log_utils import log
+
+"""
+基于 asyncio 的本地 RAG 流式问答服务 (只依赖标准库, 用于联调和压测)
+POST /chat  {"question": "..."}  或  GET /chat?question=...
+返回 text/event-stream:
+    event: sources  检索到的文档
+    data: {"token": "..."}  答案片段 (多条)
+    event: done     耗时统计
+客户端断开连接时对应的检索/生成任务会被取消
+python documents/rag_server.py --port 8080            # 真实的 Milvus 混合检索 + llm
+python documents/rag_server.py --port 8080 --stub     # 假检索器 + 假模型 只压测服务本身
+"""
+
+
+class StubRetriever(BaseRetriever):
+    """压测用的假检索器 固定返回同样的文档, 用 sleep 模拟检索耗时"""
+
+    docs: List[Document]
+    latency_ms: float = 20.0
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        time.sleep(self.latency_ms / 1000)
+        return self.docs
+
+    async def _aget_relevant_documents(self, query: str, *,
+                                       run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self.docs
+
+
+def create_stub_chain(max_concurrency: int, token_delay_ms: float, retrieve_ms: float):
+    """假模型按字符流式输出, 每个字符间隔 token_delay_ms, 近似真实 llm 的首字和生成耗时"""
+    chat_model = FakeListChatModel(
+        responses=["干法刻蚀具有各向异性好、线宽控制精确、易于自动化等优势, 适合先进工艺的细线条图形转移。"],
+        sleep=token_delay_ms / 1000,
+    )
+    retriever = StubRetriever(
+        docs=[Document(page_content="干法刻蚀是利用等离子体进行薄膜刻蚀的技术。", metadata={"title": "干法刻蚀", "source": "stub"})],
+        latency_ms=retrieve_ms,
+    )
+    return RagChain(chat_model=chat_model, max_concurrency=max_concurrency), retriever
+
+
+def create_milvus_chain(max_concurrency: int):
+    from milvus_db import rag_embeddings
+    from search_tool.hybrid_retriever import HybridRetriever
+    retriever = HybridRetriever.from_uri(embedding=rag_embeddings, k=3)
+    return RagChain(max_concurrency=max_concurrency), retriever
+
+
+class RagServer:
+    """一个连接处理一个请求 (Connection: close), 每个请求在自己的任务中运行"""
+
+    def __init__(self, rag: RagChain, retriever, request_timeout: float = 120.0):
+        """
+        :param rag: RagChain 并发上限由 rag.max_concurrency 控制
+        :param retriever: 检索器
+        :param request_timeout: 单个请求的超时时间 秒 超时后取消生成
+        """
+        self.rag = rag
+        self.retriever = retriever
+        self.request_timeout = request_timeout
+        self.in_flight = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, path, params = request
+            if path == "/health":
+                await self._write_json(writer, 200, {"status": "ok", "in_flight": self.in_flight,
+                                                     "completed": self.completed, "cancelled": self.cancelled})
+            elif path == "/chat":
+                question = params.get("question")
+                if not question:
+                    await self._write_json(writer, 400, {"error": "缺少 question 参数"})
+                else:
+                    await self._serve_chat(reader, writer, question)
+            else:
+                await self._write_json(writer, 404, {"error": f"未知路径 {path}"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            log.exception("处理请求失败", exc_info=e)
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader: asyncio.StreamReader):
+        """解析请求行 请求头和请求体 返回 (method, path, params)"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(headers.get("content-length", 0))
+        if length:
+            body = await reader.readexactly(length)
+            params.update(json.loads(body.decode("utf-8")))
+        return method.upper(), url.path, params
+
+    @staticmethod
+    async def _write_json(writer: asyncio.StreamWriter, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} OK\r\nContent-Type: application/json; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+    @staticmethod
+    async def _send_event(writer: asyncio.StreamWriter, data: dict, event: Optional[str] = None):
+        message = f"event: {event}\n" if event else ""
+        message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        writer.write(message.encode("utf-8"))
+        await writer.drain()
+
+    async def _stream_answer(self, writer: asyncio.StreamWriter, question: str):
+        result: Optional[RagResult] = None
+        async for item in self.rag.astream(self.retriever, question):
+            if result is None:
+                result = item
+                sources = [{"title": d.metadata.get("title"), "source": d.metadata.get("source"),
+                            "content": d.page_content} for d in result.source_docs]
+                await self._send_event(writer, {"sources": sources, "from_cache": result.from_cache}, "sources")
+            else:
+                await self._send_event(writer, {"token": item})
+        await self._send_event(writer, {"timings": result.timings, "from_cache": result.from_cache}, "done")
+
+    async def _serve_chat(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, question: str):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+                     b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        await writer.drain()
+
+        # 生成任务和断开检测并行: 客户端先断开(读到 EOF)就取消生成, 释放并发名额和 llm 连接
+        self.in_flight += 1
+        stream_task = asyncio.create_task(self._stream_answer(writer, question))
+        disconnect_task = asyncio.create_task(reader.read(1))
+        try:
+            done, _ = await asyncio.wait({stream_task, disconnect_task}, timeout=self.request_timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if stream_task in done:
+                stream_task.result()
+                self.completed += 1
+                return
+            stream_task.cancel()
+            self.cancelled += 1
+            if not done:
+                log.warning(f"请求超时 ({self.request_timeout}s), 已取消: {question}")
+                await self._send_event(writer, {"error": "timeout"}, "error")
+        except Exception as e:
+            log.exception(f"问答失败: {question}", exc_info=e)
+            await self._send_event(writer, {"error": str(e)}, "error")
+        finally:
+            stream_task.cancel()
+            disconnect_task.cancel()
+            # 等被取消的任务真正结束: 生成器的清理 (关闭 llm 流 / 归还并发名额) 在这里完成, 不留下未结束的任务
+            await asyncio.gather(stream_task, disconnect_task, return_exceptions=True)
+            self.in_flight -= 1
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port)
+        log.info(f"RAG 服务已启动 http://{host}:{port}/chat, 并发上限 {self.rag.max_concurrency}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="本地 RAG 流式问答服务")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--max-concurrency", type=int, default=32, help="同时检索/生成的最大问题数")
+    arg_parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的超时时间 秒")
+    arg_parser.add_argument("--stub", action="store_true", help="使用假检索器和假模型")
+    arg_parser.add_argument("--token-delay-ms", type=float, default=10.0, help="假模型每个字符的输出间隔")
+    arg_parser.add_argument("--retrieve-ms", type=float, default=20.0, help="假检索器的检索耗时")
+    args = arg_parser.parse_args()
+
+    if args.stub:
+        rag, retriever = create_stub_chain(args.max_concurrency, args.token_delay_ms, args.retrieve_ms)
+    else:
+        rag, retriever = create_milvus_chain(args.max_concurrency)
+    asyncio.run(RagServer(rag, retriever, request_timeout=args.timeout).serve(args.host, args.port))
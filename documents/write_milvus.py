@@ -6,104 +6,448 @@ from numpy import doc
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from multiprocessing import Process, Queue
+from queue import Empty
+from concurrent.futures import ThreadPoolExecutor, Future
+import threading
 import time, os
+from typing import Optional
 from utils.log_utils import log
+from llm_utils import openai_embedding
+from utils.embedding_cache import CachedEmbeddings
 from markdown_parser import MarkdownParser
-from milvus_db_with_schema import MilvusVectorSave
+from milvus_db_with_schema import MilvusVectorSave, TEXT_MAX_LENGTH
+from utils.sparse_encoder import BM25SparseEncoder, CorpusStats, stats_path
+from ingest_manifest import IngestManifest
+from answer_cache import bump_collection_version
+from env_utils import COLLECTION_NAME
 # 采用多进程 分布式 的方式把海量的数据写入 Milvus 数据库 建立一个共享的队列(内部维护着数据的共享)，多个进程可以向队列里存/取数据
 
-def file_parser_process(dir_path: str, output_queue: Queue, batch_size: int = 20):
-    """进程1: 解析目录下所有的md文件并分批放入到队列中"""
-    log.info(f"文件解析进程启动，解析目录: {dir_path}")
-
-    # 获取目录下所有的md文件 使用 os.path.join() 将目录路径和文件名组合成完整的文件路径
-    md_files = [
+def list_markdown_files(dir_path: str) -> list[str]:
+    """获取目录下所有的md文件 使用 os.path.join() 将目录路径和文件名组合成完整的文件路径"""
+    return [
         os.path.join(dir_path, f)
         for f in os.listdir(dir_path)   # 遍历 dir_path 目录下的所有文件和文件夹的名称列表
         if f.endswith(".md")
     ]
 
-    if not md_files:
-        log.warning(f"目录 {dir_path} 下没有找到任何 Markdown 文件。")
-        output_queue.put(None)    # 发送结束信号
-        return
-    
-    parser = MarkdownParser()  # 将 doc 转化为 Document 对象
+
+def file_parser_process(worker_id: int, file_queue: Queue, output_queue: Queue, stats_queue: Queue, batch_size: int = 20,
+                        backend: str = "unstructured", chunk_strategy: str = "semantic", client_sparse: bool = False):
+    """
+    进程1(解析进程池中的一个worker): 从文件任务队列中领取md文件, 解析后分批放入到输出队列中
+    :param worker_id: worker编号 仅用于日志与统计
+    :param file_queue: 文件任务队列 每个元素是一个md文件路径, 收到 None 表示没有更多文件
+    :param output_queue: 所有解析worker共享的输出队列(扇入) embedding 进程从这里取数据
+    :param stats_queue: 统计队列 worker结束时放入本阶段的吞吐统计
+    :param batch_size: 每批次的 Document 数量
+    :param backend: MarkdownParser 的解析后端 "unstructured" 或 "native"
+    :param chunk_strategy: MarkdownParser 的切片策略 recursive / semantic / hybrid
+    :param client_sparse: 在解析进程中计算 BM25 稀疏向量 (metadata['sparse']), 本进程发出的所有 chunk 累计成一份语料统计增量,
+                          随统计信息发回主进程; 没有写入成功的 chunk 由主进程扣减
+    """
+    log.info(f"文件解析进程 {worker_id} 启动, 解析后端: {backend}")
+    start_time = time.time()
+    parser = MarkdownParser(backend=backend, chunk_strategy=chunk_strategy)  # 将 doc 转化为 Document 对象 每个worker各自持有一个解析器
+    sparse_encoder = BM25SparseEncoder() if client_sparse else None   # 平均文档长度取导入开始时的语料统计
+    sparse_delta = CorpusStats()   # 本进程发出的所有 chunk 的语料统计增量
 
     doc_batch = []    # 缓冲区 临时存储从 Markdown 文件解析出来的 Document 对象。
+    total_files = 0
+    total_docs = 0
+    parsed_files = []   # 解析成功的文件 用于更新增量导入清单
+    failed_sources = []   # 解析中途出错的文件 已经发出去的部分 chunk 会在导入结束后被清理
     # 典型的“流式批处理”模式
-    for file_path in md_files:
+    while True:
+        file_path = file_queue.get()  # 领取下一个文件 多个worker竞争同一个任务队列, 天然负载均衡
+        if file_path is None:
+            break
         try:
-            documents = parser.parse_markdown_to_documents(file_path)
-            if documents:
-                doc_batch.extend(documents)  # 将解析得到的 Document 对象添加到缓冲区 数组加到数组用 extend
+            # 流式解析: 一个标题的子树解析完就可以进入批次, 大文件不必等整个文件解析完
+            for document in parser.iter_documents(file_path):
+                # 在这里一次性截断到 text 字段的长度, 稠密向量 / 稀疏向量 / 写入的 text 都基于同一段文本
+                document.page_content = document.page_content[:TEXT_MAX_LENGTH]
+                if sparse_encoder is not None:
+                    document.metadata["sparse"] = sparse_encoder.encode_document(document.page_content, sparse_delta)
+                doc_batch.append(document)
+                total_docs += 1
 
-            # 如果缓冲区达到批量大小，则将其放入队列并清空缓冲区
-            if len(doc_batch) >= batch_size:
-                output_queue.put(doc_batch.copy())  # 放入队列时使用 copy 避免引用问题 把当前批次发走
-                doc_batch.clear()   # 清空缓冲区的所有批次数据 清空，准备下一批
-                log.info(f"已将 {batch_size} 个 Document 对象放入队列")
+                # 如果缓冲区达到批量大小，则将其放入队列并清空缓冲区
+                if len(doc_batch) >= batch_size:
+                    output_queue.put(doc_batch.copy())  # 放入队列时使用 copy 避免引用问题 把当前批次发走
+                    log.info(f"解析进程 {worker_id} 已将 {len(doc_batch)} 个 Document 对象放入队列")
+                    doc_batch.clear()   # 清空缓冲区的所有批次数据 清空，准备下一批
+            total_files += 1
+            parsed_files.append(file_path)
 
         except Exception as e:
+            failed_sources.append(file_path)
             log.exception(f"解析文件 {file_path} 时出错，上下文信息：文件大小={os.path.getsize(file_path)}字节, 当前批次大小={len(doc_batch)}", exc_info=e)
-    
+
     # 继续发送剩余的documents
     if doc_batch:
         output_queue.put(doc_batch)
-        log.info(f'解析完成，共处理 {len(md_files)} 个文件')
+    output_queue.put(None)    # 每个worker各自发送一个结束信号, 写入进程收齐所有信号后才退出
+
+    stats_queue.put({
+        "stage": "parser",
+        "worker": worker_id,
+        "files": total_files,
+        "parsed_files": parsed_files,
+        "failed_sources": failed_sources,
+        "docs": total_docs,
+        "seconds": time.time() - start_time,
+        "sparse_stats": sparse_delta.to_dict() if client_sparse else None,
+    })
+    log.info(f'解析进程 {worker_id} 完成，共处理 {total_files} 个文件, 得到 {total_docs} 个 Document 对象, '
+             f'语义切分 embedding 缓存命中率 {parser.embeddings.stats()["hit_rate"]:.1%}')
+
+
+def embedding_process(input_queue: Queue, output_queue: Queue, stats_queue: Queue, num_producers: int = 1,
+                      max_batch_chars: int = 20000, max_batch_size: int = 10, embed_workers: int = 4,
+                      dense_profile: Optional[str] = None):
+    """
+    进程2: 从文档队列中取出 Document, 按大小预算重新组批后并发调用 embed_documents,
+    把带有稠密向量的行数据放入写入队列。embedding 与 Milvus insert 解耦, 慢的 embedding 服务不会卡住数据库写入
+    :param input_queue: 解析worker共享的输出队列
+    :param output_queue: 写入队列 元素是可以直接 insert 的行数据列表
+    :param stats_queue: 统计队列
+    :param num_producers: 上游解析worker数量 收到同样数量的结束信号后才退出
+    :param max_batch_chars: 每个 embedding 批次的文本总字符数上限 (近似 token 预算)
+    :param max_batch_size: 每个 embedding 批次的最大文本条数 (很多 embedding 服务对单次请求条数有限制)
+    :param embed_workers: 并发的 embedding 请求数
+    :param dense_profile: 集合的 dense profile 向量写入前按它截断维度/转换为 float16 等 (documents/dense_profile.py)
+    """
+    log.info(f"Embedding 进程启动, 并发请求数: {embed_workers}, 批次上限: {max_batch_size} 条/{max_batch_chars} 字符")
+    start_time = time.time()
+    in_flight = threading.BoundedSemaphore(embed_workers)  # 在途 embedding 请求的令牌
+    lock = threading.Lock()
+    total_docs = 0
+    batch_latencies = []
+    failed_sources = set()   # 所在批次失败的源文件 不会被记入增量导入清单
+    failed_sparse = CorpusStats()   # 没有写入的 chunk 的语料统计 (client_sparse) 主进程从解析进程的增量中扣除
+    finished_producers = 0
+    embeddings = CachedEmbeddings(openai_embedding)   # 内容没有变化的 chunk 直接从磁盘缓存取向量
 
+    def embed_batch(documents: list):
+        batch_start = time.time()
+        vectors = embeddings.embed_documents([d.page_content for d in documents])
+        rows = MilvusVectorSave.documents_to_rows(documents, vectors, dense_profile)
+        return rows, time.time() - batch_start
 
-def milvus_write_process(input_queue: Queue):
-    """进程2: 从队列中获取数据并写入到 Milvus 数据库"""
-    log.info("Milvus 写入进程启动")
-    # 步骤1: 初始化 Milvus 连接
+    def on_done(future: Future, documents: list):
+        nonlocal total_docs
+        in_flight.release()
+        try:
+            rows, latency = future.result()
+        except Exception as e:
+            log.exception(f"计算 embedding 时出错, 当前批次大小={len(documents)}", exc_info=e)
+            with lock:
+                failed_sources.update(d.metadata.get("source", "") for d in documents)
+                for d in documents:
+                    if "sparse" in d.metadata:
+                        failed_sparse.add(d.metadata["sparse"].keys(), 0)
+            return
+        output_queue.put(rows)   # 写入队列满时在这里阻塞, 背压传递到 embedding 阶段
+        with lock:
+            total_docs += len(rows)
+            batch_latencies.append(latency)
+
+    with ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="embedder") as executor:
+        pending = []          # 正在组装的 embedding 批次
+        pending_chars = 0
+
+        def flush():
+            nonlocal pending, pending_chars
+            if not pending:
+                return
+            in_flight.acquire()   # 在途请求达到上限时阻塞
+            future = executor.submit(embed_batch, pending)
+            future.add_done_callback(lambda f, docs=pending: on_done(f, docs))
+            pending = []
+            pending_chars = 0
+
+        while True:
+            datas = input_queue.get()
+            if datas is None:
+                finished_producers += 1
+                log.info(f"Embedding 进程收到结束信号 ({finished_producers}/{num_producers})")
+                if finished_producers >= num_producers:
+                    break
+                continue
+
+            for document in datas:
+                size = len(document.page_content)
+                if pending and (pending_chars + size > max_batch_chars or len(pending) >= max_batch_size):
+                    flush()
+                pending.append(document)
+                pending_chars += size
+        flush()   # 发送最后一个不满的批次
+
+    output_queue.put(None)   # 所有 embedding 请求都已完成, 通知写入进程
+    cache_stats = embeddings.stats()
+    log.info(f"embedding 缓存命中 {cache_stats['hits']} 次, 未命中 {cache_stats['misses']} 次, 命中率 {cache_stats['hit_rate']:.1%}")
+    stats_queue.put({
+        "stage": "embedding",
+        "worker": 0,
+        "batches": len(batch_latencies),
+        "docs": total_docs,
+        "seconds": time.time() - start_time,
+        "latencies": batch_latencies,
+        "failed_sources": list(failed_sources),
+        "failed_sparse": failed_sparse.to_dict() if failed_sparse.num_docs else None,
+    })
+
+
+def milvus_write_process(input_queue: Queue, stats_queue: Queue, num_producers: int = 1, max_in_flight: int = 4):
+    """
+    进程3: 从写入队列中获取已经带有向量的行数据, 直接用 MilvusClient.insert 写入到 Milvus 数据库
+    写入由线程池并发执行, 同时最多有 max_in_flight 个批次在途(Milvus insert 是网络IO, 并发可以掩盖往返延迟)
+    在途批次达到上限时不再从队列取数据, 队列写满后上游进程自然阻塞, 形成背压
+    :param input_queue: embedding 进程的输出队列
+    :param stats_queue: 统计队列
+    :param num_producers: 上游进程数量 收到同样数量的结束信号后才退出
+    :param max_in_flight: 同时在途的最大批次数
+    """
+    log.info(f"Milvus 写入进程启动, 最大在途批次数: {max_in_flight}")
+    start_time = time.time()
+    # 步骤1: 初始化 Milvus 连接 所有写入线程共用同一个连接(pymilvus 的 gRPC 客户端是线程安全的)
     mv = MilvusVectorSave()
-    mv.create_connection()
-    log.info("Milvus 向量数据库vector_store已连接成功")
+    mv.create_client()
+    log.info("Milvus 客户端已连接成功")
+
+    in_flight = threading.BoundedSemaphore(max_in_flight)  # 在途批次的令牌
+    lock = threading.Lock()    # 保护下面的统计变量 回调函数在写入线程中执行
     total_docs = 0  # 统计总共写入的文档数量
+    batch_latencies = []   # 每个批次的写入耗时(秒)
+    failed_sources = set()   # 所在批次写入失败的源文件 不会被记入增量导入清单
+    failed_sparse = CorpusStats()   # 写入失败的 chunk 的语料统计 (client_sparse)
+    finished_producers = 0
 
-    # 步骤2: 不断从队列中获取数据并写入 Milvus
-    while True:
-        datas = input_queue.get()  # 从队列中获取数据 注意get是阻塞函数 (如果队列为空则等待)
-        if datas is None:  # 如果收到结束信号则退出循环
-            log.info("收到结束信号,Milvus 写入进程即将退出")
-            break
-        
-        if isinstance(datas, list) and datas:
+    def write_batch(datas: list):
+        batch_start = time.time()
+        mv.insert_rows(datas)
+        return len(datas), time.time() - batch_start
+
+    def on_done(future: Future, datas: list):
+        nonlocal total_docs
+        in_flight.release()   # 无论成功失败都要归还令牌
+        try:
+            count, latency = future.result()
+        except Exception as e:
+            log.exception(f"写入 Milvus 时出错, 当前批次大小={len(datas)}", exc_info=e)
+            with lock:
+                failed_sources.update(row.get("source", "") for row in datas)
+                for row in datas:
+                    if "sparse" in row:
+                        failed_sparse.add(row["sparse"].keys(), 0)
+            return
+        with lock:
+            total_docs += count
+            batch_latencies.append(latency)
+            current_total = total_docs
+        log.info(f"已写入 {count} 个 Document 对象到 Milvus, 批次耗时 {latency:.2f} 秒, 当前总计写入 {current_total} 个")
+
+    # 步骤2: 不断从队列中获取数据并提交到写入线程池
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="milvus-writer") as executor:
+        while True:
+            in_flight.acquire()   # 在途批次达到上限时在这里阻塞, 不再从队列取数据
+            datas = input_queue.get()  # 从队列中获取数据 注意get是阻塞函数 (如果队列为空则等待)
+            if datas is None:  # 收到某个上游进程的结束信号
+                in_flight.release()
+                finished_producers += 1
+                log.info(f"收到结束信号 ({finished_producers}/{num_producers})")
+                if finished_producers >= num_producers:  # 所有解析worker都结束了才退出循环
+                    log.info("上游进程均已结束, 等待在途批次写入完成后 Milvus 写入进程退出")
+                    break
+                continue
+
+            if isinstance(datas, list) and datas:
+                future = executor.submit(write_batch, datas)
+                future.add_done_callback(lambda f, rows=datas: on_done(f, rows))
+            else:
+                in_flight.release()
+
+    stats_queue.put({
+        "stage": "writer",
+        "worker": 0,
+        "batches": len(batch_latencies),
+        "docs": total_docs,
+        "seconds": time.time() - start_time,
+        "latencies": batch_latencies,
+        "failed_sources": list(failed_sources),
+        "failed_sparse": failed_sparse.to_dict() if failed_sparse.num_docs else None,
+    })
+
+
+def collect_stats(stats_queue: Queue, processes: list, poll_seconds: float = 1.0) -> list[dict]:
+    """
+    每个进程结束前向统计队列放入一条统计 在 join 之前逐条取出
+    子进程退出时要等队列中的数据全部写进管道, 统计较大 (解析成功的文件列表 / 语料统计增量) 而主进程先 join 不读的话,
+    子进程会卡在退出阶段, join 永远不返回
+    :param processes: 所有会放入统计的进程 每个进程一条
+    """
+    stats = []
+    while len(stats) < len(processes):
+        try:
+            stats.append(stats_queue.get(timeout=poll_seconds))
+        except Empty:
+            if any(p.is_alive() for p in processes):
+                continue
+            # 进程都已退出 它们的统计已经在管道中; 仍然取不到说明有进程没有放入统计就异常退出了
             try:
-                mv.add_documents(datas)
-                total_docs += len(datas)
-                log.info(f"已写入 {len(datas)} 个 Document 对象到 Milvus, 当前总计写入 {total_docs} 个")
-            except Exception as e:
-                log.exception(f"写入 Milvus 时出错, 当前批次大小={len(datas)}", exc_info=e)
+                stats.append(stats_queue.get(timeout=poll_seconds))
+            except Empty:
+                log.error(f"只收到 {len(stats)}/{len(processes)} 条统计, 有进程异常退出: "
+                          f"{[p.name for p in processes if p.exitcode]}")
+                break
+    return stats
+
+
+def log_stage_summary(stats: list[dict]):
+    """按阶段汇总各worker的吞吐统计并打印"""
+    stages = {}
+    for item in stats:
+        stages.setdefault(item["stage"], []).append(item)
+
+    for stage, items in stages.items():
+        docs = sum(i.get("docs", 0) for i in items)
+        files = sum(i.get("files", 0) for i in items)
+        # 同一阶段的worker是并行的, 用最慢的worker耗时作为该阶段的墙钟时间
+        seconds = max(i["seconds"] for i in items) or 1e-9
+        msg = f"[{stage}] worker数={len(items)}, 耗时={seconds:.2f}秒, Document={docs} ({docs / seconds:.1f} 个/秒)"
+        if files:
+            msg += f", 文件={files} ({files / seconds:.2f} 个/秒)"
+        latencies = sorted(t for i in items for t in i.get("latencies", []))
+        if latencies:
+            p50 = latencies[len(latencies) // 2]
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            msg += f", 批次延迟 p50={p50:.2f}秒 p95={p95:.2f}秒 max={latencies[-1]:.2f}秒"
+        log.info(msg)
+        for i in sorted(items, key=lambda x: x["worker"]):
+            log.debug(f"[{stage}] worker {i['worker']}: 文件={i.get('files', 0)}, Document={i.get('docs', 0)}, 耗时={i['seconds']:.2f}秒")
 
 
 if __name__ == '__main__':
     start_time = time.time()
     md_dir = r"E:\Workspace\ai\RAG\datas\md"         # 当然如果需要转化pdf 可以写一个 pdf_parser.py
     queue_maxsize = 20   # 队列最大长度，防止内存占用过高
+    num_parsers = max(1, (os.cpu_count() or 2) - 1)   # 解析进程数量 默认留一个核给写入进程
+    batch_size = 20
+    parser_backend = "unstructured"   # 解析后端 "native" 为纯 Python 的轻量解析器
+    chunk_strategy = "semantic"   # 切片策略 "recursive" 不需要网络请求, "hybrid" 只对没有结构边界的长段落做语义切分
+    max_in_flight = 4    # 写入进程同时在途的批次数
+    embed_workers = 4    # embedding 进程同时在途的请求数
+    incremental = True   # 增量导入: 只处理新增/变化的文件; False 则删除集合全量重建
+    dense_profile = "fp32_hnsw"   # dense 字段的存储/索引方案 float16 / 量化索引 / 维度截断见 documents/dense_profile.py
+    client_sparse = False   # True: 稀疏向量在解析进程中计算 (utils/sparse_encoder.py), 集合不使用服务端 BM25 Function
+    partition_key = None    # 例如 "source": 按文件分区, 检索可以按文件路由, 增量导入删除旧数据只访问对应分区; 只在建表时生效
+    manifest_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 "cache", f"ingest_manifest_{COLLECTION_NAME}.json")
 
+    md_files = list_markdown_files(md_dir)
+    if not md_files:
+        log.warning(f"目录 {md_dir} 下没有找到任何 Markdown 文件。")
 
     mv = MilvusVectorSave()
-    mv.create_collection(is_first=True)  # 建表
+    manifest = IngestManifest(manifest_path)
+    # 客户端 BM25 的语料统计 由主进程维护: 删除旧数据时扣减, 解析进程结束后合并各自的增量
+    sparse_stats = CorpusStats.load(stats_path(COLLECTION_NAME)) if client_sparse else None
+    if incremental:
+        mv.create_collection(is_first=False, client_sparse=client_sparse, dense_profile=dense_profile,
+                             partition_key=partition_key)  # 集合已存在时保留
+        new_files, changed_files, removed_files = manifest.diff(md_files)
+        # 先删除已修改/已删除文件的旧 chunk, 再只导入新增和变化的文件
+        stale_files = changed_files + removed_files
+        if stale_files:
+            mv.delete_by_sources(stale_files, sparse_stats=sparse_stats)
+            log.info(f"已从 Milvus 删除 {len(stale_files)} 个已修改/已删除文件的旧数据")
+        for removed_file in removed_files:
+            manifest.remove(removed_file)
+        manifest.save()
+        md_files = new_files + changed_files
+    else:
+        mv.create_collection(is_first=True, client_sparse=client_sparse, dense_profile=dense_profile,
+                             partition_key=partition_key)  # 建表
+        manifest.entries = {}
+        sparse_stats = CorpusStats() if client_sparse else None
+    if sparse_stats is not None:
+        sparse_stats.save(stats_path(COLLECTION_NAME))   # 解析进程启动时读取, 用于文档长度归一化
 
-    # 创建进程间通信的队列
+    # 文件任务队列: 放入所有md文件 再为每个解析worker放一个结束信号
+    num_parsers = max(1, min(num_parsers, len(md_files)))
+    file_queue = Queue()
+    for md_file in md_files:
+        file_queue.put(md_file)
+    for _ in range(num_parsers):
+        file_queue.put(None)
+
+    # 创建进程间通信的队列 所有解析worker扇入到同一个队列
     docs_queue = Queue(maxsize=queue_maxsize)
+    rows_queue = Queue(maxsize=queue_maxsize)   # embedding 进程 -> 写入进程
+    stats_queue = Queue()
+
+    # 进程1： 创建并启动文件解析进程池
+    parser_processes = [
+        Process(target=file_parser_process, args=(i, file_queue, docs_queue, stats_queue, batch_size, parser_backend, chunk_strategy, client_sparse), name=f"parser-{i}")
+        for i in range(num_parsers)
+    ]
 
-    # 进程1： 创建并启动文件解析进程
-    parser_process = Process(target=file_parser_process, args=(md_dir, docs_queue, 20))
+    # 进程2： 创建并启动 embedding 进程
+    embed_process = Process(
+        target=embedding_process,
+        args=(docs_queue, rows_queue, stats_queue, num_parsers),
+        kwargs={"embed_workers": embed_workers, "dense_profile": dense_profile},
+        name="embedder",
+    )
 
-    # 进程2： 创建并启动 Milvus 写入进程
-    write_process = Process(target=milvus_write_process, args=(docs_queue,))
+    # 进程3： 创建并启动 Milvus 写入进程
+    write_process = Process(target=milvus_write_process, args=(rows_queue, stats_queue, 1, max_in_flight), name="writer")
 
-    parser_process.start()
+    for p in parser_processes:
+        p.start()
+    embed_process.start()
     write_process.start()
-        
-    # 等待解析进程结束
-    parser_process.join()
-    log.info("文件解析进程已结束")
+
+    # 先取完每个进程的统计再 join, 否则统计较大时子进程无法退出
+    stats = collect_stats(stats_queue, parser_processes + [embed_process, write_process])
+    for p in parser_processes:
+        p.join()
+    log.info(f"{num_parsers} 个文件解析进程已结束")
+    embed_process.join()
+    log.info("Embedding 进程已结束")
     write_process.join()
     log.info("Milvus 写入进程已结束")
+    log_stage_summary(stats)
+
+    # 更新增量导入清单: 只记录解析成功且所在批次全部写入成功的文件
+    failed = set()
+    for item in stats:
+        failed.update(item.get("failed_sources", []))
+    recorded = 0
+    for item in stats:
+        for file_path in item.get("parsed_files", []):
+            if file_path not in failed:
+                manifest.update(file_path)
+                recorded += 1
+    manifest.save()
+    if sparse_stats is not None:
+        # 解析进程的增量包含所有发出的 chunk, 扣掉 embedding / 写入失败而没有进入 Milvus 的部分
+        for item in stats:
+            if item.get("sparse_stats"):
+                sparse_stats.merge(item["sparse_stats"])
+        for item in stats:   # 失败 chunk 的长度未知, 合并完再按平均长度扣减
+            if item.get("failed_sparse"):
+                sparse_stats.subtract(item["failed_sparse"])
+    if failed:
+        # 流式导入时失败文件可能已经写入了一部分 chunk, 删掉以免下次重试时产生重复数据
+        # 已经写入的 chunk 计入了上面的增量, 删除时读回稀疏向量一并扣减
+        mv.delete_by_sources(list(failed), sparse_stats=sparse_stats)
+    if sparse_stats is not None:
+        sparse_stats.save(stats_path(COLLECTION_NAME))
+        log.info(f"BM25 语料统计已更新: {sparse_stats.num_docs} 篇文档, {len(sparse_stats.df)} 个词")
+    log.info(f"导入清单已更新, 本次记录 {recorded} 个文件, {len(failed)} 个文件导入失败将在下次重试")
 
     end_time = time.time()
-    log.info(f"所有进程已结束, 总耗时: {end_time - start_time:.2f} 秒")
\ No newline at end of file
+    log.info(f"所有进程已结束, 总耗时: {end_time - start_time:.2f} 秒")
+    # 集合数据已经变化 更新版本号, 让 RagChain 的答案缓存失效
+    bump_collection_version(COLLECTION_NAME)
@@ -0,0 +1,309 @@
+import sys
+import os
+import asyncio
+from typing import Any, List, Optional, Tuple, Union
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymilvus import AnnSearchRequest, RRFRanker, WeightedRanker
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import RunnableConfig
+from pydantic import ConfigDict
+from env_utils import COLLECTION_NAME, MILVUS_URI
+from llm_utils import openai_embedding
+from utils.embedding_cache import cached_query_embeddings
+from utils.milvus_connection import get_milvus_client
+from search_tool.reranker import Reranker
+from search_tool.search_params import SearchParamPolicy, SearchParams
+from utils.sparse_encoder import BM25SparseEncoder
+from documents.dense_profile import DenseProfile
+from documents.collection_profile import CollectionProfile, and_filters, key_filter, load_profile
+"""
+稠密向量 + BM25 稀疏向量的混合检索器
+把 test_sparse_search.my_hybird_search 里的实验代码整理成 LangChain 的 BaseRetriever,
+可以直接作为 RagChain.run_chain 的 retrieval 使用, 支持 invoke / ainvoke / batch / abatch
+设置 reranker 后每一路召回 candidate_limit 个候选, 融合排序后全部交给重排序器, 最终只保留 k 个
+集合配置了分区键 (collection profile 的 partition) 时, 检索传入 partition_values 即可只访问这些取值所在的分区,
+例如 retriever.invoke(question, partition_values=["a.md"]); 分区键条件和 expr 一起作为过滤条件下推到 Milvus
+"""
+
+DEFAULT_OUTPUT_FIELDS = ["text", "category", "category_depth", "title", "filename", "source"]
+
+
+class HybridRetriever(BaseRetriever):
+    """基于 Milvus hybrid_search 的混合检索器 整个生命周期复用同一个 MilvusClient"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    client: Any                              # MilvusClient 建议通过 utils.milvus_connection.get_milvus_client 获取
+    embedding: Embeddings                    # 用于生成查询的稠密向量 建议用 cached_query_embeddings 包装
+    collection_name: str = COLLECTION_NAME
+    dense_field: str = "dense"
+    sparse_field: str = "sparse"
+    text_field: str = "text"
+    output_fields: List[str] = DEFAULT_OUTPUT_FIELDS
+    k: int = 5                               # 融合排序后返回的文档数
+    candidate_limit: int = 10                # 每一路检索召回的候选数
+    expr: Optional[str] = None               # 标量过滤表达式 例如 'category == "TitleWithContent" && category_depth > 1'
+    ranker: str = "rrf"                      # 融合方式 "rrf" 或 "weighted"
+    rrf_k: int = 100                         # RRF 的平滑参数
+    weights: Tuple[float, float] = (0.7, 0.3)   # weighted 融合时 稠密/稀疏 两路的权重
+    dense_param: dict = {"ef": 64}           # HNSW 索引的搜索参数 未设置 search_policy 时使用
+    sparse_param: dict = {"drop_ratio_search": 0.2}
+    search_policy: Optional[SearchParamPolicy] = None   # 检索参数策略 按召回率目标/延迟 SLA 选择 ef 和 drop_ratio_search
+    recall_target: Optional[float] = None    # 默认的召回率目标 可以在每次检索时覆盖
+    latency_sla_ms: Optional[float] = None   # 默认的检索延迟 SLA 毫秒
+    max_batch_size: int = 64                 # 批量检索时单次 embedding / hybrid_search 请求的最大查询数
+    reranker: Optional[Reranker] = None      # 可选的重排序阶段 见 search_tool/reranker.py
+    dense_profile: Optional[DenseProfile] = None      # 集合使用 float16 / 量化索引 / 维度截断时 与建表时的 profile 一致
+    sparse_encoder: Optional[BM25SparseEncoder] = None   # client_sparse 集合: 查询在客户端编码为 idf 稀疏向量
+    partition_key: Optional[str] = None      # 集合的分区键字段 设置后可以按 partition_values 路由到对应分区
+    partition_names: Optional[List[str]] = None   # 手动创建分区 (create_partition) 的集合 只检索这些分区
+
+    @classmethod
+    def from_uri(cls, uri: str = MILVUS_URI, embedding: Optional[Embeddings] = None, **kwargs) -> "HybridRetriever":
+        """使用共享的 MilvusClient 构建检索器 默认使用带查询缓存的 openai_embedding"""
+        embedding = embedding or cached_query_embeddings(openai_embedding)
+        return cls(client=get_milvus_client(uri), embedding=embedding, **kwargs)
+
+    @classmethod
+    def from_profile(cls, profile: Union[str, CollectionProfile] = "rag_chunks", uri: str = MILVUS_URI,
+                     embedding: Optional[Embeddings] = None, **kwargs) -> "HybridRetriever":
+        """按 collection profile 设置集合名 / 向量字段 / dense profile / 分区键, kwargs 优先"""
+        profile = load_profile(profile) if isinstance(profile, str) else profile
+        settings = {"collection_name": profile.collection_name, "dense_field": profile.dense_field,
+                    "dense_profile": profile.dense(), "partition_key": profile.partition_key}
+        if profile.bm25:
+            settings["sparse_field"] = profile.bm25["output_field"]
+        return cls.from_uri(uri, embedding, **{**settings, **kwargs})
+
+    def route_expr(self, expr: Optional[str] = None, partition_values: Optional[list] = None) -> Optional[str]:
+        """
+        合成本次检索的过滤条件
+        :param expr: 标量过滤表达式 默认使用 self.expr
+        :param partition_values: 分区键的取值 只检索这些取值所在的分区
+        """
+        expr = expr if expr is not None else self.expr
+        if not partition_values:
+            return expr
+        if not self.partition_key:
+            raise ValueError("按分区检索需要设置 partition_key (集合的分区键字段)")
+        return and_filters(key_filter(self.partition_key, partition_values), expr)
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        # 带查询缓存时只有未命中的查询会发给 embedding 服务
+        embed_queries = getattr(self.embedding, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(queries)
+        return self.embedding.embed_documents(queries)
+
+    async def _aembed_queries(self, queries: List[str]) -> List[List[float]]:
+        # 与 _aget_relevant_documents 一样走查询接口, 带查询缓存时命中的查询不再请求 embedding 服务
+        aembed_queries = getattr(self.embedding, "aembed_queries", None)
+        if aembed_queries is not None:
+            return await aembed_queries(queries)
+        return list(await asyncio.gather(*(self.embedding.aembed_query(q) for q in queries)))
+
+    def resolve_params(self, k: Optional[int] = None, recall_target: Optional[float] = None,
+                       latency_sla_ms: Optional[float] = None) -> SearchParams:
+        """
+        决定本次检索的 ef / drop_ratio_search / 每一路召回数
+        :param recall_target: 召回率目标 两者都不传时使用 self.recall_target / self.latency_sla_ms
+        :param latency_sla_ms: 延迟 SLA 毫秒
+        """
+        k = k or self.k
+        if self.search_policy is None:
+            limit = max(k, self.candidate_limit)
+            dense_param = dict(self.dense_param)
+            if "ef" in dense_param:
+                dense_param["ef"] = max(dense_param["ef"], limit)   # HNSW 要求 ef >= limit
+            return SearchParams(dense_param=dense_param, sparse_param=self.sparse_param, candidate_limit=limit)
+        if recall_target is None and latency_sla_ms is None:
+            recall_target, latency_sla_ms = self.recall_target, self.latency_sla_ms
+        return self.search_policy.resolve(k=k, candidate_limit=self.candidate_limit,
+                                          recall_target=recall_target, latency_sla_ms=latency_sla_ms)
+
+    def build_requests(self, query_vectors: List[List[float]], queries: List[str],
+                       expr: Optional[str] = None, params: Optional[SearchParams] = None) -> List[AnnSearchRequest]:
+        """
+        构建稠密和稀疏两路检索请求
+        :param query_vectors: 查询的稠密向量
+        :param queries: 查询原文 稀疏字段由服务端的 BM25 Function 对原文分词; 设置了 sparse_encoder 时在客户端编码
+        :param expr: 标量过滤表达式 默认使用 self.expr
+        :param params: 检索参数 默认由 resolve_params 决定
+        """
+        expr = expr if expr is not None else self.expr
+        params = params or self.resolve_params()
+        profile = self.dense_profile
+        request_dense = AnnSearchRequest(
+            data=profile.encode(query_vectors) if profile else query_vectors,
+            anns_field=self.dense_field,
+            param=profile.dense_param(params.dense_param) if profile else params.dense_param,
+            limit=params.candidate_limit,
+            expr=expr,
+        )
+        request_sparse = AnnSearchRequest(
+            data=self.sparse_encoder.encode_queries(queries) if self.sparse_encoder else queries,
+            anns_field=self.sparse_field,
+            param=params.sparse_param,
+            limit=params.candidate_limit,
+            expr=expr,
+        )
+        return [request_dense, request_sparse]
+
+    def build_ranker(self):
+        if self.ranker == "rrf":
+            return RRFRanker(self.rrf_k)
+        if self.ranker == "weighted":
+            return WeightedRanker(*self.weights)
+        raise ValueError(f"不支持的融合方式: {self.ranker}, 可选值: rrf / weighted")
+
+    def hybrid_search(self, query_vectors: List[List[float]], queries: List[str], expr: Optional[str] = None,
+                      k: Optional[int] = None, recall_target: Optional[float] = None,
+                      latency_sla_ms: Optional[float] = None, partition_values: Optional[list] = None) -> list:
+        """执行混合检索 返回 Milvus 原始结果 (每个查询一组 hits)"""
+        params = self.resolve_params(k, recall_target, latency_sla_ms)
+        return self.client.hybrid_search(
+            collection_name=self.collection_name,
+            reqs=self.build_requests(query_vectors, queries, self.route_expr(expr, partition_values), params),
+            ranker=self.build_ranker(),
+            limit=k or self.k,
+            output_fields=self.output_fields,
+            partition_names=self.partition_names,
+        )
+
+    def hits_to_documents(self, hits) -> List[Document]:
+        """把一组 hits 转换成 Document text 字段作为 page_content, 其余输出字段和得分放到 metadata"""
+        documents = []
+        for hit in hits:
+            entity = dict(hit.get("entity", {}))
+            page_content = entity.pop(self.text_field, "")
+            entity["id"] = hit.get("id")
+            entity["score"] = hit.get("distance")
+            documents.append(Document(page_content=page_content, metadata=entity))
+        return documents
+
+    def _fetch_limit(self, k: Optional[int]) -> int:
+        # 有重排序时多召回候选 重排后再截断到 k
+        k = k or self.k
+        return max(k, self.candidate_limit) if self.reranker is not None else k
+
+    def _rerank(self, queries: List[str], documents_per_query: List[List[Document]],
+                k: Optional[int]) -> List[List[Document]]:
+        if self.reranker is None:
+            return documents_per_query
+        return self.reranker.rerank_batch(queries, documents_per_query, top_k=k or self.k)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun,
+                                expr: Optional[str] = None, k: Optional[int] = None,
+                                recall_target: Optional[float] = None, latency_sla_ms: Optional[float] = None,
+                                partition_values: Optional[list] = None) -> List[Document]:
+        query_vector = self.embedding.embed_query(query)
+        results = self.hybrid_search([query_vector], [query], expr=expr, k=self._fetch_limit(k),
+                                     recall_target=recall_target, latency_sla_ms=latency_sla_ms,
+                                     partition_values=partition_values)
+        return self._rerank([query], [self.hits_to_documents(results[0])], k)[0]
+
+    def search_batch(self, queries: List[str], expr: Optional[str] = None, k: Optional[int] = None,
+                     recall_target: Optional[float] = None, latency_sla_ms: Optional[float] = None,
+                     partition_values: Optional[list] = None) -> List[List[Document]]:
+        """
+        批量检索: 一次 embed_documents 计算所有查询的向量, 一次多向量 hybrid_search 检索, 再按查询拆分结果
+        超过 max_batch_size 的查询会分成多次请求
+        :param queries: 查询列表
+        :param partition_values: 整批查询共用的分区键取值
+        :return: 与 queries 一一对应的 Document 列表
+        """
+        results = []
+        for i in range(0, len(queries), self.max_batch_size):
+            part = queries[i:i + self.max_batch_size]
+            query_vectors = self._embed_queries(part)
+            batch_hits = self.hybrid_search(query_vectors, part, expr=expr, k=self._fetch_limit(k),
+                                            recall_target=recall_target, latency_sla_ms=latency_sla_ms,
+                                            partition_values=partition_values)
+            results.extend(self._rerank(part, [self.hits_to_documents(hits) for hits in batch_hits], k))
+        return results
+
+    async def asearch_batch(self, queries: List[str], expr: Optional[str] = None, k: Optional[int] = None,
+                            recall_target: Optional[float] = None, latency_sla_ms: Optional[float] = None,
+                            partition_values: Optional[list] = None) -> List[List[Document]]:
+        """search_batch 的异步版本"""
+        results = []
+        for i in range(0, len(queries), self.max_batch_size):
+            part = queries[i:i + self.max_batch_size]
+            query_vectors = await self._aembed_queries(part)
+            batch_hits = await asyncio.to_thread(self.hybrid_search, query_vectors, part, expr, self._fetch_limit(k),
+                                                 recall_target, latency_sla_ms, partition_values)
+            documents = [self.hits_to_documents(hits) for hits in batch_hits]
+            results.extend(await asyncio.to_thread(self._rerank, part, documents, k))
+        return results
+
+    def batch(self, inputs: List[str], config: Optional[RunnableConfig | List[RunnableConfig]] = None, *,
+              return_exceptions: bool = False, **kwargs: Any) -> List[List[Document]]:
+        """重写 Runnable.batch: 不再逐个查询并发调用, 而是合并成一次批量检索"""
+        try:
+            return self.search_batch(list(inputs), **kwargs)
+        except Exception as e:
+            if return_exceptions:
+                return [e] * len(inputs)
+            raise
+
+    async def abatch(self, inputs: List[str], config: Optional[RunnableConfig | List[RunnableConfig]] = None, *,
+                     return_exceptions: bool = False, **kwargs: Any) -> List[List[Document]]:
+        try:
+            return await self.asearch_batch(list(inputs), **kwargs)
+        except Exception as e:
+            if return_exceptions:
+                return [e] * len(inputs)
+            raise
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun,
+                                       expr: Optional[str] = None, k: Optional[int] = None,
+                                       recall_target: Optional[float] = None, latency_sla_ms: Optional[float] = None,
+                                       partition_values: Optional[list] = None) -> List[Document]:
+        query_vector = await self.embedding.aembed_query(query)
+        # pymilvus 的同步客户端放到线程中执行, 不阻塞事件循环
+        results = await asyncio.to_thread(self.hybrid_search, [query_vector], [query], expr, self._fetch_limit(k),
+                                          recall_target, latency_sla_ms, partition_values)
+        documents = self.hits_to_documents(results[0])
+        return (await asyncio.to_thread(self._rerank, [query], [documents], k))[0]
+
+
+if __name__ == "__main__":
+    from utils.embedding_cache import CachedEmbeddings
+    from search_tool.reranker import FusionReranker
+
+    retriever = HybridRetriever.from_uri(
+        expr='category == "TitleWithContent" && category_depth > 1',
+        k=5,
+    )
+    for i, doc in enumerate(retriever.invoke("湿法刻蚀的优势"), 1):
+        print(f"结果 {i}: score={doc.metadata['score']:.4f} title={doc.metadata.get('title')}")
+        print(doc.page_content)
+        print("-----" * 10)
+
+    # 按召回率目标选择检索参数 有标定结果时使用 benchmarks/calibrate_search_params.py 的实测数据
+    policy_retriever = HybridRetriever.from_uri(k=5, search_policy=SearchParamPolicy.load(), recall_target=0.95)
+    print(f"召回率目标 0.95 的检索参数: {policy_retriever.resolve_params()}")
+    policy_retriever.invoke("湿法刻蚀的优势", latency_sla_ms=20)   # 单次检索按延迟 SLA 覆盖
+
+    # 多召回候选后重排序 只保留最相关的 3 个
+    reranking_retriever = HybridRetriever.from_uri(
+        k=3,
+        candidate_limit=20,
+        reranker=FusionReranker(CachedEmbeddings(openai_embedding)),
+    )
+    for doc in reranking_retriever.invoke("湿法刻蚀的优势"):
+        print(f"rerank_score={doc.metadata['rerank_score']:.4f} title={doc.metadata.get('title')}")
+    print(f"重排耗时: {reranking_retriever.reranker.stats()}")
+
+    # 按分区键路由: 集合以 source 为分区键建表时 (write_milvus.py 的 partition_key) 只检索指定文件所在的分区
+    routed_retriever = HybridRetriever.from_profile(load_profile("rag_chunks").with_partition_key("source"), k=5)
+    routed_retriever.invoke("湿法刻蚀的优势", partition_values=[r"E:\Workspace\ai\RAG\datas\md\tech_report_z7tx05vt.md"])
+
+    # 批量检索
+    for question, docs in zip(["干法刻蚀", "先进纳米级清洗技术"], retriever.batch(["干法刻蚀", "先进纳米级清洗技术"])):
+        print(f"{question}: {[d.metadata.get('title') for d in docs]}")
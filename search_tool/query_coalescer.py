@@ -0,0 +1,111 @@
+import sys
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from langchain_core.documents import Document
+from search_tool.hybrid_retriever import HybridRetriever
+from utils.log_utils import log
+"""
+请求合并: 高并发时把在很短时间窗口内到达的查询合并成一次 HybridRetriever.search_batch,
+一次 embedding 请求 + 一次多向量 hybrid_search 服务一批调用方, 减少往返次数
+"""
+
+
+class QueryCoalescer:
+    """
+    在后台线程中收集查询, 第一个查询到达后最多再等待 window_ms 毫秒或凑满 max_batch_size 个, 然后一起检索
+    过滤条件 expr / 分区键取值 partition_values 和 k 不同的查询分组分别检索
+    """
+
+    def __init__(self, retriever: HybridRetriever, window_ms: float = 5.0, max_batch_size: int = 32):
+        """
+        :param retriever: 混合检索器
+        :param window_ms: 合并窗口 毫秒
+        :param max_batch_size: 单批最多合并的查询数
+        """
+        self.retriever = retriever
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.batches = 0        # 已执行的批次数
+        self.queries = 0        # 已处理的查询数
+        self._pending: queue.Queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="query-coalescer", daemon=True)
+        self._worker.start()
+
+    def submit(self, query: str, expr: Optional[str] = None, k: Optional[int] = None,
+               partition_values: Optional[list] = None) -> Future:
+        """提交一个查询 返回 Future, 结果为 Document 列表"""
+        if self._closed:
+            raise RuntimeError("QueryCoalescer 已关闭")
+        future = Future()
+        values = tuple(partition_values) if partition_values else None   # 作为分组的键 需要可哈希
+        self._pending.put((query, expr, k, values, future))
+        return future
+
+    def search(self, query: str, expr: Optional[str] = None, k: Optional[int] = None,
+               timeout: Optional[float] = None, partition_values: Optional[list] = None) -> List[Document]:
+        """同步检索 可以在任意线程中调用"""
+        return self.submit(query, expr, k, partition_values).result(timeout=timeout)
+
+    async def asearch(self, query: str, expr: Optional[str] = None, k: Optional[int] = None,
+                      partition_values: Optional[list] = None) -> List[Document]:
+        """异步检索"""
+        return await asyncio.wrap_future(self.submit(query, expr, k, partition_values))
+
+    def close(self):
+        """停止后台线程 已提交的查询会先处理完"""
+        self._closed = True
+        self._pending.put(None)
+        self._worker.join()
+
+    def _collect(self) -> Optional[list]:
+        """阻塞等待第一个查询, 然后在窗口内继续收集"""
+        first = self._pending.get()
+        if first is None:
+            return None
+        items = [first]
+        deadline = time.monotonic() + self.window
+        while len(items) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._pending.put(None)   # 处理完这一批之后再退出
+                break
+            items.append(item)
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            if items is None:
+                return
+            groups = {}
+            for query, expr, k, values, future in items:
+                if future.set_running_or_notify_cancel():   # 调用方已经取消的查询不再检索
+                    groups.setdefault((expr, k, values), []).append((query, future))
+            for (expr, k, values), group in groups.items():
+                try:
+                    results = self.retriever.search_batch([q for q, _ in group], expr=expr, k=k,
+                                                          partition_values=list(values) if values else None)
+                except Exception as e:
+                    log.exception(f"批量检索失败, 批次大小={len(group)}", exc_info=e)
+                    for _, future in group:
+                        future.set_exception(e)
+                    continue
+                for (_, future), documents in zip(group, results):
+                    future.set_result(documents)
+                self.batches += 1
+                self.queries += len(group)
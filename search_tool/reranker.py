@@ -0,0 +1,208 @@
+import sys
+import os
+import re
+import time
+import threading
+import weakref
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils.embedding_cache import normalize_query
+"""
+混合检索之后的重排序阶段: 多召回一些候选 (candidate_limit), 重排后只把 top_k 个交给 prompt
+- fusion:        词面匹配 + 稠密向量余弦的加权融合, 只需要 embedding 服务, 候选文档的向量在导入时已经写入 CachedEmbeddings 的磁盘缓存
+- cross-encoder: 本地 ONNX 交叉编码器 (例如导出为 ONNX 的 bge-reranker-base), CPU 即可运行, 需要安装 onnxruntime 和 transformers
+所有查询的 (query, 文档) 对合并后按 batch_size 分批, 在线程池中并发打分; 重排耗时单独统计, 见 Reranker.stats
+"""
+
+RERANKERS = ("fusion", "cross-encoder")
+
+# 英文/数字按单词切分, 中日韩文字按字切分后再组成二元组
+WORD_REGEX = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def lexical_terms(text: str) -> set:
+    """词面匹配使用的词项: 英文单词 + 中文单字和相邻二元组"""
+    tokens = WORD_REGEX.findall(normalize_query(text))
+    terms = set(tokens)
+    terms.update(a + b for a, b in zip(tokens, tokens[1:]) if len(a) == 1 and len(b) == 1)
+    return terms
+
+
+class Reranker(ABC):
+    """重排序器的基类 子类实现 score_pairs"""
+
+    def __init__(self, batch_size: int = 32, max_workers: int = 4):
+        """
+        :param batch_size: 每批打分的 (query, 文档) 对数
+        :param max_workers: 并发打分的线程数
+        """
+        self.batch_size = batch_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reranker")
+        # 没有显式 close 时, 对象被回收或解释器退出前关闭线程池
+        self._finalizer = weakref.finalize(self, self.executor.shutdown, wait=False)
+        self.last_latency_ms = 0.0
+        self._latencies: List[float] = []
+        self._pairs = 0
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        """对一批 (query, 文档文本) 打分 分数越高越相关"""
+
+    def rerank(self, query: str, documents: List[Document], top_k: Optional[int] = None) -> List[Document]:
+        return self.rerank_batch([query], [documents], top_k)[0]
+
+    def rerank_batch(self, queries: List[str], documents_per_query: List[List[Document]],
+                     top_k: Optional[int] = None) -> List[List[Document]]:
+        """
+        重排多个查询的候选文档
+        :param queries: 查询列表
+        :param documents_per_query: 与 queries 一一对应的候选文档
+        :param top_k: 每个查询保留的文档数 None 表示全部保留只重新排序
+        :return: 重排后的文档 分数写入 metadata['rerank_score']
+        """
+        start = time.perf_counter()
+        pairs = [(query, doc.page_content) for query, docs in zip(queries, documents_per_query) for doc in docs]
+        batches = [pairs[i:i + self.batch_size] for i in range(0, len(pairs), self.batch_size)]
+        scores = [score for batch_scores in self.executor.map(self.score_pairs, batches) for score in batch_scores]
+
+        results = []
+        offset = 0
+        for docs in documents_per_query:
+            ranked = sorted(zip(scores[offset:offset + len(docs)], range(len(docs))), key=lambda x: -x[0])
+            offset += len(docs)
+            reranked = []
+            for score, index in ranked[:top_k]:
+                docs[index].metadata["rerank_score"] = float(score)
+                reranked.append(docs[index])
+            results.append(reranked)
+        self._record(len(pairs), (time.perf_counter() - start) * 1000)
+        return results
+
+    def _record(self, pairs: int, latency_ms: float):
+        with self._lock:
+            self.last_latency_ms = latency_ms
+            self._latencies.append(latency_ms)
+            self._pairs += pairs
+
+    def stats(self) -> dict:
+        """重排耗时统计 与检索耗时分开, 方便单独评估重排占用的延迟预算"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            pairs = self._pairs
+        if not latencies:
+            return {"calls": 0, "pairs": 0}
+        return {
+            "calls": len(latencies),
+            "pairs": pairs,
+            "last_ms": self.last_latency_ms,
+            "p50_ms": latencies[len(latencies) // 2],
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            "total_ms": sum(latencies),
+        }
+
+    def close(self):
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FusionReranker(Reranker):
+    """
+    词面 + 向量融合打分: score = alpha * cos(query, doc) + (1 - alpha) * 词项覆盖率
+    词项覆盖率是查询词项在文档中出现的比例, 弥补稠密向量对专业术语/型号等精确匹配不敏感的问题
+    """
+
+    def __init__(self, embeddings: Embeddings, alpha: float = 0.6, batch_size: int = 32, max_workers: int = 4):
+        """
+        :param embeddings: 计算查询和文档向量 建议用 CachedEmbeddings 包装, 候选文档的向量可以直接命中导入时的缓存
+        :param alpha: 向量相似度的权重
+        """
+        super().__init__(batch_size=batch_size, max_workers=max_workers)
+        self.embeddings = embeddings
+        self.alpha = alpha
+
+    def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        if embed_queries is not None:
+            return embed_queries(queries)
+        return self.embeddings.embed_documents(queries)
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        # 同一批内的查询和文档各自去重后只请求一次
+        queries = list(dict.fromkeys(q for q, _ in pairs))
+        texts = list(dict.fromkeys(t for _, t in pairs))
+        query_vectors = dict(zip(queries, np.asarray(self._embed_queries(queries), dtype=np.float32)))
+        text_vectors = dict(zip(texts, np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)))
+        query_terms = {q: lexical_terms(q) for q in queries}
+        text_terms = {t: lexical_terms(t) for t in texts}
+
+        scores = []
+        for query, text in pairs:
+            q, d = query_vectors[query], text_vectors[text]
+            denominator = float(np.linalg.norm(q) * np.linalg.norm(d))
+            cosine = float(q @ d) / denominator if denominator else 0.0
+            terms = query_terms[query]
+            coverage = len(terms & text_terms[text]) / len(terms) if terms else 0.0
+            scores.append(self.alpha * cosine + (1 - self.alpha) * coverage)
+        return scores
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    本地 ONNX 交叉编码器 model_dir 下需要有 model.onnx 和 tokenizer 文件, 例如:
+    optimum-cli export onnx --model BAAI/bge-reranker-base --task text-classification models/bge-reranker-base-onnx
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 512, batch_size: int = 16, max_workers: int = 2,
+                 intra_op_threads: int = 0):
+        """
+        :param model_dir: 导出的 ONNX 模型目录
+        :param max_length: (query, 文档) 拼接后的最大 token 数
+        :param intra_op_threads: 每个推理调用使用的线程数 0 表示由 onnxruntime 决定
+        """
+        super().__init__(batch_size=batch_size, max_workers=max_workers)
+        # 可选依赖 只有使用交叉编码器时才需要安装
+        import onnxruntime
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, "model.onnx"), options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_length = max_length
+
+    def score_pairs(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        encoded = self.tokenizer([q for q, _ in pairs], [t for _, t in pairs], padding=True, truncation="only_second",
+                                 max_length=self.max_length, return_tensors="np")
+        inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+        logits = self.session.run(None, inputs)[0]
+        # 单输出的回归模型直接取 logit, 二分类模型取正类的 logit
+        return (logits[:, 0] if logits.shape[1] == 1 else logits[:, 1]).tolist()
+
+
+def create_reranker(name: str, embeddings: Optional[Embeddings] = None, model_dir: Optional[str] = None,
+                    **kwargs) -> Reranker:
+    """
+    根据名称创建重排序器
+    :param name: fusion / cross-encoder
+    :param embeddings: fusion 使用的 embedding 对象
+    :param model_dir: cross-encoder 的 ONNX 模型目录
+    """
+    if name == "fusion":
+        return FusionReranker(embeddings, **kwargs)
+    if name == "cross-encoder":
+        return CrossEncoderReranker(model_dir, **kwargs)
+    raise ValueError(f"不支持的重排序器: {name}, 可选值: {RERANKERS}")
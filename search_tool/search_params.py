@@ -0,0 +1,144 @@
+import sys
+import os
+import json
+from dataclasses import dataclass
+from typing import List, Optional
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from env_utils import COLLECTION_NAME
+from utils.log_utils import log
+"""
+检索参数策略: 根据召回率目标或延迟 SLA 决定 dense(HNSW) 的 ef 和 sparse(BM25) 的 drop_ratio_search
+- HNSW 只认 ef, nprobe 是 IVF 系列索引的参数, 传给 HNSW 没有任何作用
+- ef 必须不小于 limit, 否则 Milvus 会直接报错
+- drop_ratio_search 越大, 查询向量中被丢弃的低权重词越多, 越快但召回越低
+没有标定数据时使用经验值; 运行 benchmarks/calibrate_search_params.py 得到本集合的 recall@k / 延迟曲线后按实测数据选择
+"""
+
+# 获得当前项目的绝对路径
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cache_dir = os.path.join(root_dir, "cache")
+
+# 经验值: (召回率目标, ef, drop_ratio_search)
+DEFAULT_RECALL_TABLE = [
+    (0.90, 32, 0.3),
+    (0.95, 64, 0.2),
+    (0.98, 128, 0.1),
+    (0.99, 256, 0.0),
+]
+# 经验值: (延迟 SLA 毫秒, ef, drop_ratio_search) 延迟越宽松 参数越保守
+DEFAULT_LATENCY_TABLE = [
+    (10, 32, 0.3),
+    (30, 64, 0.2),
+    (80, 128, 0.1),
+    (200, 256, 0.0),
+]
+
+
+def calibration_path(collection_name: str = COLLECTION_NAME) -> str:
+    return os.path.join(cache_dir, f"search_params_{collection_name}.json")
+
+
+@dataclass
+class SearchParams:
+    """一次检索使用的参数"""
+    dense_param: dict
+    sparse_param: dict
+    candidate_limit: int
+
+
+class SearchParamPolicy:
+    """
+    检索参数策略
+    calibration 为 calibrate_search_params.py 的输出:
+    {"k": 10, "dense": [{"ef", "recall", "p50_ms", "p95_ms"}, ...], "sparse": [{"drop_ratio_search", "recall", "p50_ms", "p95_ms"}, ...]}
+    """
+
+    def __init__(self, calibration: Optional[dict] = None, default_ef: int = 64, default_drop_ratio: float = 0.2):
+        self.calibration = calibration
+        self.default_ef = default_ef
+        self.default_drop_ratio = default_drop_ratio
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, **kwargs) -> "SearchParamPolicy":
+        """读取标定结果 文件不存在时使用经验值"""
+        path = path or calibration_path()
+        if not os.path.exists(path):
+            return cls(**kwargs)
+        with open(path, "r", encoding="utf-8") as f:
+            calibration = json.load(f)
+        log.info(f"已加载检索参数标定结果: {path}")
+        return cls(calibration=calibration, **kwargs)
+
+    @staticmethod
+    def _pick_by_recall(points: List[dict], target: float, key: str, prefer_max: bool):
+        """满足召回率目标的点中 选参数最省的; 都不满足时选召回率最高的"""
+        satisfied = [p for p in points if p["recall"] >= target]
+        if not satisfied:
+            return max(points, key=lambda p: p["recall"])[key]
+        return (max if prefer_max else min)(p[key] for p in satisfied)
+
+    def _calibrated(self, recall_target: Optional[float], latency_sla_ms: Optional[float]):
+        dense, sparse = self.calibration["dense"], self.calibration["sparse"]
+        if recall_target is not None:
+            return (self._pick_by_recall(dense, recall_target, "ef", prefer_max=False),
+                    self._pick_by_recall(sparse, recall_target, "drop_ratio_search", prefer_max=True))
+        # 两路请求在同一次 hybrid_search 中执行 延迟按两者之和估算, 在 SLA 内选两路召回率较低者最高的组合
+        best, best_recall = None, -1.0
+        for d in dense:
+            for s in sparse:
+                if d["p95_ms"] + s["p95_ms"] > latency_sla_ms:
+                    continue
+                recall = min(d["recall"], s["recall"])
+                if recall > best_recall:
+                    best, best_recall = (d["ef"], s["drop_ratio_search"]), recall
+        if best is None:   # SLA 太紧 选最快的组合
+            best = (min(dense, key=lambda p: p["p95_ms"])["ef"], min(sparse, key=lambda p: p["p95_ms"])["drop_ratio_search"])
+        return best
+
+    @staticmethod
+    def _from_recall_table(recall_target: float):
+        """经验值表中取召回率不低于目标的第一行"""
+        for threshold, ef, drop_ratio in DEFAULT_RECALL_TABLE:
+            if recall_target <= threshold:
+                return ef, drop_ratio
+        return DEFAULT_RECALL_TABLE[-1][1], DEFAULT_RECALL_TABLE[-1][2]
+
+    def resolve(self, k: int, candidate_limit: Optional[int] = None, recall_target: Optional[float] = None,
+                latency_sla_ms: Optional[float] = None) -> SearchParams:
+        """
+        :param k: 最终返回的文档数
+        :param candidate_limit: 每一路召回的候选数 默认 2k
+        :param recall_target: 召回率目标 例如 0.95 与 latency_sla_ms 同时给出时以召回率为准
+        :param latency_sla_ms: 检索延迟 SLA 毫秒
+        """
+        limit = max(k, candidate_limit or 2 * k)
+        if recall_target is None and latency_sla_ms is None:
+            ef, drop_ratio = self.default_ef, self.default_drop_ratio
+        elif self.calibration and self.calibration.get("dense") and self.calibration.get("sparse"):
+            # 标定结果中某一路没有数据点 (例如 efs 都小于 k) 时按没有标定处理, 使用下面的经验值
+            ef, drop_ratio = self._calibrated(recall_target, latency_sla_ms)
+        elif recall_target is not None:
+            ef, drop_ratio = self._from_recall_table(recall_target)
+        else:
+            # SLA 落在两行之间时取较小的一行, 保证不超时
+            ef, drop_ratio = DEFAULT_LATENCY_TABLE[0][1], DEFAULT_LATENCY_TABLE[0][2]
+            for threshold, table_ef, table_drop in DEFAULT_LATENCY_TABLE:
+                if latency_sla_ms >= threshold:
+                    ef, drop_ratio = table_ef, table_drop
+        return SearchParams(
+            dense_param={"ef": max(int(ef), limit)},   # HNSW 要求 ef >= limit
+            sparse_param={"drop_ratio_search": float(drop_ratio)},
+            candidate_limit=limit,
+        )
+
+    def dense_search_params(self, limit: int, **kwargs) -> dict:
+        """MilvusClient.search 使用的 search_params"""
+        return {"params": self.resolve(k=limit, candidate_limit=limit, **kwargs).dense_param}
+
+    def sparse_search_params(self, limit: int, **kwargs) -> dict:
+        return {"params": self.resolve(k=limit, candidate_limit=limit, **kwargs).sparse_param}
+
+
+default_policy = SearchParamPolicy()
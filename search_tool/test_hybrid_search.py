@@ -5,64 +5,24 @@ import numpy as np
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from pymilvus import AnnSearchRequest, MilvusClient, DataType
-from env_utils import MILVUS_URI
-from pymilvus import Function, FunctionType
+from pymilvus import AnnSearchRequest
 from llm_utils import openai_embedding
 from pymilvus import RRFRanker
+from utils.embedding_cache import cached_query_embeddings
+from search_tool.search_params import default_policy
+from utils.milvus_connection import get_milvus_client
+from documents.collection_profile import ensure_collection
 def create_collection():
-    # 1. 创建一个 Milvus 连接
-    client = MilvusClient(uri=MILVUS_URI)
+    """按 hybrid_demo profile 重建集合: 文本稠密 + BM25 稀疏 + 图片稠密 三个向量字段"""
+    # 1. 获取共享的 Milvus 连接
+    client = get_milvus_client()
     print("Milvus 数据库连接已建立")
-    # 2. 定义schema
-    schema = client.create_schema(auto_id=False)
-    # Add fields to schema
-    schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True, description="product id")
-    schema.add_field(field_name="text", datatype=DataType.VARCHAR, max_length=1000, enable_analyzer=True, description="raw text of product description")
-    schema.add_field(field_name="text_dense", datatype=DataType.FLOAT_VECTOR, dim=1024, description="text dense embedding")
-    schema.add_field(field_name="text_sparse", datatype=DataType.SPARSE_FLOAT_VECTOR, description="text sparse embedding auto-generated by the built-in BM25 function")
-    schema.add_field(field_name="image_dense", datatype=DataType.FLOAT_VECTOR, dim=512, description="image dense embedding")
-    # Add function to schema
-    bm25_function = Function(
-        name="text_bm25_emb",
-        input_field_names=["text"],
-        output_field_names=["text_sparse"],
-        function_type=FunctionType.BM25,
-    )
-    schema.add_function(bm25_function)
-    # 3. 配置索引
-    index_params = client.prepare_index_params()
-    # Add indexes 稠密字段
-    index_params.add_index(
-        field_name="text_dense",
-        index_name="text_dense_index",
-        index_type="AUTOINDEX",
-        metric_type="IP"
-    )
-    # Add indexes 稀疏字段
-    index_params.add_index(
-        field_name="text_sparse",
-        index_name="text_sparse_index",
-        index_type="SPARSE_INVERTED_INDEX",
-        metric_type="BM25",
-        params={"inverted_index_algo": "DAAT_MAXSCORE"}, # or "DAAT_WAND" or "TAAT_NAIVE"
-    )
-    # Add indexes 图片字段
-    index_params.add_index(
-        field_name="image_dense",
-        index_name="image_dense_index",
-        index_type="AUTOINDEX",
-        metric_type="IP"
-    )
-    # 4. 创建集合
-    if client.has_collection("my_hybrid_collection"):
-        client.drop_collection("my_hybrid_collection")
-        print("已删除现有集合 'my_hybrid_collection'")
-    client.create_collection(collection_name="my_hybrid_collection", schema=schema, index_params=index_params)
+    # 2. 删除已有集合后按 profile 创建 schema / BM25 Function / 索引
+    ensure_collection(client, "hybrid_demo", recreate=True)
     print("集合 'my_hybrid_collection' 创建成功")
 
 def insert_data():
-    client = MilvusClient(uri=MILVUS_URI)
+    client = get_milvus_client()
     
     # 准备文本数据
     texts = [
@@ -118,17 +78,19 @@ def hybrid_search():
     
     # 使用 openai_embedding 生成查询文本的向量
     print("正在生成查询文本向量...")
-    query_dense_vector = openai_embedding.embed_query(query_text)
+    query_dense_vector = cached_query_embeddings(openai_embedding).embed_query(query_text)
     
     # 随机生成查询图像向量 (512维)
     np.random.seed(123)  # 设置不同的随机种子
     query_multimodal_vector = np.random.randn(512).tolist()  # 生成一个512维的随机向量并将array数组转换成python列表
 
+    params = default_policy.resolve(k=2, candidate_limit=2)
+
     # 1. text semantic search (dense)
     search_params_dense = {
         "data": [query_dense_vector],
         "anns_field": "text_dense",
-        "param": {"nprobe": 10},
+        "param": params.dense_param,
         "limit": 2,
     }
     request_dense = AnnSearchRequest(**search_params_dense)
@@ -137,14 +99,14 @@ def hybrid_search():
         "data": [query_text],
         "anns_field": "text_sparse",
         "limit": 2,
-        "param": {"drop_ratio_search": 0.2}
+        "param": params.sparse_param
     }
     request_sparse = AnnSearchRequest(**search_params_sparse)
     # 3. image semantic search (dense)
     search_params_image = {
         "data": [query_multimodal_vector],
         "anns_field": "image_dense",
-        "param": {"nprobe": 10},
+        "param": params.dense_param,   # AUTOINDEX 在 Milvus 中实际为 HNSW, 同样使用 ef
         "limit": 2,
     }
     request_image = AnnSearchRequest(**search_params_image)
@@ -158,7 +120,7 @@ if __name__ == "__main__":
     create_collection()
     insert_data()
     reqs, ranker = hybrid_search()
-    client = MilvusClient(uri=MILVUS_URI)
+    client = get_milvus_client()
     
     # 并行搜索：在 my_collection 集合的 text_dense、text_sparse 和 image_dense 三个向量字段上，同时发起三种不同的搜索，每种搜索各自返回最相似的 2 个结果，共得到 6 个候选。
     # 最后由 RRFRanker 对这 6 个候选进行重新排序，得到最终的 2 个最相关结果。
@@ -3,78 +3,64 @@ import os
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from langchain_milvus import BM25BuiltInFunction, Milvus
-from pymilvus import MilvusClient, DataType, AnnSearchRequest
-from pymilvus import Function, FunctionType
+from langchain_milvus import BM25BuiltInFunction
+from pymilvus import AnnSearchRequest
 from llm_utils import openai_embedding
 from langchain_core.documents import Document
 from documents.markdown_parser import MarkdownParser
-from llm_utils import openai_embedding
 from pymilvus import RRFRanker
-from env_utils import COLLECTION_NAME, MILVUS_URI
+from env_utils import COLLECTION_NAME
+from utils.embedding_cache import cached_query_embeddings
+from search_tool.search_params import default_policy
+from utils.milvus_connection import get_milvus_client, get_vector_store
+from utils.sparse_encoder import BM25SparseEncoder, CorpusStats
+from documents.collection_profile import ensure_collection, load_profile
 """
 测试 Milvus 全文检索
 """
 
 def sparse_search():
-    # 1. 创建一个 Milvus 连接
-    client = MilvusClient(uri=MILVUS_URI)
+    """按 fulltext_demo profile 重建全文检索集合: text 字段使用 jieba 分词, BM25 Function 生成 sparse 字段"""
+    client = get_milvus_client()
     print("Milvus 数据库连接已建立")
-    # 2. 定义schema
-    schema = client.create_schema()
-
-    schema.add_field("id", DataType.INT64, is_primary=True, auto_id=True)
-    schema.add_field("category", DataType.VARCHAR, max_length=1000)
-    # schema.add_field("text", DataType.VARCHAR, max_length=6000, enable_analyzer=True, analyzer_params={"type": "chinese"}) # 注意如果语料是中文，需要开启分词器为中文
-    schema.add_field("text", DataType.VARCHAR, max_length=6000, enable_analyzer=True, analyzer_params={"tokenizer": "jieba"}) # 注意如果语料是中文，需要开启分词器为中文
-    schema.add_field("sparse", DataType.SPARSE_FLOAT_VECTOR)
-
-    # 3 构建用于全文搜索的 bm25 Function
-    # bm25用于将文本字段转化为稀疏向量字段 用于全文检索
-    bm25_function = Function(
-        name = "text_bm25_emb",
-        input_field_names=["text"], # # 需要进行文本到稀疏向量转换的 VARCHAR 字段名称。对于 FunctionType.BM25 ，此参数仅接受一个字段名称。
-        output_field_names=["sparse"], # # 存储内部生成稀疏向量的字段名称。对于 FunctionType.BM25 ，此参数仅接受一个字段名。
-        function_type=FunctionType.BM25 # # 要使用的函数类型。将该值设置为 FunctionType.BM25
-    )
-    schema.add_function(bm25_function)
-    # 配置索引
-    index_params = client.prepare_index_params()
-
-    index_params.add_index(
-        field_name="sparse",
-
-        index_type="SPARSE_INVERTED_INDEX",
-        metric_type="BM25",
-        params={
-            "inverted_index_algo": "DAAT_MAXSCORE", # （默认）：采用 MaxScore 算法优化的文档逐次（DAAT）查询处理。
-            "bm25_k1": 1.2,       # 数值越高，专业术语词频在文档排名中的重要性越大。取值范围：[1.2, 2.0]。
-            "bm25_b": 0.75 
-        }
-    )
+    ensure_collection(client, "fulltext_demo", recreate=True)
 
-    # 4. 创建集合
-    # 检查集合是否已存在，如果存在则删除
-    if client.has_collection("my_collection"):
-        client.drop_collection("my_collection")
-        print("已删除现有集合 'my_collection'")
+def client_sparse_search(query: str = "湿法刻蚀的优势"):
+    """
+    客户端计算 BM25 稀疏向量: 集合中没有 BM25 Function, text 字段不需要 analyzer
+    文档向量为词频饱和部分, 查询向量为 idf, 稀疏索引用 IP 度量即可得到 BM25 得分
+    """
+    client = get_milvus_client()
+    ensure_collection(client, load_profile("fulltext_demo").with_client_sparse(),
+                      collection_name="my_collection_client_sparse", recreate=True)
 
-    # 创建集合collections
-    client.create_collection(
-        collection_name="my_collection",
-        schema=schema,
-        index_params=index_params,
+    file_path = r"E:\Workspace\ai\RAG\datas\md\tech_report_z7tx05vt.md"
+    docs = MarkdownParser().parse_markdown_to_documents(file_path)
+    encoder = BM25SparseEncoder(collection_name="my_collection_client_sparse", stats=CorpusStats())
+    delta = CorpusStats()
+    vectors = encoder.encode_documents([doc.page_content for doc in docs], delta)
+    encoder.stats.merge(delta)
+    encoder.save_stats()
+    client.insert(collection_name="my_collection_client_sparse", data=[
+        {"category": doc.metadata.get("category", ""), "text": doc.page_content[:6000], "sparse": vector}
+        for doc, vector in zip(docs, vectors)
+    ])
+    print(f"查询分词: {encoder.tokenize(query)}")
+    return client.search(
+        collection_name="my_collection_client_sparse",
+        data=[encoder.encode_query(query)],
+        anns_field="sparse",
+        search_params=default_policy.sparse_search_params(limit=3),
+        limit=3,
+        output_fields=["text", "category"],
     )
 
 # 使用 Milvus 自带的schema处理更加灵活  这里我们用langchain_milvus的Milvus来作为存储向量数据库
 def insert_data():
     """插入测试数据"""
-    vector_store = Milvus(
-        embedding_function=None,
+    vector_store = get_vector_store(
         collection_name="my_collection",
-        connection_args={
-            "uri": MILVUS_URI,
-        },
+        embedding_function=None,
         builtin_function=BM25BuiltInFunction( 
             input_field_names="text",      # 输入：原始文本字段 	VARCHAR
             output_field_names="sparse",   # 输出：稀疏向量字段，对应 vector_field[0] SPARSE_FLOAT_VECTOR
@@ -93,13 +79,14 @@ def insert_data():
 
 def my_hybird_search():
     query = "湿法刻蚀的优势"
+    params = default_policy.resolve(k=5, candidate_limit=10, recall_target=0.95)
 
     # 1. text semantic search (dense)
     search_params_dense = {
-        "data": [openai_embedding.embed_query(query)],
+        "data": [cached_query_embeddings(openai_embedding).embed_query(query)],
         "anns_field": "dense",
-        "param": {"nprobe": 10},
-        "limit": 10,
+        "param": params.dense_param,   # HNSW 使用 ef, nprobe 对 HNSW 无效
+        "limit": params.candidate_limit,
         'expr':'category == "TitleWithContent" && category_depth > 1'
     }
     request_dense = AnnSearchRequest(**search_params_dense)
@@ -107,8 +94,8 @@ def my_hybird_search():
     search_params_sparse = {
         "data": [query],
         "anns_field": "sparse",
-        "limit": 10,
-        "param": {"drop_ratio_search": 0.2},
+        "limit": params.candidate_limit,
+        "param": params.sparse_param,
         'expr':'category == "TitleWithContent" && category_depth > 1'
     }
     request_sparse = AnnSearchRequest(**search_params_sparse)
@@ -123,6 +110,7 @@ def my_hybird_search():
 if __name__ == "__main__":
     # sparse_search()
     # insert_data()
+    # print(client_sparse_search())
 
     # vector_store = insert_data()
     # print("\n使用过滤条件进行搜索:")
@@ -138,7 +126,7 @@ if __name__ == "__main__":
     #     print("-" * 30)
 
     reqs, ranker = my_hybird_search()
-    client = MilvusClient(uri=MILVUS_URI)
+    client = get_milvus_client()
     res = client.hybrid_search(
         collection_name=COLLECTION_NAME,
         reqs=reqs,
@@ -0,0 +1,5 @@
+import sys
+import os
+
+# 添加项目根目录到Python路径 与各模块中的写法一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,135 @@
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from documents import answer_cache
+from documents.answer_cache import SemanticAnswerCache, bump_collection_version, retrieval_scope
+
+"""
+语义答案缓存 (documents/answer_cache.py) 的测试 使用固定向量的假 embedding, 集合版本文件写在 pytest 的临时目录
+运行: python -m pytest -q tests
+"""
+
+VECTORS = {
+    "干法刻蚀是什么": [1.0, 0.0, 0.0],
+    "什么是干法刻蚀": [0.99, 0.05, 0.0],    # 与上一个问题的余弦相似度约 0.999
+    "湿法刻蚀是什么": [0.6, 0.8, 0.0],      # 约 0.6
+    "光刻胶怎么显影": [0.0, 0.0, 1.0],
+}
+
+
+class _FixedEmbeddings(Embeddings):
+    """问题 -> 预先给定的向量 记录 embed_query 的调用次数"""
+
+    def __init__(self):
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        return [VECTORS[t] for t in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return VECTORS[text]
+
+
+class _Retriever:
+    collection_name = "docs"
+    k = 4
+
+
+@pytest.fixture(autouse=True)
+def version_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(answer_cache, "cache_dir", str(tmp_path))
+
+
+@pytest.fixture
+def embeddings():
+    return _FixedEmbeddings()
+
+
+def _cache(embeddings, **kwargs):
+    return SemanticAnswerCache(embeddings, collection_name="docs", version_check_interval=0, **kwargs)
+
+
+def test_hit_for_similar_question_in_same_scope(embeddings):
+    cache = _cache(embeddings)
+    docs = [Document(page_content="干法刻蚀利用等离子体")]
+    cache.store("干法刻蚀是什么", "等离子体刻蚀", docs, scope="a")
+    hit = cache.lookup("什么是干法刻蚀", scope="a")
+    assert hit["answer"] == "等离子体刻蚀" and hit["docs"] == docs and hit["question"] == "干法刻蚀是什么"
+    assert hit["similarity"] > 0.99
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss_across_scopes(embeddings):
+    cache = _cache(embeddings)
+    cache.store("干法刻蚀是什么", "范围 a 的答案", [], scope=retrieval_scope(_Retriever(), expr='source == "a.md"'))
+    cache.store("干法刻蚀是什么", "范围 b 的答案", [], scope=retrieval_scope(_Retriever(), expr='source == "b.md"'))
+    assert cache.lookup("干法刻蚀是什么", scope=retrieval_scope(_Retriever())) is None
+    hit = cache.lookup("干法刻蚀是什么", scope=retrieval_scope(_Retriever(), expr='source == "b.md"'))
+    assert hit["answer"] == "范围 b 的答案"
+
+
+def test_retrieval_scope_includes_retriever_settings():
+    other = _Retriever()
+    other.k = 8
+    assert retrieval_scope(_Retriever()) == retrieval_scope(_Retriever(), expr=None)
+    assert retrieval_scope(_Retriever()) != retrieval_scope(other)
+    assert retrieval_scope(_Retriever()) != retrieval_scope(_Retriever(), partition_values=["a.md"])
+
+
+def test_threshold(embeddings):
+    cache = _cache(embeddings, threshold=0.9)
+    cache.store("干法刻蚀是什么", "答案", [])
+    assert cache.lookup("湿法刻蚀是什么") is None
+    assert cache.lookup("光刻胶怎么显影") is None
+    loose = _cache(embeddings, threshold=0.5)
+    loose.store("干法刻蚀是什么", "答案", [])
+    assert loose.lookup("湿法刻蚀是什么")["answer"] == "答案"
+
+
+def test_ttl_expires_entries(embeddings):
+    cache = _cache(embeddings, ttl_seconds=0.05)
+    cache.store("干法刻蚀是什么", "答案", [])
+    assert cache.lookup("干法刻蚀是什么") is not None
+    time.sleep(0.1)
+    assert cache.lookup("干法刻蚀是什么") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_collection_version_bump_invalidates(embeddings):
+    cache = _cache(embeddings)
+    cache.store("干法刻蚀是什么", "旧答案", [])
+    bump_collection_version("docs")
+    assert cache.lookup("干法刻蚀是什么") is None
+    cache.store("干法刻蚀是什么", "新答案", [])
+    assert cache.lookup("干法刻蚀是什么")["answer"] == "新答案"
+    # 其他集合的版本变化不影响
+    bump_collection_version("other")
+    assert cache.lookup("干法刻蚀是什么")["answer"] == "新答案"
+
+
+def test_version_check_interval_limits_file_reads(embeddings):
+    cache = SemanticAnswerCache(embeddings, collection_name="docs", version_check_interval=3600)
+    cache.store("干法刻蚀是什么", "答案", [])
+    bump_collection_version("docs")
+    assert cache.lookup("干法刻蚀是什么") is not None   # 间隔内不重新检查版本
+
+
+def test_passed_vector_skips_embedding(embeddings):
+    cache = _cache(embeddings)
+    cache.store("干法刻蚀是什么", "答案", [], vector=VECTORS["干法刻蚀是什么"])
+    assert cache.lookup("什么是干法刻蚀", vector=VECTORS["什么是干法刻蚀"]) is not None
+    assert embeddings.queries == 0
+
+
+def test_max_entries_evicts_oldest(embeddings):
+    cache = _cache(embeddings, max_entries=2)
+    cache.store("干法刻蚀是什么", "1", [])
+    cache.store("湿法刻蚀是什么", "2", [])
+    cache.store("光刻胶怎么显影", "3", [])
+    assert cache.stats()["size"] == 2
+    assert cache.lookup("干法刻蚀是什么") is None
+    assert cache.lookup("光刻胶怎么显影")["answer"] == "3"
@@ -0,0 +1,143 @@
+import threading
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from documents.chunking import (ChunkStrategy, HybridChunkStrategy, RecursiveChunkStrategy, SemanticChunkStrategy,
+                                create_chunk_strategy)
+from documents.markdown_parser import MarkdownParser
+
+"""
+切片策略 (documents/chunking.py) 的测试 语义切分使用按关键词生成向量的假 embedding, 不需要网络
+运行: python -m pytest -q tests
+"""
+
+TOPICS = ("苹果", "香蕉", "樱桃")
+
+
+class _TopicEmbeddings(Embeddings):
+    """每个主题词一维 同一主题的句子向量相同, 主题切换处余弦距离为 1; 记录每次 embed_documents 的输入"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _vector(text):
+        return [float(text.count(topic)) for topic in TOPICS] + [0.0]
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def _doc(text, **metadata):
+    return Document(page_content=text, metadata=metadata)
+
+
+@pytest.fixture
+def embeddings():
+    return _TopicEmbeddings()
+
+
+# ---- max_chars ----
+
+def test_semantic_chunks_respect_max_chars(embeddings):
+    # 所有句子属于同一主题 没有语义断点, 整篇文档会成为一个切片, 必须再按句子切到 max_chars 以内
+    text = "".join(f"苹果第{i}句。" for i in range(40))
+    strategy = SemanticChunkStrategy(embeddings, max_chars=50)
+    chunks = strategy.split_documents([_doc(text, title="t")])
+    assert len(chunks) > 1
+    assert all(len(c.page_content) <= 50 for c in chunks)
+    assert all(c.metadata == {"title": "t"} for c in chunks)
+    assert "".join(c.page_content for c in chunks).replace(" ", "") == text
+
+
+def test_semantic_single_sentence_respects_max_chars(embeddings):
+    strategy = SemanticChunkStrategy(embeddings, max_chars=50)
+    chunks = strategy.split_documents([_doc("苹果" * 100)])
+    assert len(chunks) > 1 and all(len(c.page_content) <= 50 for c in chunks)
+    assert embeddings.calls == []   # 只有一个句子 不需要 embedding
+
+
+def test_semantic_without_max_chars_keeps_long_chunks(embeddings):
+    text = "".join(f"苹果第{i}句。" for i in range(40))
+    chunks = SemanticChunkStrategy(embeddings).split_documents([_doc(text)])
+    assert len(chunks) == 1
+
+
+def test_hybrid_chunks_respect_max_chars(embeddings):
+    structured = "->".join("香蕉段落。" * 5 for _ in range(10))
+    unstructured = "".join(f"苹果第{i}句。" for i in range(40))
+    strategy = HybridChunkStrategy(embeddings, max_chars=60)
+    results = strategy.split_batch([_doc(structured), _doc(unstructured)])
+    assert all(len(c.page_content) <= 60 for chunks in results for c in chunks)
+    # 只有没有结构边界的文档才调用语义切分
+    assert embeddings.calls and all("苹果" in text for call in embeddings.calls for text in call)
+
+
+@pytest.mark.parametrize("name, cls", [("recursive", RecursiveChunkStrategy), ("semantic", SemanticChunkStrategy),
+                                       ("hybrid", HybridChunkStrategy)])
+def test_create_chunk_strategy_passes_max_chars(embeddings, name, cls):
+    strategy = create_chunk_strategy(name, embeddings, max_chars=200)
+    assert isinstance(strategy, cls)
+    text = "".join(f"苹果第{i}句。" for i in range(60))
+    chunks = strategy.split_documents([_doc(text)])
+    assert len(chunks) > 1 and all(len(c.page_content) <= 200 for c in chunks)
+
+
+def test_create_chunk_strategy_rejects_unknown_name(embeddings):
+    with pytest.raises(ValueError):
+        create_chunk_strategy("fixed", embeddings)
+
+
+# ---- 批量切分 ----
+
+def test_chunk_strategy_is_abstract():
+    with pytest.raises(TypeError):
+        ChunkStrategy()
+
+
+def test_split_batch_aligns_with_input(embeddings):
+    documents = [_doc("短文本。"), _doc("->".join("香蕉段落。" * 5 for _ in range(10))), _doc("")]
+    for strategy in (RecursiveChunkStrategy(chunk_size=60, chunk_overlap=0), SemanticChunkStrategy(embeddings),
+                     HybridChunkStrategy(embeddings, max_chars=60)):
+        results = strategy.split_batch(documents)
+        assert len(results) == len(documents)
+        assert [c.page_content for c in results[0]] == ["短文本。"]
+        assert len(results[1]) >= 1 and all("香蕉" in c.page_content for c in results[1])
+
+
+def test_semantic_breakpoints_follow_topic_changes(embeddings):
+    text = "".join(f"苹果第{i}句。" for i in range(5)) + "".join(f"香蕉第{i}句。" for i in range(5))
+    chunks = SemanticChunkStrategy(embeddings, buffer_size=0).split_documents([_doc(text)])
+    assert [c.page_content.replace(" ", "") for c in chunks] == [text[:len(text) // 2], text[len(text) // 2:]]
+
+
+def test_semantic_embeds_windows_across_documents_in_batches(embeddings):
+    # 两篇文档的句子完全相同 窗口去重后只请求一次
+    text = "".join(f"{TOPICS[i % 3]}第{i}句。" for i in range(10))
+    strategy = SemanticChunkStrategy(embeddings, buffer_size=0, embed_batch_size=4, max_workers=2)
+    results = strategy.split_batch([_doc(text), _doc(text), _doc("单句")])
+    embedded = [t for call in embeddings.calls for t in call]
+    assert len(embedded) == len(set(embedded)) == 10
+    assert sorted(len(call) for call in embeddings.calls) == [2, 4, 4]
+    assert [c.page_content for c in results[0]] == [c.page_content for c in results[1]]
+    assert [c.page_content for c in results[2]] == ["单句"]
+
+
+def test_text_chunker_splits_oversized_documents_in_one_batch(embeddings):
+    parser = MarkdownParser(backend="native", chunk_strategy="semantic", max_chunk_chars=60)
+    parser.text_splitter = SemanticChunkStrategy(embeddings, max_chars=60)
+    first = "".join(f"苹果第{i}句。" for i in range(12))
+    second = "".join(f"樱桃第{i}句。" for i in range(12))
+    chunks = parser.text_chunker([_doc("短", n=0), _doc(first, n=1), _doc("也短", n=2), _doc(second, n=3)])
+    assert len(embeddings.calls) == 1 and len(embeddings.calls[0]) == 24
+    assert [c.metadata["n"] for c in chunks][:2] == [0, 1] and chunks[-1].metadata["n"] == 3
+    assert [c.page_content for c in chunks if c.metadata["n"] == 2] == ["也短"]
+    assert all(len(c.page_content) <= 60 for c in chunks)
@@ -0,0 +1,83 @@
+import pytest
+from langchain_core.documents import Document
+
+from documents.context_builder import ContextBuilder, heuristic_token_count
+
+"""
+上下文构建 (documents/context_builder.py) 的测试 统一使用估算的 token 计数, 结果不依赖是否安装 tiktoken
+运行: python -m pytest -q tests
+"""
+
+
+def _doc(text, title=None):
+    return Document(page_content=text, metadata={"title": title} if title else {})
+
+
+def _builder(**kwargs):
+    return ContextBuilder(token_counter=heuristic_token_count, **kwargs)
+
+
+def test_heuristic_token_count():
+    assert heuristic_token_count("") == 0
+    assert heuristic_token_count("刻蚀工艺") == 4
+    assert heuristic_token_count("abcdefgh") == 2
+    assert heuristic_token_count("刻蚀 etch") == 2 + 2
+
+
+def test_shared_title_prefix_is_emitted_once():
+    docs = [
+        _doc("第1章 刻蚀->刻蚀是去除材料的工艺。 -> 1.1 干法->干法刻蚀使用等离子体轰击晶圆表面。", "1.1 干法"),
+        _doc("第1章 刻蚀->刻蚀是去除材料的工艺。 -> 1.2 湿法->湿法刻蚀把晶圆浸入化学溶液中反应。", "1.2 湿法"),
+    ]
+    packed = _builder().build(docs)
+    assert packed.text.count("第1章 刻蚀") == 1
+    assert packed.text.count("刻蚀是去除材料的工艺。") == 1
+    assert "1.2 湿法->湿法刻蚀把晶圆浸入化学溶液中反应。" in packed.text
+    assert packed.docs == docs
+    assert packed.stats["saved_tokens"] > 0
+
+
+def test_section_title_restored_when_prefix_removed():
+    docs = [
+        _doc("第2章 光刻->光刻胶涂布后需要前烘。->曝光使用深紫外光源。", "第2章 光刻"),
+        _doc("第2章 光刻->显影液去除曝光区域的光刻胶。", "第2章 光刻"),
+    ]
+    packed = _builder().build(docs)
+    assert packed.text.split("\n\n")[1] == "第2章 光刻->显影液去除曝光区域的光刻胶。"
+
+
+def test_duplicates_are_dropped():
+    text = "沉积->化学气相沉积在晶圆表面生成薄膜, 温度通常在几百摄氏度。"
+    docs = [_doc(text, "沉积"), _doc(text, "沉积"), _doc("化学气相沉积在晶圆表面生成薄膜, 温度通常在几百摄氏度", "CVD")]
+    packed = _builder().build(docs)
+    assert packed.docs == docs[:1]
+    assert packed.stats["dropped_duplicates"] == 2
+    assert packed.stats["chunks_used"] == 1
+
+
+@pytest.mark.parametrize("max_tokens", [20, 60, 150])
+def test_packed_context_stays_within_token_budget(max_tokens):
+    # 每个 chunk 使用互不相同的汉字 不会被当作近似重复丢弃
+    docs = [_doc(f"第{i}节->" + "".join(chr(0x4e00 + 60 * i + j) for j in range(60)), f"第{i}节") for i in range(10)]
+    builder = _builder(max_tokens=max_tokens, min_chunk_tokens=8)
+    packed = builder.build(docs)
+    assert heuristic_token_count(packed.text) <= max_tokens
+    assert packed.stats["context_tokens"] <= max_tokens
+    assert packed.docs == docs[:len(packed.docs)]
+    assert packed.stats["chunks_used"] + packed.stats["dropped_over_budget"] == len(docs)
+    assert packed.stats["truncated"] == 1
+
+
+def test_no_truncation_below_min_chunk_tokens():
+    docs = [_doc("甲" * 50, "甲"), _doc("乙" * 50, "乙")]
+    packed = _builder(max_tokens=60, min_chunk_tokens=32).build(docs)
+    assert packed.text == "甲" * 50
+    assert packed.stats["truncated"] == 0
+    assert packed.stats["dropped_over_budget"] == 1
+
+
+def test_everything_fits():
+    docs = [_doc("刻蚀->干法刻蚀。", "刻蚀"), _doc("清洗->去除颗粒。", "清洗")]
+    packed = _builder().build(docs)
+    assert packed.text == "刻蚀->干法刻蚀。\n\n清洗->去除颗粒。"
+    assert packed.stats["dropped_over_budget"] == 0 and packed.stats["truncated"] == 0
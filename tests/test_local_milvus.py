@@ -0,0 +1,221 @@
+import multiprocessing
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from utils.local_milvus import LocalMilvusClient, compile_filter, routing_values
+from utils.store_client import VectorStoreClient
+
+"""
+本地向量库 (utils/local_milvus.py) 的测试 每个用例在 pytest 的临时目录中建库
+运行: python -m pytest -q tests
+"""
+
+DIM = 8
+
+
+class _Ranker:
+    """与 pymilvus RRFRanker / WeightedRanker 的 dict() 输出一致"""
+
+    def __init__(self, strategy: str, **params):
+        self.spec = {"strategy": strategy, "params": params}
+
+    def dict(self):
+        return self.spec
+
+
+def _request(field, data, limit=10, expr=None, param=None):
+    return SimpleNamespace(anns_field=field, data=data, limit=limit, expr=expr, param=param or {})
+
+
+def _create(client, name="docs", partition_key=False, vector_type="FLOAT_VECTOR", index_type="FLAT", nlist=4):
+    schema = client.create_schema(auto_id=True)
+    schema.add_field("id", "INT64", is_primary=True)
+    schema.add_field("source", "VARCHAR", max_length=200, is_partition_key=partition_key)
+    schema.add_field("depth", "INT64")
+    schema.add_field("text", "VARCHAR", max_length=1000, enable_analyzer=True, analyzer_params={"tokenizer": "bigram"})
+    schema.add_field("sparse", "SPARSE_FLOAT_VECTOR")
+    schema.add_field("dense", vector_type, dim=DIM)
+    schema.add_function(SimpleNamespace(name="text_bm25", type="BM25", input_field_names=["text"],
+                                        output_field_names=["sparse"]))
+    index_params = client.prepare_index_params()
+    index_params.add_index("sparse", index_type="SPARSE_INVERTED_INDEX", metric_type="BM25")
+    index_params.add_index("dense", index_type=index_type, metric_type="IP", params={"nlist": nlist})
+    client.create_collection(name, schema=schema, index_params=index_params)
+
+
+def _rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"source": f"doc{i % 5}.md", "depth": i % 3, "text": f"apple banana {i}" if i % 2 else f"cherry {i}",
+             "dense": v / np.linalg.norm(v)} for i, v in enumerate(rng.standard_normal((n, DIM)).astype(np.float32))]
+
+
+@pytest.fixture
+def client(tmp_path):
+    return LocalMilvusClient(str(tmp_path / "store"))
+
+
+# ---- 过滤表达式 ----
+
+def test_compile_filter_operators():
+    columns = {"a": np.array([1, 2, 3, 4]), "s": np.array(["x.md", "y.md", 'q"z', "x.txt"], dtype=object)}
+    cols = columns.__getitem__
+    assert compile_filter("a >= 2 && a < 4")(cols).tolist() == [False, True, True, False]
+    assert compile_filter('s in ["x.md", "q\\"z"] or a == 2')(cols).tolist() == [True, True, True, False]
+    assert compile_filter('not (s like "x%")')(cols).tolist() == [False, True, True, False]
+    assert compile_filter("a not in [1, 4]")(cols).tolist() == [False, True, True, False]
+    assert compile_filter("   ") is None
+    with pytest.raises(ValueError):
+        compile_filter("a >")
+
+
+def test_routing_values():
+    assert routing_values('(source == "a") && (depth > 1)', "source") == ["a"]
+    assert routing_values('source in ["a", "b"] and (source == "b" && depth > 1)', "source") == ["b"]
+    assert routing_values('source == "a" || depth > 1', "source") is None
+    assert routing_values('depth == "source"', "source") is None
+
+
+# ---- 写入 / 查询 / 删除 ----
+
+def test_insert_query_delete_and_reload(client, tmp_path):
+    _create(client)
+    result = client.insert("docs", _rows(10))
+    assert result["insert_count"] == 10 and result["ids"] == list(range(1, 11))
+    assert len(client.query("docs", filter="depth == 0")) == 4
+    assert client.delete("docs", filter='source in ["doc0.md", "doc1.md"]')["delete_count"] == 4
+    assert client.delete("docs", ids=[3])["delete_count"] == 1
+    assert client.get_collection_stats("docs")["row_count"] == 5
+
+    reopened = LocalMilvusClient(str(tmp_path / "store"))
+    rows = reopened.query("docs", output_fields=["source"])
+    assert sorted(r["id"] for r in rows) == [4, 5, 8, 9, 10]
+    assert {r["source"] for r in rows} == {"doc2.md", "doc3.md", "doc4.md"}
+    assert len(reopened.query("docs", limit=2, offset=1)) == 2
+
+
+def _insert_in_child(path):
+    LocalMilvusClient(path).insert("docs", [{"source": "fail.md", "depth": 0, "text": "x", "dense": [0.0] * DIM}])
+
+
+def test_sees_writes_from_other_process(client, tmp_path):
+    """write_milvus: 写入进程 insert 后, 主进程用自己的客户端删除失败文件的数据"""
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("需要 fork")
+    _create(client)
+    client.insert("docs", _rows(3))
+    assert client.query("docs", filter='source == "fail.md"') == []   # 主进程已经加载了集合
+
+    process = multiprocessing.get_context("fork").Process(target=_insert_in_child, args=(str(tmp_path / "store"),))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+    assert client.delete("docs", filter='source == "fail.md"')["delete_count"] == 1
+    assert LocalMilvusClient(str(tmp_path / "store")).query("docs", filter='source == "fail.md"') == []
+    assert client.get_collection_stats("docs")["row_count"] == 3
+
+
+# ---- 检索 ----
+
+def test_dense_search_with_filter(client):
+    _create(client)
+    rows = _rows(20)
+    client.insert("docs", rows)
+    query = rows[7]["dense"]
+    hits = client.search("docs", [query], anns_field="dense", limit=3, output_fields=["source"])[0]
+    assert hits[0]["id"] == 8
+    assert [h["distance"] for h in hits] == sorted((h["distance"] for h in hits), reverse=True)
+
+    filtered = client.search("docs", [query], filter="depth == 2", anns_field="dense", limit=20)[0]
+    expected = {i + 1 for i, row in enumerate(rows) if row["depth"] == 2}
+    assert {h["id"] for h in filtered} == expected
+
+
+def test_ivf_with_all_probes_matches_exact(client):
+    _create(client, name="flat")
+    _create(client, name="ivf", index_type="IVF_FLAT", nlist=4)
+    rows = _rows(4 * 39 + 10)   # 达到 nlist * 39 行才训练
+    client.insert("flat", rows)
+    client.insert("ivf", rows)
+    query = np.random.default_rng(1).standard_normal(DIM).astype(np.float32)
+    exact = client.search("flat", [query], anns_field="dense", limit=5)[0]
+    ivf = client.search("ivf", [query], anns_field="dense", limit=5, search_params={"params": {"nprobe": 4}})[0]
+    assert [h["id"] for h in ivf] == [h["id"] for h in exact]
+
+
+@pytest.mark.parametrize("vector_type", ["FLOAT16_VECTOR", "BFLOAT16_VECTOR"])
+def test_half_precision_storage(client, vector_type):
+    _create(client, vector_type=vector_type)
+    rows = _rows(10)
+    client.insert("docs", rows)
+    stored = client.query("docs", filter="id == 4", output_fields=["dense"])[0]["dense"]
+    assert np.allclose(stored, rows[3]["dense"], atol=2e-2)
+    assert client.search("docs", [rows[3]["dense"]], anns_field="dense", limit=1)[0][0]["id"] == 4
+
+
+def test_bm25_search(client):
+    _create(client)
+    client.insert("docs", _rows(10))
+    hits = client.search("docs", ["banana"], anns_field="sparse", limit=10, output_fields=["text"])[0]
+    assert len(hits) == 5
+    assert all("banana" in h["entity"]["text"] for h in hits)
+    assert client.search("docs", ["durian"], anns_field="sparse", limit=10)[0] == []
+
+
+def test_bm25_scores_after_delete_match_rebuilt_index(client):
+    """删除的行不再计入 df / 平均长度, 得分与只写入剩余行的新索引一致"""
+    rows = _rows(20)
+    _create(client, name="deleted")
+    client.insert("deleted", rows)
+    client.delete("deleted", filter='source in ["doc0.md", "doc1.md"] || depth == 2')
+    _create(client, name="fresh")
+    client.insert("fresh", [r for r in rows if r["source"] not in ("doc0.md", "doc1.md") and r["depth"] != 2])
+
+    for query in ("banana", "apple cherry", "cherry 4"):
+        scores = {}
+        for name in ("deleted", "fresh"):
+            hits = client.search(name, [query], anns_field="sparse", limit=20, output_fields=["text"])[0]
+            scores[name] = {h["entity"]["text"]: h["distance"] for h in hits}
+        assert scores["deleted"].keys() == scores["fresh"].keys() and scores["fresh"]
+        for text, score in scores["fresh"].items():
+            assert scores["deleted"][text] == pytest.approx(score, rel=1e-5)
+
+
+def test_hybrid_search_rrf_and_weighted(client):
+    _create(client)
+    rows = _rows(10)
+    client.insert("docs", rows)
+    reqs = [_request("dense", [rows[1]["dense"]], limit=5), _request("sparse", ["banana"], limit=5)]
+    for ranker in (_Ranker("rrf", k=60), _Ranker("weighted", weights=[0.7, 0.3])):
+        hits = client.hybrid_search("docs", reqs, ranker, limit=3)[0]
+        assert hits[0]["id"] == 2   # 两路都命中的文档排第一
+        assert len(hits) == 3
+
+
+# ---- 分区键 / 索引 / 接口 ----
+
+def test_partition_key_routing(client):
+    _create(client, partition_key=True)
+    rows = _rows(20)
+    client.insert("docs", rows)
+    hits = client.search("docs", [rows[0]["dense"]], filter='(source == "doc2.md") && (depth >= 0)',
+                         anns_field="dense", limit=10, output_fields=["source"])[0]
+    assert len(hits) == 4 and {h["entity"]["source"] for h in hits} == {"doc2.md"}
+    assert client.delete("docs", filter='source in ["doc2.md", "doc3.md"]')["delete_count"] == 8
+    assert client.query("docs", filter='source == "doc2.md"') == []
+    assert len(client.query("docs", filter='source == "doc4.md" && depth != 99')) == 4
+
+
+def test_create_index_on_existing_collection(client):
+    _create(client)
+    index_params = client.prepare_index_params()
+    index_params.add_index("source", index_type="INVERTED", index_name="source_index")
+    client.create_index("docs", index_params)
+    assert "source_index" in client.list_indexes("docs")
+    assert client.describe_index("docs", "source_index")["index_type"] == "INVERTED"
+
+
+def test_client_satisfies_protocol(client):
+    assert isinstance(client, VectorStoreClient)
@@ -0,0 +1,155 @@
+import pytest
+
+from benchmarks.bench_markdown_parser import make_sample_corpus
+from documents.markdown_parser import MarkdownParser, SectionBuffer
+
+"""
+MarkdownParser (documents/markdown_parser.py) 的测试 使用 native 后端和 recursive 切片, 不需要网络
+运行: python -m pytest -q tests
+"""
+
+
+def _key(document):
+    return document.metadata.get("title"), document.metadata.get("category"), document.page_content
+
+
+def _write(tmp_path, text, name="doc.md"):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def parser():
+    return MarkdownParser(backend="native", chunk_strategy="recursive")
+
+
+@pytest.fixture
+def sample_files(tmp_path):
+    return make_sample_corpus(str(tmp_path), 3)
+
+
+# ---- 标题内容缓冲区 ----
+
+def test_section_buffer_join_is_idempotent():
+    buffer = SectionBuffer("标题")
+    assert buffer.text() == "标题"
+    buffer.append("段落一")
+    buffer.append("段落二")
+    assert buffer.text() == "标题->段落一->段落二"
+    assert buffer.text() == "标题->段落一->段落二"
+    assert buffer.parts == ["标题->段落一->段落二"]
+    buffer.append("段落三")
+    assert buffer.text() == "标题->段落一->段落二->段落三"
+
+
+def test_merge_nests_parent_content_into_child_titles(parser, tmp_path):
+    md_file = _write(tmp_path, "# 父\n\n父段落。\n\n## 子\n\n子段落。\n\n- 列表\n\n## 空标题\n\n# 另一章\n")
+    for merged in (parser.merge_title_content(parser.parse_markdown(md_file)),
+                   list(parser.iter_merged_documents(parser.iter_elements(md_file)))):
+        by_title = {d.metadata["title"]: d for d in merged}
+        assert by_title["父"].page_content == "父->父段落。"
+        assert by_title["子"].page_content == "父->父段落。 -> 子->子段落。->列表"
+        assert by_title["空标题"].page_content == "父->父段落。 -> 空标题"
+        assert by_title["另一章"].page_content == "另一章"
+        assert by_title["子"].metadata["category"] == "TitleWithContent"
+        assert by_title["空标题"].metadata["category"] == "Title"
+
+
+# ---- 流式合并 ----
+
+def test_iter_merged_documents_matches_merge_title_content(parser, sample_files):
+    for md_file in sample_files:
+        merged = parser.merge_title_content(parser.parse_markdown(md_file))
+        streamed = list(parser.iter_merged_documents(parser.iter_elements(md_file)))
+        assert sorted(map(_key, streamed)) == sorted(map(_key, merged))
+
+
+def test_iter_merged_documents_yields_before_file_ends(parser, sample_files):
+    consumed = []
+
+    def elements():
+        for element in parser.iter_elements(sample_files[0]):
+            consumed.append(element)
+            yield element
+
+    first = next(parser.iter_merged_documents(elements()))
+    total = len(parser.parse_markdown(sample_files[0]))
+    assert first.metadata["category"] == "TitleWithContent"
+    assert len(consumed) < total
+
+
+def test_iter_documents_matches_parse_markdown_to_documents(sample_files):
+    # 阈值调小 让一部分标题段落走切片策略
+    parser = MarkdownParser(backend="native", chunk_strategy="recursive", max_chunk_chars=300)
+    for md_file in sample_files:
+        expected = parser.parse_markdown_to_documents(md_file)
+        streamed = list(parser.iter_documents(md_file, chunk_batch_docs=2))
+        assert any(len(d.page_content) > 300 for d in parser.merge_title_content(parser.parse_markdown(md_file)))
+        assert sorted(map(_key, streamed)) == sorted(map(_key, expected))
+
+
+# ---- native 后端 ----
+
+def test_native_elements_structure(parser, tmp_path):
+    md_file = _write(tmp_path, "\n".join([
+        "<!-- 注释 -->",
+        "# 总览",
+        "",
+        "段落 **加粗** 和 [链接](http://example.com)。",
+        "",
+        "## 细节",
+        "",
+        "- 列表一",
+        "  - 子项",
+        "1. 有序",
+        "",
+        "| 参数 | 数值 |",
+        "| --- | --- |",
+        "| 温度 | 300 |",
+        "",
+        "```python",
+        "print('-> 不是标题')",
+        "# 也不是标题",
+        "```",
+        "",
+        "附录",
+        "====",
+    ]))
+    elements = parser.parse_markdown(md_file)
+    rows = [(e.metadata["category"], e.page_content) for e in elements]
+    assert rows == [
+        ("Title", "总览"),
+        ("NarrativeText", "段落 加粗 和 链接。"),
+        ("Title", "细节"),
+        ("ListItem", "列表一"),
+        ("ListItem", "子项"),
+        ("ListItem", "有序"),
+        ("Table", "参数 数值 温度 300"),
+        ("NarrativeText", "print('-> 不是标题')\n# 也不是标题"),
+        ("Title", "附录"),
+    ]
+    ids = [e.metadata["element_id"] for e in elements]
+    assert len(set(ids)) == len(ids)
+    overview, detail, appendix = (e for e in elements if e.metadata["category"] == "Title")
+    assert "parent_id" not in overview.metadata and overview.metadata["category_depth"] == 0
+    assert detail.metadata["parent_id"] == overview.metadata["element_id"] and detail.metadata["category_depth"] == 1
+    assert "parent_id" not in appendix.metadata   # Setext 一级标题 结束前面的所有标题
+    assert elements[1].metadata["parent_id"] == overview.metadata["element_id"]
+    assert all(e.metadata["parent_id"] == detail.metadata["element_id"] for e in elements[3:8])
+    assert [e.metadata["category_depth"] for e in elements[3:6]] == [0, 1, 0]
+    assert elements[0].metadata["filename"] == "doc.md" and elements[0].metadata["filetype"] == "text/markdown"
+
+
+def test_native_matches_unstructured_on_sample_file(sample_files):
+    pytest.importorskip("unstructured")
+    pytest.importorskip("langchain_community")
+    native = MarkdownParser(backend="native", chunk_strategy="recursive")
+    unstructured = MarkdownParser(backend="unstructured", chunk_strategy="recursive")
+    for md_file in sample_files:
+        try:
+            expected = unstructured.merge_title_content(unstructured.parse_markdown(md_file))
+        except (OSError, RuntimeError) as e:   # unstructured 首次使用时要下载 spaCy 模型
+            pytest.skip(f"unstructured 无法解析: {e}")
+        merged = native.merge_title_content(native.parse_markdown(md_file))
+        assert sorted(map(_key, merged)) == sorted(map(_key, expected))
@@ -0,0 +1,97 @@
+import math
+
+import pytest
+
+from utils.sparse_encoder import BM25SparseEncoder, CorpusStats, DEFAULT_AVGDL, bigram_tokenize, term_id
+
+"""
+客户端 BM25 编码 (utils/sparse_encoder.py) 的测试 使用 bigram 分词, 不依赖 jieba
+运行: python -m pytest -q tests
+"""
+
+TEXTS = ["干法刻蚀是利用等离子体进行刻蚀的工艺", "湿法刻蚀使用化学溶液", "光刻胶的涂布与显影", "etch rate and etch depth"]
+
+
+def _encoder(stats=None):
+    return BM25SparseEncoder(tokenizer="bigram", stats=stats if stats is not None else CorpusStats())
+
+
+def _stats(texts):
+    encoder = _encoder()
+    delta = CorpusStats()
+    encoder.encode_documents(texts, delta)
+    return delta
+
+
+def test_bigram_tokenize():
+    assert bigram_tokenize("Etch 刻蚀机") == ["etch", "刻", "蚀", "机", "刻蚀", "蚀机"]
+
+
+def test_add_and_remove():
+    stats = CorpusStats()
+    stats.add([1, 2], 10)
+    stats.add([2, 3], 20)
+    assert (stats.num_docs, stats.total_tokens, stats.df) == (2, 30, {1: 1, 2: 2, 3: 1})
+    assert stats.avgdl == 15
+    stats.remove([2, 3], 20)
+    assert (stats.num_docs, stats.total_tokens, stats.df) == (1, 10, {1: 1, 2: 1})
+    stats.remove([1, 2])   # 不知道长度时按平均长度扣减
+    assert (stats.num_docs, stats.total_tokens, stats.df) == (0, 0, {})
+    assert stats.avgdl == DEFAULT_AVGDL
+
+
+def test_merged_process_deltas_equal_single_pass():
+    # 多个解析进程各自统计增量 主进程合并后与单进程统计全部文档的结果相同
+    merged = CorpusStats()
+    for part in (TEXTS[:1], TEXTS[1:3], TEXTS[3:]):
+        merged.merge(_stats(part).to_dict())
+    expected = _stats(TEXTS)
+    assert merged.to_dict() == expected.to_dict()
+
+
+def test_subtract_reverses_merge():
+    stats = _stats(TEXTS)
+    failed = _stats(TEXTS[1:3])
+    stats.subtract(failed)
+    assert stats.to_dict() == _stats(TEXTS[:1] + TEXTS[3:]).to_dict()
+
+
+def test_subtract_without_lengths_uses_average():
+    # 写入失败的文档只有稀疏向量 (没有长度) 时按平均长度扣减
+    stats = CorpusStats(num_docs=4, total_tokens=400, df={1: 3, 2: 1})
+    failed = CorpusStats()
+    failed.add([1, 2], 0)
+    stats.subtract(failed.to_dict())
+    assert (stats.num_docs, stats.total_tokens, stats.df) == (3, 300, {1: 2})
+
+
+def test_idf_matches_bm25():
+    stats = CorpusStats(num_docs=10, total_tokens=100, df={1: 2})
+    assert stats.idf(1) == pytest.approx(math.log(1 + (10 - 2 + 0.5) / (2 + 0.5)))
+    assert stats.idf(2) > stats.idf(1)
+
+
+def test_save_and_load(tmp_path):
+    stats = _stats(TEXTS)
+    path = str(tmp_path / "stats" / "bm25.json")
+    stats.save(path)
+    assert CorpusStats.load(path).to_dict() == stats.to_dict()
+    assert CorpusStats.load(str(tmp_path / "missing.json")).num_docs == 0
+
+
+def test_query_document_inner_product_is_bm25_score():
+    stats = _stats(TEXTS)
+    encoder = _encoder(stats)
+    k1, b = encoder.k1, encoder.b
+    query = encoder.encode_query("干法刻蚀")
+    for text in TEXTS:
+        document = encoder.encode_document(text)
+        score = sum(weight * document.get(tid, 0.0) for tid, weight in query.items())
+        tf = encoder.term_frequencies(text)
+        length = sum(tf.values())
+        expected = 0.0
+        for token in set(encoder.tokenize("干法刻蚀")):
+            count = tf.get(term_id(token), 0)
+            expected += stats.idf(term_id(token)) * count * (k1 + 1) / (count + k1 * (1 - b + b * length / stats.avgdl))
+        assert score == pytest.approx(expected)
+    assert encoder.encode_query("xyz 雷达") == {}
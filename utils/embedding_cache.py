@@ -0,0 +1,323 @@
+import os
+import re
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+from utils.log_utils import log
+
+# 获得当前项目的绝对路径
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cache_dir = os.path.join(root_dir, "cache")  # 存放缓存文件目录的绝对路径
+DEFAULT_CACHE_PATH = os.path.join(cache_dir, "embedding_cache.sqlite")
+
+
+def normalize_text(text: str) -> str:
+    """归一化文本: 统一全角/半角等 Unicode 形式, 合并连续空白并去掉首尾空白"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def normalize_query(text: str) -> str:
+    """归一化查询: 在 normalize_text 基础上忽略大小写和句末标点, "干法刻蚀的优势？" 与 "干法刻蚀的优势" 视为同一个查询"""
+    return normalize_text(text).lower().rstrip("?？。.!！ ")
+
+
+def get_model_name(embeddings: Embeddings) -> str:
+    """获取 embedding 模型名称 作为缓存key的一部分, 换模型后旧向量不会被误用"""
+    return (
+        getattr(embeddings, "model", None)
+        or getattr(embeddings, "model_name", None)
+        or type(embeddings).__name__
+    )
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带持久化磁盘缓存的 Embeddings 包装器
+    缓存 key 为 (模型名称, 归一化文本的 sha256), 向量以 float32 存在 SQLite 中,
+    超过 max_entries 条时按最近访问时间淘汰最旧的条目
+    """
+
+    def __init__(self, embeddings: Embeddings, db_path: str = DEFAULT_CACHE_PATH,
+                 model_name: Optional[str] = None, max_entries: int = 500_000):
+        """
+        :param embeddings: 被包装的 embedding 对象 例如 llm_utils 中的 openai_embedding
+        :param db_path: SQLite 缓存文件路径
+        :param model_name: 模型名称 默认从 embeddings 对象上读取
+        :param max_entries: 缓存最多保存的向量条数
+        """
+        self.embeddings = embeddings
+        self.db_path = db_path
+        self.model_name = model_name or get_model_name(embeddings)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None   # 连接所属的进程 fork 出来的子进程需要重新建立连接
+        self._count = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")   # 多个进程同时读写
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+            conn.commit()
+            self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def _get_many(self, keys: List[str]) -> dict:
+        """批量读取缓存 并刷新命中条目的访问时间"""
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(keys), 500):   # SQLite 单条语句的参数个数有限制
+                part = keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                for key, blob in conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ):
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?",
+                                 [(now, key) for key in found])
+                conn.commit()
+        return found
+
+    def _put_many(self, items: dict):
+        """批量写入缓存 超出容量时淘汰最久未访问的条目"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items.items()],
+            )
+            self._count += len(items)
+            if self._count > self.max_entries:
+                # 一次多淘汰 10%, 避免每次写入都触发淘汰
+                self._count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                overflow = self._count - int(self.max_entries * 0.9)
+                if overflow > 0:
+                    conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_access LIMIT ?)", (overflow,)
+                    )
+                    self._count -= overflow
+                    log.info(f"embedding 缓存超出容量 {self.max_entries}, 淘汰了 {overflow} 条最久未使用的向量")
+            conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """先查缓存 只把未命中的文本(去重后)发送给 embedding 服务"""
+        keys = [self._key(t) for t in texts]
+        cached = self._get_many(list(set(keys)))
+
+        missing = {}   # key -> text 同一批次中重复的文本只请求一次
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        with self._lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self._put_many(new_items)
+            cached.update(new_items)
+        return [cached[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self._count,
+        }
+
+
+class _QueryAsDocuments(Embeddings):
+    """把 embed_query 适配成 embed_documents 这样查询向量也能复用 CachedEmbeddings 的磁盘缓存"""
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embeddings.embed_query(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+
+class QueryCachedEmbeddings(Embeddings):
+    """
+    查询向量的进程内 LRU + TTL 缓存 可选再叠加一层磁盘缓存
+    缓存 key 为 (模型名称, 归一化的查询文本); embed_documents 不做缓存直接透传
+    """
+
+    def __init__(self, embeddings: Embeddings, max_size: int = 10_000, ttl_seconds: Optional[float] = 3600,
+                 disk_path: Optional[str] = None):
+        """
+        :param embeddings: 被包装的 embedding 对象
+        :param max_size: 内存中最多缓存的查询数
+        :param ttl_seconds: 缓存有效期 None 表示永不过期
+        :param disk_path: 磁盘缓存的 SQLite 文件路径 为 None 时只使用内存缓存
+        """
+        self.embeddings = embeddings
+        self.model_name = get_model_name(embeddings)
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict = OrderedDict()   # key -> (写入时间, 向量)
+        self._lock = threading.Lock()
+        self.disk_cache = None
+        if disk_path:
+            self.disk_cache = CachedEmbeddings(_QueryAsDocuments(embeddings), db_path=disk_path,
+                                               model_name=f"{self.model_name}:query")
+
+    def _key(self, text: str) -> str:
+        return f"{self.model_name}:{normalize_query(text)}"
+
+    def _get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            item = self._cache.get(key)
+            if item is not None:
+                created, vector = item
+                if self.ttl_seconds is None or time.time() - created < self.ttl_seconds:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._cache[key]   # 已过期
+            self.misses += 1
+            return None
+
+    def _put(self, key: str, vector: List[float]):
+        with self._lock:
+            self._cache[key] = (time.time(), vector)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def _compute(self, texts: List[str]) -> List[List[float]]:
+        """内存未命中的查询: 先查磁盘缓存, 都按 embed_query 计算, 保证同一个 key 下的向量来自同一个接口"""
+        if self.disk_cache is not None:
+            return self.disk_cache.embed_documents(texts)   # 磁盘缓存未命中时逐条调用 embed_query
+        return [self.embeddings.embed_query(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            vector = self._compute([text])[0]
+            self._put(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self._get(key)
+        if vector is None:
+            if self.disk_cache is not None:
+                # 磁盘缓存是同步的 (SQLite + 未命中时的网络请求), 放到线程中执行, 不阻塞事件循环
+                vector = (await asyncio.to_thread(self.disk_cache.embed_documents, [text]))[0]
+            else:
+                vector = await self.embeddings.aembed_query(text)
+            self._put(key, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """批量计算查询向量 未命中的查询一起查磁盘缓存, 仍未命中的按 embed_query 计算 (与单条查询的向量一致)"""
+        keys = [self._key(t) for t in texts]
+        vectors = [self._get(k) for k in keys]
+        missing = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        computed = {}
+        if missing:
+            computed = dict(zip(missing, self._compute(list(missing.values()))))
+            for key, vector in computed.items():
+                self._put(key, vector)
+        return [v if v is not None else computed[k] for k, v in zip(keys, vectors)]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """embed_queries 的异步版本 磁盘缓存在线程中查找, 没有磁盘缓存时并发调用 aembed_query"""
+        keys = [self._key(t) for t in texts]
+        vectors = [self._get(k) for k in keys]
+        missing = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        computed = {}
+        if missing:
+            if self.disk_cache is not None:
+                results = await asyncio.to_thread(self._compute, list(missing.values()))
+            else:
+                results = await asyncio.gather(*(self.embeddings.aembed_query(t) for t in missing.values()))
+            computed = dict(zip(missing, results))
+            for key, vector in computed.items():
+                self._put(key, vector)
+        return [v if v is not None else computed[k] for k, v in zip(keys, vectors)]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        result = {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._cache),
+        }
+        if self.disk_cache is not None:
+            result["disk"] = self.disk_cache.stats()
+        return result
+
+
+_query_caches: dict = {}
+_query_caches_lock = threading.Lock()
+
+
+def cached_query_embeddings(embeddings: Embeddings, **kwargs) -> QueryCachedEmbeddings:
+    """
+    获取 embeddings 对应的进程级共享查询缓存 同一个 embedding 对象(例如 llm_utils.openai_embedding)只会包装一次,
+    各个检索入口共用同一份缓存和命中统计
+    :param kwargs: 首次创建时传给 QueryCachedEmbeddings 的参数
+    """
+    with _query_caches_lock:
+        cache = _query_caches.get(id(embeddings))
+        if cache is None or cache.embeddings is not embeddings:
+            cache = QueryCachedEmbeddings(embeddings, **kwargs)
+            _query_caches[id(embeddings)] = cache
+        return cache
@@ -0,0 +1,1076 @@
+import sys
+import os
+import re
+import json
+import math
+import shutil
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from utils.log_utils import log
+from utils.sparse_encoder import create_tokenizer
+
+"""
+进程内的本地向量库 实现本项目用到的 MilvusClient 接口子集, 用于 CI / 压测 / 离线环境
+通过 uri "local://<目录>" 从 utils.milvus_connection.get_milvus_client 获取, 其余代码不需要任何改动
+- schema / 索引参数 / BM25 Function 与 milvus_db_with_schema.create_collection 的写法一致
+- 稠密向量: NumPy 内存映射文件, 支持 FLOAT / FLOAT16 / BFLOAT16 存储; HNSW / HNSW_SQ / FLAT / AUTOINDEX 为精确暴力检索,
+            IVF 系列 (IVF_FLAT / IVF_SQ8 / IVF_PQ) 在本地用 k-means 建倒排簇按 nprobe 检索, 簇内不做量化
+- 稀疏向量: BM25 Function 的输出字段在本地建倒排索引(jieba 分词, 未安装时按英文单词+中文单字/二元组切分);
+            没有 BM25 Function 的稀疏字段按客户端提供的 {词id: 权重} 做内积检索
+- 标量过滤: 支持 == != > >= < <= in / not in / like, && || !, and or not, 括号
+- 分区键: schema 中 is_partition_key 的字段维护 取值 -> 行号 的映射, 过滤条件顶层用 && 连接了 key == / key in 时
+          只在这些行上求值和检索 (相当于 Milvus 的分区裁剪, 本地按取值精确划分, num_partitions 只做记录)
+- hybrid_search: RRFRanker / WeightedRanker 融合
+- 持久化: 每个集合一个目录, 稠密向量和有效位为内存映射文件, 标量和文本逐行追加到 rows.jsonl, BM25 倒排在加载时重建
+同一时刻只允许一个进程写入 (例如 write_milvus 的写入进程 insert, 结束后主进程再 delete);
+每次读写前检查 meta.json 是否被其他进程替换过, 是则从磁盘重新加载集合, 不会基于过期的内存索引读写
+"""
+
+LOCAL_URI_PREFIX = "local://"
+
+# ---------------------------------------------------------------------------
+# 标量过滤表达式
+# ---------------------------------------------------------------------------
+
+_TOKEN_REGEX = re.compile(r"""
+    \s*(?:
+        (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+      | (?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)
+      | (?P<op>==|!=|>=|<=|&&|\|\||[><!()\[\],])
+      | (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    )""", re.VERBOSE)
+
+
+def _tokenize_expr(expr: str) -> list:
+    tokens, position = [], 0
+    expr = expr.strip()
+    while position < len(expr):
+        match = _TOKEN_REGEX.match(expr, position)
+        if not match or match.end() == position:
+            raise ValueError(f"无法解析的过滤表达式: {expr!r} (位置 {position})")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        elif kind == "number":
+            value = float(value) if any(c in value for c in ".eE") else int(value)
+        elif kind == "name" and value.lower() in ("and", "or", "not", "in", "like", "true", "false"):
+            kind, value = "keyword", value.lower()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _ExprParser:
+    """递归下降解析 生成 columns -> 布尔掩码 的函数"""
+
+    def __init__(self, expr: str):
+        self.tokens = _tokenize_expr(expr)
+        self.position = 0
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def _take(self):
+        token = self._peek()
+        self.position += 1
+        return token
+
+    def _expect(self, value):
+        kind, token = self._take()
+        if token != value:
+            raise ValueError(f"过滤表达式缺少 {value!r}, 实际为 {token!r}")
+
+    def parse(self) -> Callable:
+        node = self._or()
+        if self.position != len(self.tokens):
+            raise ValueError(f"过滤表达式有多余的内容: {self.tokens[self.position:]}")
+        return node
+
+    def _or(self):
+        left = self._and()
+        while self._peek()[1] in ("||", "or"):
+            self._take()
+            left = (lambda a, b: lambda cols: a(cols) | b(cols))(left, self._and())
+        return left
+
+    def _and(self):
+        left = self._not()
+        while self._peek()[1] in ("&&", "and"):
+            self._take()
+            left = (lambda a, b: lambda cols: a(cols) & b(cols))(left, self._not())
+        return left
+
+    def _not(self):
+        if self._peek()[1] in ("!", "not"):
+            self._take()
+            inner = self._not()
+            return lambda cols: ~inner(cols)
+        return self._primary()
+
+    def _literal(self):
+        kind, value = self._take()
+        if kind in ("string", "number"):
+            return value
+        if kind == "keyword" and value in ("true", "false"):
+            return value == "true"
+        raise ValueError(f"过滤表达式中应为常量, 实际为 {value!r}")
+
+    def _primary(self):
+        kind, value = self._peek()
+        if value == "(":
+            self._take()
+            node = self._or()
+            self._expect(")")
+            return node
+        if kind != "name":
+            raise ValueError(f"过滤表达式中应为字段名, 实际为 {value!r}")
+        field = self._take()[1]
+        kind, op = self._take()
+        if op == "not":
+            self._expect("in")
+            values = self._list()
+            return lambda cols: ~np.isin(cols(field), values)
+        if op == "in":
+            values = self._list()
+            return lambda cols: np.isin(cols(field), values)
+        if op == "like":
+            pattern = re.compile("^" + re.escape(self._literal()).replace("%", ".*").replace("_", ".") + "$")
+            return lambda cols: np.array([isinstance(v, str) and bool(pattern.match(v)) for v in cols(field)], dtype=bool)
+        literal = self._literal()
+        comparisons = {
+            "==": lambda column: column == literal,
+            "!=": lambda column: column != literal,
+            ">": lambda column: column > literal,
+            ">=": lambda column: column >= literal,
+            "<": lambda column: column < literal,
+            "<=": lambda column: column <= literal,
+        }
+        if op not in comparisons:
+            raise ValueError(f"不支持的比较运算符: {op!r}")
+        compare = comparisons[op]
+        return lambda cols: np.asarray(compare(cols(field)), dtype=bool)
+
+    def _list(self) -> list:
+        self._expect("[")
+        values = []
+        while self._peek()[1] != "]":
+            values.append(self._literal())
+            if self._peek()[1] == ",":
+                self._take()
+        self._expect("]")
+        return values
+
+
+def compile_filter(expr: Optional[str]) -> Optional[Callable]:
+    """把 Milvus 风格的过滤表达式编译成函数: columns(字段名) -> 列数组, 返回布尔掩码; 空表达式返回 None"""
+    if not expr or not expr.strip():
+        return None
+    return _ExprParser(expr).parse()
+
+
+def _conjuncts(tokens: list) -> Optional[List[list]]:
+    """按顶层的 && / and 拆分 顶层出现 || / or 时返回 None; 整体被括号包住的条件会展开"""
+    parts, current, depth = [], [], 0
+    for kind, value in tokens:
+        if kind == "op" and value == "(":
+            depth += 1
+        elif kind == "op" and value == ")":
+            depth -= 1
+        if depth == 0 and (kind, value) in (("op", "||"), ("keyword", "or")):
+            return None
+        if depth == 0 and (kind, value) in (("op", "&&"), ("keyword", "and")):
+            parts.append(current)
+            current = []
+            continue
+        current.append((kind, value))
+    parts.append(current)
+
+    result = []
+    for part in parts:
+        if len(part) > 2 and part[0] == ("op", "(") and part[-1] == ("op", ")") and _wrapped(part):
+            inner = _conjuncts(part[1:-1])
+            result.extend(inner if inner is not None else [part])
+        else:
+            result.append(part)
+    return result
+
+
+def _wrapped(tokens: list) -> bool:
+    """第一个左括号是否与最后一个右括号配对"""
+    depth = 0
+    for i, (kind, value) in enumerate(tokens):
+        if kind == "op" and value == "(":
+            depth += 1
+        elif kind == "op" and value == ")":
+            depth -= 1
+            if depth == 0:
+                return i == len(tokens) - 1
+    return False
+
+
+def routing_values(expr: Optional[str], key_field: str) -> Optional[list]:
+    """
+    过滤条件限定的分区键取值 只识别顶层用 && 连接的 key == 常量 / key in [常量, ...]
+    :return: 取值列表; 无法确定时返回 None (需要检查全部行)
+    """
+    if not expr or not expr.strip():
+        return None
+    conjuncts = _conjuncts(_tokenize_expr(expr))
+    if conjuncts is None:
+        return None
+    values = None
+    for part in conjuncts:
+        if len(part) < 3 or part[0] != ("name", key_field):
+            continue
+        if part[1] == ("op", "==") and len(part) == 3 and part[2][0] in ("string", "number"):
+            found = [part[2][1]]
+        elif part[1] == ("keyword", "in") and part[2] == ("op", "[") and part[-1] == ("op", "]"):
+            found = [value for kind, value in part[3:-1] if kind in ("string", "number")]
+        else:
+            continue
+        values = found if values is None else [v for v in values if v in found]
+    return values
+
+
+# ---------------------------------------------------------------------------
+# 分词与倒排索引
+# ---------------------------------------------------------------------------
+
+def create_analyzer(analyzer_params: Optional[dict]) -> Callable[[str], List[str]]:
+    """与 Milvus 字段的 analyzer_params 对应 分词与客户端 BM25 编码器 (utils.sparse_encoder) 相同"""
+    return create_tokenizer((analyzer_params or {}).get("tokenizer") or (analyzer_params or {}).get("type"))
+
+
+def _remove_postings(postings: dict, row: int, terms: Iterable):
+    for term in terms:
+        rows = postings.get(term)
+        if rows is None:
+            continue
+        rows.pop(row, None)
+        if not rows:
+            del postings[term]
+
+
+class BM25Index:
+    """BM25 倒排索引 文档的词频在写入时统计, 查询时按 k1 / b 计算得分"""
+
+    def __init__(self, analyzer: Callable[[str], List[str]], k1: float = 1.2, b: float = 0.75):
+        self.analyzer = analyzer
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)   # 词 -> {行号: 词频}
+        self.row_terms: Dict[int, Tuple[str, ...]] = {}   # 行号 -> 该行出现过的词 删除时据此清理倒排表
+        self.doc_lengths: List[int] = []
+        self.total_length = 0
+        self.live_docs = 0
+
+    def add(self, row: int, text: str):
+        terms = self.analyzer(text or "")
+        for term in terms:
+            postings = self.postings[term]
+            postings[row] = postings.get(row, 0) + 1
+        self.row_terms[row] = tuple(set(terms))
+        while len(self.doc_lengths) <= row:
+            self.doc_lengths.append(0)
+        self.doc_lengths[row] = len(terms)
+        self.total_length += len(terms)
+        self.live_docs += 1
+
+    def remove(self, row: int):
+        # 从倒排表中删掉该行 df 只统计有效的行, 与重新建索引的得分一致
+        terms = self.row_terms.pop(row, None)
+        if terms is None:
+            return
+        _remove_postings(self.postings, row, terms)
+        self.total_length -= self.doc_lengths[row]
+        self.live_docs -= 1
+
+    def query_weights(self, text: str) -> Dict[str, float]:
+        """查询中每个词的 idf 权重 (重复的词累加)"""
+        weights = defaultdict(float)
+        n = max(self.live_docs, 1)
+        for term in self.analyzer(text):
+            df = len(self.postings.get(term, ()))
+            if df:
+                weights[term] += math.log(1 + (n - df + 0.5) / (df + 0.5))
+        return weights
+
+    def search(self, text: str, mask: np.ndarray, drop_ratio: float = 0.0) -> np.ndarray:
+        """返回每一行的 BM25 得分 不匹配的行为 -inf"""
+        scores = np.full(len(mask), -np.inf, dtype=np.float32)
+        weights = sorted(self.query_weights(text).items(), key=lambda item: item[1], reverse=True)
+        # 与 Milvus 的 drop_ratio_search 相同: 丢弃查询向量中权重最小的一部分词
+        keep = len(weights) - int(len(weights) * drop_ratio)
+        avg_length = self.total_length / max(self.live_docs, 1) or 1.0
+        doc_lengths = np.asarray(self.doc_lengths, dtype=np.float32)
+        for term, idf in weights[:max(keep, 1) if weights else 0]:
+            postings = self.postings[term]
+            rows = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            tf = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            norm = self.k1 * (1 - self.b + self.b * doc_lengths[rows] / avg_length)
+            term_scores = idf * tf * (self.k1 + 1) / (tf + norm)
+            current = scores[rows]
+            scores[rows] = np.where(np.isneginf(current), term_scores, current + term_scores)
+        scores[~mask] = -np.inf
+        return scores
+
+
+class SparseIPIndex:
+    """客户端提供稀疏向量时使用的倒排索引 得分为内积"""
+
+    def __init__(self):
+        self.postings: Dict[int, Dict[int, float]] = defaultdict(dict)   # 词id -> {行号: 权重}
+        self.row_terms: Dict[int, Tuple[int, ...]] = {}
+
+    def add(self, row: int, vector: dict):
+        for term, weight in (vector or {}).items():
+            self.postings[int(term)][row] = float(weight)
+        self.row_terms[row] = tuple(int(term) for term in (vector or {}))
+
+    def remove(self, row: int):
+        terms = self.row_terms.pop(row, None)
+        if terms is not None:
+            _remove_postings(self.postings, row, terms)
+
+    def search(self, vector: dict, mask: np.ndarray, drop_ratio: float = 0.0) -> np.ndarray:
+        scores = np.full(len(mask), -np.inf, dtype=np.float32)
+        items = sorted(((int(t), float(w)) for t, w in vector.items()), key=lambda item: abs(item[1]), reverse=True)
+        keep = len(items) - int(len(items) * drop_ratio)
+        for term, weight in items[:max(keep, 1) if items else 0]:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            rows = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            values = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            current = scores[rows]
+            scores[rows] = np.where(np.isneginf(current), 0, current) + weight * values
+        scores[~mask] = -np.inf
+        return scores
+
+
+# ---------------------------------------------------------------------------
+# 稠密向量
+# ---------------------------------------------------------------------------
+
+class MemmapArray:
+    """按行追加的内存映射数组 容量不足时成倍扩容"""
+
+    def __init__(self, path: str, dtype, width: int = 0):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.row_bytes = self.dtype.itemsize * max(width, 1)
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self.array = None
+        self._map()
+
+    def _shape(self, rows: int):
+        return (rows, self.width) if self.width else (rows,)
+
+    def _map(self):
+        capacity = os.path.getsize(self.path) // self.row_bytes
+        self.array = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=self._shape(capacity)) if capacity else \
+            np.zeros(self._shape(0), dtype=self.dtype)
+
+    @property
+    def capacity(self) -> int:
+        return self.array.shape[0]
+
+    def ensure(self, rows: int):
+        if rows <= self.capacity:
+            return
+        new_capacity = max(rows, self.capacity * 2, 1024)
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+        self.array = None
+        with open(self.path, "r+b") as f:
+            f.truncate(new_capacity * self.row_bytes)
+        self._map()
+
+    def flush(self):
+        if isinstance(self.array, np.memmap):
+            self.array.flush()
+
+
+class IVFIndex:
+    """本地的 IVF_FLAT: k-means 聚类中心 + 每个簇的行号列表, 检索 nprobe 个最近的簇后在簇内精确计算"""
+
+    def __init__(self, nlist: int, metric: str):
+        self.nlist = nlist
+        self.metric = metric
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[List[int]] = []
+        self.trained_rows = 0
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self.metric == "L2":
+            distances = (vectors ** 2).sum(1, keepdims=True) - 2 * vectors @ self.centroids.T + (self.centroids ** 2).sum(1)
+            return distances.argmin(1)
+        return (vectors @ self.centroids.T).argmax(1)
+
+    def train(self, vectors: np.ndarray, rows: np.ndarray, iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        nlist = min(self.nlist, len(rows))
+        sample = vectors[rng.choice(len(rows), size=min(len(rows), nlist * 256), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = self._assign(sample)
+            for c in range(nlist):
+                members = sample[assignment == c]
+                if len(members):
+                    self.centroids[c] = members.mean(0)
+        self.lists = [[] for _ in range(nlist)]
+        for row, cluster in zip(rows.tolist(), self._assign(vectors).tolist()):
+            self.lists[cluster].append(row)
+        self.trained_rows = len(rows)
+
+    def add(self, vectors: np.ndarray, rows: List[int]):
+        for row, cluster in zip(rows, self._assign(vectors).tolist()):
+            self.lists[cluster].append(row)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        scores = -((self.centroids - query) ** 2).sum(1) if self.metric == "L2" else self.centroids @ query
+        probe = np.argsort(-scores)[:nprobe]
+        rows = [row for c in probe for row in self.lists[c]]
+        return np.asarray(rows, dtype=np.int64)
+
+
+def _enum_name(value) -> str:
+    """pymilvus 的 DataType / IndexType / MetricType 枚举与字符串统一成大写名称"""
+    return str(getattr(value, "name", value)).upper()
+
+
+# ---------------------------------------------------------------------------
+# schema 与索引参数 (与 MilvusClient.create_schema / prepare_index_params 的用法一致)
+# ---------------------------------------------------------------------------
+
+class LocalSchema:
+    def __init__(self, auto_id: bool = False, **kwargs):
+        self.auto_id = auto_id
+        self.fields: List[dict] = []
+        self.functions: List[dict] = []
+
+    def add_field(self, field_name: str, datatype, is_primary: bool = False, auto_id: Optional[bool] = None, **kwargs):
+        field = {"name": field_name, "type": _enum_name(datatype), "is_primary": is_primary,
+                 "auto_id": bool(is_primary and (self.auto_id if auto_id is None else auto_id))}
+        for key in ("dim", "max_length", "enable_analyzer", "analyzer_params", "default_value", "nullable",
+                    "is_partition_key"):
+            if key in kwargs:
+                field[key] = kwargs[key]
+        self.fields.append(field)
+        return self
+
+    def add_function(self, function):
+        self.functions.append({
+            "name": getattr(function, "name", "bm25"),
+            "type": _enum_name(getattr(function, "type", "BM25")),
+            "input_field_names": list(getattr(function, "input_field_names", [])),
+            "output_field_names": list(getattr(function, "output_field_names", [])),
+        })
+        return self
+
+
+class LocalIndexParams(list):
+    def add_index(self, field_name: str, index_type="", index_name: str = "", metric_type="", params=None, **kwargs):
+        self.append({"field_name": field_name, "index_type": _enum_name(index_type) if index_type else "AUTOINDEX",
+                     "index_name": index_name or f"{field_name}_index",
+                     "metric_type": _enum_name(metric_type) if metric_type else "",
+                     "params": dict(params or {})})
+
+
+# ---------------------------------------------------------------------------
+# 集合
+# ---------------------------------------------------------------------------
+
+# 向量类型 -> 内存映射文件中的存储类型 (BFLOAT16 以 uint16 保存原始位)
+DENSE_TYPES = {"FLOAT_VECTOR": np.float32, "FLOAT16_VECTOR": np.float16, "BFLOAT16_VECTOR": np.uint16}
+
+
+def _encode_dense(value, vector_type: str) -> np.ndarray:
+    """把写入/查询的向量转换为存储类型 FLOAT16 / BFLOAT16 与 pymilvus 一样接受 numpy 数组或小端字节串"""
+    if vector_type == "BFLOAT16_VECTOR":
+        if isinstance(value, (bytes, bytearray)):
+            return np.frombuffer(value, dtype="<u2")
+        bits = np.asarray(value, dtype=np.float32).view(np.uint32)
+        return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+    if isinstance(value, (bytes, bytearray)):
+        return np.frombuffer(value, dtype="<f2" if vector_type == "FLOAT16_VECTOR" else "<f4")
+    return np.asarray(value, dtype=DENSE_TYPES[vector_type])
+
+
+def _decode_dense(stored: np.ndarray, vector_type: str) -> np.ndarray:
+    if vector_type == "BFLOAT16_VECTOR":
+        return (np.asarray(stored).astype(np.uint32) << 16).view(np.float32)
+    return np.asarray(stored, dtype=np.float32)
+SPARSE_TYPE = "SPARSE_FLOAT_VECTOR"
+
+
+class LocalCollection:
+    """一个集合的数据和索引 所有方法在集合锁内执行"""
+
+    def __init__(self, directory: str, meta: dict):
+        self.directory = directory
+        self.meta = meta
+        self.lock = threading.RLock()
+        self.fields = {f["name"]: f for f in meta["fields"]}
+        self.primary = next(f["name"] for f in meta["fields"] if f.get("is_primary"))
+        self.indexes = {i["field_name"]: i for i in meta.get("indexes", [])}
+        self.bm25_outputs = {}   # 稀疏输出字段 -> 文本输入字段
+        for function in meta.get("functions", []):
+            if function["type"] == "BM25":
+                self.bm25_outputs[function["output_field_names"][0]] = function["input_field_names"][0]
+
+        self.rows: List[dict] = []   # 标量 + 文本 (以及客户端提供的稀疏向量)
+        self.valid = MemmapArray(os.path.join(directory, "valid.u8"), np.uint8)
+        self.dense = {name: MemmapArray(os.path.join(directory, f"{name}.vec"), DENSE_TYPES[f["type"]], f["dim"])
+                      for name, f in self.fields.items() if f["type"] in DENSE_TYPES}
+        self.sparse = {}
+        for name, f in self.fields.items():
+            if f["type"] != SPARSE_TYPE:
+                continue
+            if name in self.bm25_outputs:
+                params = self.indexes.get(name, {}).get("params", {})
+                source = self.fields[self.bm25_outputs[name]]
+                self.sparse[name] = BM25Index(create_analyzer(source.get("analyzer_params")),
+                                              k1=params.get("bm25_k1", 1.2), b=params.get("bm25_b", 0.75))
+            else:
+                self.sparse[name] = SparseIPIndex()
+        self.ivf: Dict[str, IVFIndex] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self.partition_key = next((name for name, f in self.fields.items() if f.get("is_partition_key")), None)
+        self.key_rows: Dict[Any, set] = defaultdict(set)   # 分区键取值 -> 有效行号
+        self.signature = self.disk_signature()   # 加载时的 meta.json 状态
+        self._load_rows()
+
+    # ---- 持久化 ----
+    @property
+    def rows_path(self) -> str:
+        return os.path.join(self.directory, "rows.jsonl")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def disk_signature(self) -> Optional[tuple]:
+        """meta.json 每次写入都是替换成新文件 inode 或修改时间变化说明集合被写过"""
+        try:
+            stat = os.stat(self.meta_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _save_meta(self):
+        self.meta["version"] = self.meta.get("version", 0) + 1
+        with open(self.meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        os.replace(self.meta_path + ".tmp", self.meta_path)
+        self.signature = self.disk_signature()
+
+    def _load_rows(self):
+        count = self.meta.get("count", 0)
+        if not os.path.exists(self.rows_path):
+            return
+        with open(self.rows_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if len(self.rows) >= count:   # 上次写入中途退出 多出来的行丢弃
+                    break
+                self.rows.append(json.loads(line))
+        valid = self.valid.array
+        for row_index, row in enumerate(self.rows):
+            if valid[row_index]:
+                self._index_row(row_index, row)
+
+    def _index_row(self, row_index: int, row: dict):
+        if self.partition_key:
+            self.key_rows[row.get(self.partition_key)].add(row_index)
+        for name, index in self.sparse.items():
+            if isinstance(index, BM25Index):
+                index.add(row_index, row.get(self.bm25_outputs[name], ""))
+            else:
+                index.add(row_index, row.get(name))
+
+    # ---- 写入 / 删除 ----
+    def insert(self, data: List[dict]) -> dict:
+        with self.lock:
+            start = len(self.rows)
+            end = start + len(data)
+            self.valid.ensure(end)
+            for store in self.dense.values():
+                store.ensure(end)
+            ids, lines = [], []
+            for offset, item in enumerate(data):
+                row_index = start + offset
+                row = {}
+                for name, field in self.fields.items():
+                    if field["type"] in DENSE_TYPES:
+                        self.dense[name].array[row_index] = _encode_dense(item[name], field["type"])
+                    elif name in self.bm25_outputs:
+                        continue   # 由 BM25 Function 根据文本字段生成
+                    elif field.get("is_primary") and field.get("auto_id"):
+                        row[name] = self.meta["next_id"]
+                        self.meta["next_id"] += 1
+                    elif field["type"] == SPARSE_TYPE:
+                        row[name] = {str(k): float(v) for k, v in (item.get(name) or {}).items()}
+                    else:
+                        row[name] = item.get(name, field.get("default_value"))
+                # 动态字段 (langchain 写入的 metadata 等) 原样保存
+                for key, value in item.items():
+                    if key not in self.fields:
+                        row[key] = value
+                self.rows.append(row)
+                self.valid.array[row_index] = 1
+                self._index_row(row_index, row)
+                ids.append(row[self.primary])
+                lines.append(json.dumps(row, ensure_ascii=False))
+            for store in self.dense.values():
+                store.flush()
+            self.valid.flush()
+            with open(self.rows_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            self.meta["count"] = end
+            self._save_meta()
+            self._columns = {}
+            for name, ivf in self.ivf.items():
+                ivf.add(self.vectors(name, np.arange(start, end)), list(range(start, end)))
+            return {"insert_count": len(data), "ids": ids}
+
+    def delete(self, filter: str = "", ids: Optional[list] = None) -> dict:
+        with self.lock:
+            mask = self.mask(filter)
+            if ids is not None:
+                mask &= np.isin(self.column(self.primary), list(ids))
+            rows = np.nonzero(mask)[0]
+            for row_index in rows.tolist():
+                self.valid.array[row_index] = 0
+                if self.partition_key:
+                    self.key_rows[self.rows[row_index].get(self.partition_key)].discard(row_index)
+                for index in self.sparse.values():
+                    index.remove(row_index)
+            self.valid.flush()
+            if len(rows):
+                self._save_meta()   # 更新 meta.json 让其他进程知道有效位变了
+            return {"delete_count": int(len(rows))}
+
+    # ---- 查询 ----
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    def column(self, name: str) -> np.ndarray:
+        column = self._columns.get(name)
+        if column is None:
+            values = [row.get(name) for row in self.rows]
+            if name in self.fields and self.fields[name]["type"] in ("INT8", "INT16", "INT32", "INT64") \
+                    and all(v is not None for v in values):
+                column = np.asarray(values, dtype=np.int64)
+            elif name in self.fields and self.fields[name]["type"] in ("FLOAT", "DOUBLE") \
+                    and all(v is not None for v in values):
+                column = np.asarray(values, dtype=np.float64)
+            else:
+                column = np.empty(len(values), dtype=object)
+                column[:] = values
+            self._columns[name] = column
+        return column
+
+    def routed_rows(self, expr: Optional[str]) -> Optional[np.ndarray]:
+        """过滤条件限定了分区键取值时 返回这些取值对应的有效行号; 否则返回 None"""
+        if not self.partition_key:
+            return None
+        values = routing_values(expr, self.partition_key)
+        if values is None:
+            return None
+        rows = set()
+        for value in values:
+            rows.update(self.key_rows.get(value, ()))
+        return np.fromiter(sorted(rows), dtype=np.int64, count=len(rows))
+
+    def mask(self, expr: Optional[str] = None) -> np.ndarray:
+        """有效且满足过滤条件的行 按分区键路由时只在对应的行上计算过滤条件"""
+        valid = np.asarray(self.valid.array[:self.count], dtype=bool)
+        predicate = compile_filter(expr)
+        rows = self.routed_rows(expr)
+        if rows is None:
+            mask = valid.copy()
+            if predicate is not None and self.count:
+                mask &= predicate(self.column)
+            return mask
+        mask = np.zeros(self.count, dtype=bool)
+        rows = rows[valid[rows]]
+        if predicate is not None and len(rows):
+            rows = rows[predicate(lambda name: self.column(name)[rows])]
+        mask[rows] = True
+        return mask
+
+    def entity(self, row_index: int, output_fields: Optional[List[str]]) -> dict:
+        row = self.rows[row_index]
+        if not output_fields:
+            return {self.primary: row[self.primary]}
+        entity = {}
+        for name in output_fields:
+            if name == "*":
+                entity.update({k: v for k, v in row.items()})
+                continue
+            if name in self.dense:
+                entity[name] = self.vectors(name, [row_index])[0].tolist()
+            elif name in row:
+                entity[name] = row[name]
+        return entity
+
+    def vectors(self, field: str, rows) -> np.ndarray:
+        """读出指定行的向量 统一转换为 float32"""
+        return _decode_dense(self.dense[field].array[rows], self.fields[field]["type"])
+
+    def _dense_scores(self, field: str, query: np.ndarray, mask: np.ndarray, params: dict) -> np.ndarray:
+        index = self.indexes.get(field, {})
+        metric = index.get("metric_type") or "IP"
+        candidates = None
+        rows = np.nonzero(mask)[0]
+        if index.get("index_type", "").startswith("IVF"):
+            ivf = self._ivf(field, index, metric)
+            if ivf is not None:
+                candidates = ivf.candidates(query, int(params.get("nprobe", 8)))
+        scores = np.full(self.count, -np.inf, dtype=np.float32)
+        # 过滤后剩下的行比 nprobe 个簇还少时 (例如按分区键路由) 直接精确检索这些行
+        if candidates is not None and len(candidates) < len(rows):
+            rows = candidates[mask[candidates]]
+        if not len(rows):
+            return scores
+        subset = self.vectors(field, rows)
+        if metric == "L2":
+            scores[rows] = -((subset - query) ** 2).sum(1)
+        elif metric == "COSINE":
+            norms = np.linalg.norm(subset, axis=1) * (np.linalg.norm(query) or 1.0)
+            scores[rows] = subset @ query / np.where(norms == 0, 1, norms)
+        else:
+            scores[rows] = subset @ query
+        return scores
+
+    def _ivf(self, field: str, index: dict, metric: str) -> Optional[IVFIndex]:
+        nlist = int(index.get("params", {}).get("nlist", 128))
+        valid_rows = np.nonzero(np.asarray(self.valid.array[:self.count], dtype=bool))[0]
+        if len(valid_rows) < nlist * 39:   # 数据太少时聚类没有意义 直接精确检索
+            return None
+        ivf = self.ivf.get(field)
+        if ivf is None or len(valid_rows) > 2 * ivf.trained_rows:
+            ivf = IVFIndex(nlist, metric)
+            ivf.train(self.vectors(field, valid_rows), valid_rows)
+            self.ivf[field] = ivf
+            log.info(f"本地 IVF 索引已训练: 字段 {field}, {len(valid_rows)} 行, nlist={nlist}")
+        return ivf
+
+    def search(self, field: str, data: list, limit: int, expr: Optional[str] = None,
+               params: Optional[dict] = None) -> List[List[tuple]]:
+        """返回每个查询的 [(行号, 得分)], 得分越大越相关 (L2 返回负的平方距离)"""
+        params = params or {}
+        with self.lock:
+            mask = self.mask(expr)
+            results = []
+            for query in data:
+                if field in self.dense:
+                    vector_type = self.fields[field]["type"]
+                    query = _decode_dense(_encode_dense(query, vector_type), vector_type)
+                    scores = self._dense_scores(field, query, mask, params)
+                elif field in self.sparse:
+                    scores = self.sparse[field].search(query, mask, float(params.get("drop_ratio_search", 0.0)))
+                else:
+                    raise ValueError(f"字段 {field} 不是向量字段")
+                top = min(limit, int(np.isfinite(scores).sum()))
+                if top <= 0:
+                    results.append([])
+                    continue
+                best = np.argpartition(-scores, top - 1)[:top]
+                best = best[np.argsort(-scores[best])]
+                results.append([(int(i), float(scores[i])) for i in best])
+            return results
+
+    def metric(self, field: str) -> str:
+        if field in self.sparse:
+            return "BM25" if field in self.bm25_outputs else "IP"
+        return self.indexes.get(field, {}).get("metric_type") or "IP"
+
+
+# ---------------------------------------------------------------------------
+# 客户端
+# ---------------------------------------------------------------------------
+
+def _ranker_spec(ranker) -> dict:
+    """读取 pymilvus RRFRanker / WeightedRanker 的参数"""
+    if hasattr(ranker, "dict"):
+        spec = ranker.dict()
+        return {"strategy": spec.get("strategy"), "params": spec.get("params", {})}
+    return {"strategy": "rrf", "params": {"k": 60}}
+
+
+def _normalize_score(score: float, metric: str) -> float:
+    """与 Milvus WeightedRanker 相同的归一化方式"""
+    if metric == "L2":
+        return 1 - 2 * math.atan(-score) / math.pi   # 这里 L2 得分为负的距离
+    if metric in ("IP", "COSINE"):
+        return 0.5 + math.atan(score) / math.pi
+    return 2 * math.atan(score) / math.pi
+
+
+class LocalMilvusClient:
+    """本地实现的 MilvusClient 子集 root 目录下每个集合一个子目录"""
+
+    def __init__(self, uri: str, **kwargs):
+        path = uri[len(LOCAL_URI_PREFIX):] if uri.startswith(LOCAL_URI_PREFIX) else uri
+        self.root = os.path.abspath(path)
+        os.makedirs(self.root, exist_ok=True)
+        self._collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.RLock()
+
+    # ---- schema ----
+    @staticmethod
+    def create_schema(**kwargs) -> LocalSchema:
+        return LocalSchema(**kwargs)
+
+    @staticmethod
+    def prepare_index_params(**kwargs) -> LocalIndexParams:
+        return LocalIndexParams()
+
+    # ---- 集合管理 ----
+    def _directory(self, collection_name: str) -> str:
+        return os.path.join(self.root, collection_name)
+
+    def list_collections(self, **kwargs) -> List[str]:
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(os.path.join(self.root, name, "meta.json")))
+
+    def has_collection(self, collection_name: str, **kwargs) -> bool:
+        return os.path.exists(os.path.join(self._directory(collection_name), "meta.json"))
+
+    def create_collection(self, collection_name: str, dimension: Optional[int] = None, schema: LocalSchema = None,
+                          index_params: Optional[LocalIndexParams] = None, **kwargs):
+        with self._lock:
+            if self.has_collection(collection_name):
+                raise ValueError(f"集合 {collection_name} 已存在")
+            if schema is None:   # 快速建表: id + vector
+                schema = LocalSchema().add_field("id", "INT64", is_primary=True).add_field("vector", "FLOAT_VECTOR", dim=dimension)
+            directory = self._directory(collection_name)
+            os.makedirs(directory, exist_ok=True)
+            meta = {"fields": schema.fields, "functions": schema.functions, "indexes": list(index_params or []),
+                    "count": 0, "next_id": 1, "num_partitions": kwargs.get("num_partitions"),
+                    "properties": kwargs.get("properties") or {}}
+            with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+
+    def _collection(self, collection_name: str) -> LocalCollection:
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is not None and collection.signature != collection.disk_signature():
+                # 其他进程 (例如 write_milvus 的写入进程) 写过或重建了这个集合, 丢弃内存中的旧状态
+                log.info(f"本地集合 {collection_name} 已被其他进程修改, 重新加载")
+                self._collections.pop(collection_name, None)
+                collection = None
+            if collection is None:
+                if not self.has_collection(collection_name):
+                    raise ValueError(f"集合 {collection_name} 不存在")
+                directory = self._directory(collection_name)
+                with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                    collection = LocalCollection(directory, json.load(f))
+                self._collections[collection_name] = collection
+            return collection
+
+    def drop_collection(self, collection_name: str, **kwargs):
+        with self._lock:
+            self._collections.pop(collection_name, None)
+            shutil.rmtree(self._directory(collection_name), ignore_errors=True)
+
+    def describe_collection(self, collection_name: str, **kwargs) -> dict:
+        collection = self._collection(collection_name)
+        return {"collection_name": collection_name, "fields": collection.meta["fields"],
+                "functions": collection.meta.get("functions", []), "num_rows": collection.count,
+                "num_partitions": collection.meta.get("num_partitions") or 1,
+                "properties": collection.meta.get("properties", {})}
+
+    def list_indexes(self, collection_name: str, **kwargs) -> List[str]:
+        return [index["index_name"] for index in self._collection(collection_name).meta.get("indexes", [])]
+
+    def describe_index(self, collection_name: str, index_name: str, **kwargs) -> dict:
+        for index in self._collection(collection_name).meta.get("indexes", []):
+            if index["index_name"] == index_name:
+                return index
+        return {}
+
+    def get_collection_stats(self, collection_name: str, **kwargs) -> dict:
+        collection = self._collection(collection_name)
+        return {"row_count": int(collection.mask().sum())}
+
+    # 本地数据始终在内存中并且写入即持久化 以下操作不需要做任何事
+    def load_collection(self, collection_name: str, **kwargs):
+        self._collection(collection_name)
+
+    def release_collection(self, collection_name: str, **kwargs):
+        pass
+
+    def create_index(self, collection_name: str, index_params: LocalIndexParams, **kwargs):
+        """只记录索引参数 标量索引在本地没有实际结构, IVF 索引在检索时按需训练"""
+        collection = self._collection(collection_name)
+        with collection.lock:
+            existing = {index["index_name"] for index in collection.meta.get("indexes", [])}
+            for index in index_params:
+                if index["index_name"] not in existing:
+                    collection.meta.setdefault("indexes", []).append(index)
+                    collection.indexes.setdefault(index["field_name"], index)
+            collection._save_meta()
+
+    def drop_index(self, collection_name: str, index_name: str, **kwargs):
+        pass
+
+    def flush(self, collection_name: str, **kwargs):
+        pass
+
+    def close(self):
+        with self._lock:
+            self._collections = {}
+
+    # ---- 数据 ----
+    def insert(self, collection_name: str, data, **kwargs) -> dict:
+        return self._collection(collection_name).insert(data if isinstance(data, list) else [data])
+
+    def upsert(self, collection_name: str, data, **kwargs) -> dict:
+        collection = self._collection(collection_name)
+        data = data if isinstance(data, list) else [data]
+        ids = [item[collection.primary] for item in data if collection.primary in item]
+        if ids:
+            collection.delete(ids=ids)
+        return collection.insert(data)
+
+    def delete(self, collection_name: str, ids: Optional[list] = None, filter: str = "", **kwargs) -> dict:
+        if ids is not None and not isinstance(ids, list):
+            ids = [ids]
+        return self._collection(collection_name).delete(filter=filter, ids=ids)
+
+    def query(self, collection_name: str, filter: str = "", output_fields: Optional[List[str]] = None,
+              limit: Optional[int] = None, offset: int = 0, ids: Optional[list] = None, **kwargs) -> List[dict]:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            mask = collection.mask(filter)
+            if ids is not None:
+                mask &= np.isin(collection.column(collection.primary), list(ids))
+            rows = np.nonzero(mask)[0][offset:]
+            if limit is not None:
+                rows = rows[:limit]
+            fields = list(output_fields or []) + [collection.primary]
+            return [collection.entity(int(r), fields) for r in rows]
+
+    def query_iterator(self, collection_name: str, batch_size: int = 1000, limit: Optional[int] = None,
+                       filter: str = "", output_fields: Optional[List[str]] = None, **kwargs):
+        client = self
+
+        class _Iterator:
+            def __init__(self):
+                self.offset = 0
+
+            def next(self):
+                remaining = batch_size if limit is None else min(batch_size, limit - self.offset)
+                if remaining <= 0:
+                    return []
+                rows = client.query(collection_name, filter=filter, output_fields=output_fields,
+                                    limit=remaining, offset=self.offset)
+                self.offset += len(rows)
+                return rows
+
+            def close(self):
+                pass
+
+        return _Iterator()
+
+    def _hits(self, collection: LocalCollection, ranked: List[tuple], output_fields: Optional[List[str]],
+              metric: str) -> List[dict]:
+        hits = []
+        for row_index, score in ranked:
+            distance = -score if metric == "L2" else score
+            hits.append({"id": collection.rows[row_index][collection.primary], "distance": distance,
+                         "entity": collection.entity(row_index, output_fields)})
+        return hits
+
+    def search(self, collection_name: str, data: list, filter: str = "", limit: int = 10,
+               output_fields: Optional[List[str]] = None, search_params: Optional[dict] = None,
+               anns_field: Optional[str] = None, **kwargs) -> List[List[dict]]:
+        collection = self._collection(collection_name)
+        field = anns_field or next(iter(collection.dense), None) or next(iter(collection.sparse))
+        params = (search_params or {}).get("params", {})
+        results = collection.search(field, data, limit, filter, params)
+        metric = collection.metric(field)
+        return [self._hits(collection, ranked, output_fields, metric) for ranked in results]
+
+    def hybrid_search(self, collection_name: str, reqs: list, ranker, limit: int = 10,
+                      output_fields: Optional[List[str]] = None, **kwargs) -> List[List[dict]]:
+        """每一路请求分别检索 再按 RRF 或加权得分融合"""
+        collection = self._collection(collection_name)
+        spec = _ranker_spec(ranker)
+        per_request = []
+        for req in reqs:
+            results = collection.search(req.anns_field, req.data, req.limit, req.expr, dict(req.param or {}))
+            per_request.append((results, collection.metric(req.anns_field)))
+
+        fused_results = []
+        for query_index in range(len(reqs[0].data) if reqs else 0):
+            fused = defaultdict(float)
+            for request_index, (results, metric) in enumerate(per_request):
+                for rank, (row_index, score) in enumerate(results[query_index], 1):
+                    if spec["strategy"] == "weighted":
+                        weight = spec["params"]["weights"][request_index]
+                        fused[row_index] += weight * _normalize_score(score, metric)
+                    else:
+                        fused[row_index] += 1.0 / (spec["params"].get("k", 60) + rank)
+            ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
+            fused_results.append(self._hits(collection, ranked, output_fields, "FUSED"))
+        return fused_results
+
+
+def is_local_uri(uri: str) -> bool:
+    return uri.startswith(LOCAL_URI_PREFIX)
+
+
+_local_clients: Dict[str, LocalMilvusClient] = {}
+_local_clients_lock = threading.Lock()
+
+
+def open_local_client(uri: str) -> LocalMilvusClient:
+    """同一进程内同一目录只打开一个客户端 多个实例各自持有内存索引会互相看不到对方的写入"""
+    path = os.path.abspath(uri[len(LOCAL_URI_PREFIX):] if is_local_uri(uri) else uri)
+    with _local_clients_lock:
+        client = _local_clients.get(path)
+        if client is None:
+            log.info(f"打开本地向量库: {path}")
+            client = _local_clients[path] = LocalMilvusClient(path)
+        return client
+
+
+if __name__ == "__main__":
+    # milvus_db_with_schema 按 documents 目录内的相对方式导入 markdown_parser
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "documents"))
+    from documents.markdown_parser import MarkdownParser
+    from documents.milvus_db_with_schema import MilvusVectorSave, TEXT_MAX_LENGTH
+    from search_tool.hybrid_retriever import HybridRetriever
+    from utils.embedding_cache import CachedEmbeddings
+    from llm_utils import openai_embedding
+    from env_utils import COLLECTION_NAME
+
+    # 与 Milvus 服务完全相同的建表 / 写入 / 混合检索流程, 只是 uri 换成本地目录
+    local_uri = LOCAL_URI_PREFIX + os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                                "cache", "local_milvus")
+    docs = MarkdownParser().parse_markdown_to_documents(r"E:\Workspace\ai\RAG\datas\md\tech_report_z7tx05vt.md")
+    mv = MilvusVectorSave()
+    mv.create_collection(uri=local_uri, is_first=True)
+    mv.create_client(uri=local_uri)
+    for doc in docs:
+        doc.page_content = doc.page_content[:TEXT_MAX_LENGTH]
+    vectors = CachedEmbeddings(openai_embedding).embed_documents([doc.page_content for doc in docs])
+    print(mv.insert_rows(mv.documents_to_rows(docs, vectors))["insert_count"])
+
+    retriever = HybridRetriever.from_uri(local_uri, k=3, expr='category == "TitleWithContent" && category_depth > 1')
+    for doc in retriever.invoke("干法刻蚀"):
+        print(doc.metadata.get("title"), doc.page_content[:80])
+    print(open_local_client(local_uri).get_collection_stats(COLLECTION_NAME))
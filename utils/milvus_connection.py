@@ -0,0 +1,174 @@
+import sys
+import os
+import time
+import json
+import hashlib
+import itertools
+import threading
+from typing import Dict, List, Tuple
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pymilvus import MilvusClient
+from env_utils import MILVUS_URI
+from utils.log_utils import log
+from utils.local_milvus import LocalMilvusClient, is_local_uri, open_local_client
+from utils.store_client import VectorStoreClient
+
+"""
+进程内共享的 Milvus 连接管理
+- 懒连接: 第一次 get_client 时才建立连接
+- 连接池: 每个 uri 最多 pool_size 个 MilvusClient, 轮询分配给调用方 (MilvusClient 本身线程安全, 多个客户端可以分摊单个 gRPC 连接的并发)
+- 健康检查: 距上次检查超过 health_check_interval 秒时用 list_collections 探活, 失败则为池子建立新连接;
+  旧连接不关闭 (HybridRetriever / MilvusVectorSave 等可能还持有它, gRPC 通道恢复后仍然可用), 进程退出前由 close_all 关闭
+- 多进程: 按进程号区分, fork 出来的子进程会建立自己的连接 (gRPC 连接不能跨进程共享)
+- LangChain Milvus 向量库实例按 (uri, 集合名, embedding, 其余参数) 缓存, 重复调用 create_connection 不会重复握手和初始化
+- uri 为 "local://<目录>" 时返回进程内的本地向量库 (utils.local_milvus), 不需要 Milvus 服务
+"""
+
+
+class _PooledClients:
+    """同一个 uri 的客户端池"""
+
+    def __init__(self):
+        self.clients: List[MilvusClient] = []
+        self.last_checked: List[float] = []
+        self.retired: List[MilvusClient] = []   # 探活失败后被替换的客户端 调用方可能还持有, close_all 时才关闭
+        self.counter = itertools.count()
+
+
+class MilvusConnectionManager:
+    """线程安全的 MilvusClient 工厂"""
+
+    def __init__(self, pool_size: int = 1, health_check_interval: float = 30.0):
+        """
+        :param pool_size: 每个 uri 的客户端数量
+        :param health_check_interval: 健康检查间隔 秒 0 表示每次获取都检查
+        """
+        self.pool_size = pool_size
+        self.health_check_interval = health_check_interval
+        self._pools: Dict[Tuple, _PooledClients] = {}
+        self._stores: Dict[Tuple, object] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(uri: str, token: str, db_name: str) -> Tuple:
+        return os.getpid(), uri, token, db_name
+
+    @staticmethod
+    def _connect(uri: str, token: str, db_name: str) -> MilvusClient:
+        if is_local_uri(uri):
+            return open_local_client(uri)
+        log.info(f"建立 Milvus 连接: {uri}")
+        return MilvusClient(uri=uri, token=token, db_name=db_name)
+
+    @staticmethod
+    def is_healthy(client: MilvusClient) -> bool:
+        try:
+            client.list_collections()
+            return True
+        except Exception as e:
+            log.warning(f"Milvus 连接健康检查失败: {e}")
+            return False
+
+    def get_client(self, uri: str = MILVUS_URI, token: str = "", db_name: str = "") -> MilvusClient:
+        """获取一个共享的 MilvusClient 按需建立连接并定期探活"""
+        key = self._key(uri, token, db_name)
+        with self._lock:
+            pool = self._pools.setdefault(key, _PooledClients())
+            if len(pool.clients) < self.pool_size:
+                client = self._connect(uri, token, db_name)
+                pool.clients.append(client)
+                pool.last_checked.append(time.monotonic())
+                return client
+            index = next(pool.counter) % len(pool.clients)
+            client = pool.clients[index]
+            now = time.monotonic()
+            if now - pool.last_checked[index] < self.health_check_interval:
+                return client
+            pool.last_checked[index] = now
+        # 探活在锁外进行, 不阻塞其他线程获取健康的客户端
+        if self.is_healthy(client):
+            return client
+        with self._lock:
+            if pool.clients[index] is client:
+                pool.retired.append(client)   # 已经交给调用方的客户端不能在这里关闭
+                client = self._connect(uri, token, db_name)
+                pool.clients[index] = client
+                pool.last_checked[index] = time.monotonic()
+            return pool.clients[index]
+
+    @staticmethod
+    def _kwargs_key(milvus_kwargs: dict) -> str:
+        """milvus_kwargs 的稳定摘要 对象参数 (例如 BM25BuiltInFunction) 按属性比较, 不按内存地址"""
+        def stable(obj):
+            attrs = getattr(obj, "__dict__", None)
+            return {"type": type(obj).__qualname__, **attrs} if attrs is not None else repr(obj)
+        try:
+            text = json.dumps(milvus_kwargs, sort_keys=True, default=stable)
+        except (TypeError, ValueError):   # 循环引用等无法序列化的参数
+            text = repr(sorted(milvus_kwargs.items(), key=lambda item: item[0]))
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get_vector_store(self, collection_name: str, embedding_function, uri: str = MILVUS_URI, **milvus_kwargs):
+        """
+        获取一个共享的 langchain_milvus.Milvus 实例 第一次调用时按 milvus_kwargs 创建
+        :param collection_name: 集合名
+        :param embedding_function: embedding 对象 不同的 embedding 对应不同的实例
+        :param milvus_kwargs: 传给 Milvus 的其余参数 (builtin_function, vector_field, index_params ...)
+                              参数不同的调用得到不同的实例
+        """
+        if is_local_uri(uri):
+            raise ValueError(f"langchain Milvus 不支持本地向量库 {uri}, 请使用 get_milvus_client 获取客户端直接读写")
+        from langchain_milvus import Milvus
+        key = (os.getpid(), uri, collection_name, id(embedding_function), self._kwargs_key(milvus_kwargs))
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                store = Milvus(
+                    embedding_function=embedding_function,
+                    collection_name=collection_name,
+                    connection_args={"uri": uri},
+                    **milvus_kwargs,
+                )
+                self._stores[key] = store
+            return store
+
+    def invalidate_collection(self, collection_name: str):
+        """集合被删除或重建后调用 丢弃缓存的向量库实例, 下次获取时重新初始化"""
+        with self._lock:
+            for key in [k for k in self._stores if k[2] == collection_name]:
+                del self._stores[key]
+
+    @staticmethod
+    def _close_quietly(client: MilvusClient):
+        if isinstance(client, LocalMilvusClient):   # 本地客户端在进程内共享 不能关闭
+            return
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        """关闭当前进程的所有连接"""
+        pid = os.getpid()
+        with self._lock:
+            for key in [k for k in self._pools if k[0] == pid]:
+                pool = self._pools.pop(key)
+                for client in pool.clients + pool.retired:
+                    self._close_quietly(client)
+            for key in [k for k in self._stores if k[0] == pid]:
+                del self._stores[key]
+
+
+milvus_manager = MilvusConnectionManager()
+
+
+def get_milvus_client(uri: str = MILVUS_URI, **kwargs) -> VectorStoreClient:
+    """获取共享的客户端 等价于 milvus_manager.get_client; local:// 返回本地向量库, 两者都满足 VectorStoreClient 接口"""
+    return milvus_manager.get_client(uri, **kwargs)
+
+
+def get_vector_store(collection_name: str, embedding_function, uri: str = MILVUS_URI, **milvus_kwargs):
+    """获取共享的 langchain Milvus 向量库 等价于 milvus_manager.get_vector_store"""
+    return milvus_manager.get_vector_store(collection_name, embedding_function, uri=uri, **milvus_kwargs)
@@ -0,0 +1,249 @@
+import sys
+import os
+import re
+import json
+import math
+import zlib
+import threading
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from env_utils import COLLECTION_NAME
+from utils.log_utils import log
+
+"""
+客户端 BM25 稀疏向量编码 代替 Milvus 服务端的 FunctionType.BM25
+- 分词在解析进程中完成, 不占用 Milvus 节点的 CPU; 分词结果和词 id 都有进程内缓存
+- 文档向量只包含词频饱和部分 tf*(k1+1)/(tf + k1*(1-b+b*dl/avgdl)), 查询向量为各词的 idf
+  两者内积即 BM25 得分, 所以语料的 idf 统计可以增量更新, 已写入的文档向量不需要重算
+- 词 id 为词的 crc32, 各个进程不需要共享词表
+- 语料统计 (文档数 / 每个词的文档频率 / 总词数) 保存在 cache/bm25_stats_<集合名>.json
+  解析进程只统计本进程的增量, 由主进程合并后写入文件; 检索进程发现文件更新后自动重新加载
+集合需要用 MilvusVectorSave.create_collection(client_sparse=True) 创建: 没有 BM25 Function, 稀疏索引的度量为 IP
+"""
+
+# 获得当前项目的绝对路径
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cache_dir = os.path.join(root_dir, "cache")
+
+DEFAULT_AVGDL = 200.0   # 还没有语料统计时使用的平均文档长度(词数)
+MAX_TERM_ID = 2 ** 32 - 1   # Milvus 稀疏向量的下标范围 [0, 2^32 - 1)
+
+# 英文/数字按单词切分, 连续的中日韩文字作为一段
+_WORD_REGEX = re.compile(r"[a-z0-9]+|[぀-ヿ㐀-䶿一-鿿가-힯]+")
+_TOKEN_REGEX = re.compile(r"\w", re.UNICODE)
+
+
+def stats_path(collection_name: str = COLLECTION_NAME) -> str:
+    return os.path.join(cache_dir, f"bm25_stats_{collection_name}.json")
+
+
+def bigram_tokenize(text: str) -> List[str]:
+    """不依赖分词库的切分方式: 英文/数字按单词, 中日韩文字切成单字和相邻二元组"""
+    tokens = []
+    for word in _WORD_REGEX.findall(text.lower()):
+        if word.isascii():
+            tokens.append(word)
+        else:
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+def jieba_tokenize(text: str) -> List[str]:
+    """jieba 搜索引擎模式分词 与 Milvus 的 jieba analyzer 一样会切出长词中的短词; 去掉空白和标点"""
+    import jieba
+    return [t for t in (w.strip().lower() for w in jieba.lcut_for_search(text)) if t and _TOKEN_REGEX.search(t)]
+
+
+def create_tokenizer(tokenizer: Union[str, Callable[[str], List[str]], None] = "jieba") -> Callable[[str], List[str]]:
+    """
+    :param tokenizer: "jieba" / "bigram" 或者自定义函数 text -> 词列表; 没有安装 jieba 时退回 bigram
+    """
+    if callable(tokenizer):
+        return tokenizer
+    if tokenizer in ("jieba", "chinese"):
+        try:
+            import jieba  # noqa: F401
+            return jieba_tokenize
+        except ImportError:
+            log.warning("没有安装 jieba, 使用单字+二元组切分")
+    return bigram_tokenize
+
+
+def term_id(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8")) % MAX_TERM_ID
+
+
+class CorpusStats:
+    """BM25 需要的语料统计 可以增量累加/扣减, 多个进程的增量用 merge 合并"""
+
+    def __init__(self, num_docs: int = 0, total_tokens: int = 0, df: Optional[Dict[int, int]] = None):
+        self.num_docs = num_docs
+        self.total_tokens = total_tokens
+        self.df: Dict[int, int] = df or {}
+
+    @property
+    def avgdl(self) -> float:
+        return self.total_tokens / self.num_docs if self.num_docs else DEFAULT_AVGDL
+
+    def add(self, term_ids: Iterable[int], length: int):
+        """加入一篇文档 term_ids 为文档中出现过的词 (去重)"""
+        self.num_docs += 1
+        self.total_tokens += length
+        for tid in term_ids:
+            self.df[tid] = self.df.get(tid, 0) + 1
+
+    def remove(self, term_ids: Iterable[int], length: Optional[int] = None):
+        """
+        扣减一篇已删除的文档
+        :param length: 文档词数 从 Milvus 读回的稀疏向量中没有这个信息, 不传时按平均长度扣减
+        """
+        length = self.avgdl if length is None else length
+        self.num_docs = max(0, self.num_docs - 1)
+        self.total_tokens = max(0, int(round(self.total_tokens - length)))
+        for tid in term_ids:
+            count = self.df.get(tid, 0) - 1
+            if count > 0:
+                self.df[tid] = count
+            else:
+                self.df.pop(tid, None)
+
+    def subtract(self, other: Union["CorpusStats", dict]):
+        """
+        扣减一批已删除 (或没有写入) 的文档 与 merge 相反
+        other.total_tokens 为 0 时 (只有稀疏向量, 不知道文档长度) 按平均长度扣减
+        """
+        if isinstance(other, dict):
+            other = CorpusStats.from_dict(other)
+        tokens = other.total_tokens or other.num_docs * self.avgdl
+        self.num_docs = max(0, self.num_docs - other.num_docs)
+        self.total_tokens = max(0, int(round(self.total_tokens - tokens)))
+        for tid, count in other.df.items():
+            remaining = self.df.get(tid, 0) - count
+            if remaining > 0:
+                self.df[tid] = remaining
+            else:
+                self.df.pop(tid, None)
+
+    def merge(self, other: Union["CorpusStats", dict]):
+        if isinstance(other, dict):
+            other = CorpusStats.from_dict(other)
+        self.num_docs += other.num_docs
+        self.total_tokens += other.total_tokens
+        for tid, count in other.df.items():
+            self.df[tid] = self.df.get(tid, 0) + count
+
+    def idf(self, tid: int) -> float:
+        df = self.df.get(tid, 0)
+        return math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+
+    def to_dict(self) -> dict:
+        return {"num_docs": self.num_docs, "total_tokens": self.total_tokens,
+                "df": {str(k): v for k, v in self.df.items()}}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CorpusStats":
+        return cls(data.get("num_docs", 0), data.get("total_tokens", 0),
+                   {int(k): v for k, v in data.get("df", {}).items()})
+
+    @classmethod
+    def load(cls, path: str) -> "CorpusStats":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(path + ".tmp", path)
+
+
+class BM25SparseEncoder:
+    """把文本编码为 Milvus SPARSE_FLOAT_VECTOR ({词id: 权重})"""
+
+    def __init__(self, tokenizer: Union[str, Callable[[str], List[str]], None] = "jieba", k1: float = 1.2,
+                 b: float = 0.75, collection_name: str = COLLECTION_NAME, stats: Optional[CorpusStats] = None,
+                 stopwords: Optional[Iterable[str]] = None, cache_size: int = 10_000):
+        """
+        :param tokenizer: 分词方式 见 create_tokenizer
+        :param k1: 词频饱和参数 与服务端 BM25 索引的 bm25_k1 含义相同
+        :param b: 文档长度归一化参数 与 bm25_b 含义相同
+        :param collection_name: 语料统计文件对应的集合
+        :param stats: 直接指定语料统计 不指定时从 stats_path(collection_name) 加载
+        :param stopwords: 停用词 不参与编码
+        :param cache_size: 分词结果的 LRU 缓存条数 (重复的查询/标题不会重复分词)
+        """
+        self.k1 = k1
+        self.b = b
+        self.path = stats_path(collection_name)
+        self.stats = stats if stats is not None else CorpusStats.load(self.path)
+        self._stats_mtime = os.path.getmtime(self.path) if stats is None and os.path.exists(self.path) else None
+        self._lock = threading.Lock()
+        stopwords = frozenset(stopwords or ())
+        tokenize = create_tokenizer(tokenizer)
+        self._term_ids = lru_cache(maxsize=cache_size * 10)(term_id)
+        self.tokenize = lru_cache(maxsize=cache_size)(lambda text: tuple(t for t in tokenize(text) if t not in stopwords))
+
+    def term_frequencies(self, text: str) -> Counter:
+        return Counter(self._term_ids(t) for t in self.tokenize(text or ""))
+
+    def encode_document(self, text: str, delta: Optional[CorpusStats] = None) -> Dict[int, float]:
+        """
+        文档向量 只包含词频饱和部分, idf 在查询向量中
+        :param delta: 传入时把这篇文档计入该增量统计 (解析进程用它累计本进程的增量)
+        """
+        tf = self.term_frequencies(text)
+        length = sum(tf.values())
+        norm = self.k1 * (1 - self.b + self.b * length / self.stats.avgdl)
+        if delta is not None:
+            delta.add(tf.keys(), length)
+        return {tid: count * (self.k1 + 1) / (count + norm) for tid, count in tf.items()}
+
+    def encode_documents(self, texts: List[str], delta: Optional[CorpusStats] = None) -> List[Dict[int, float]]:
+        return [self.encode_document(text, delta) for text in texts]
+
+    def _maybe_reload(self):
+        """导入进程更新了统计文件后 检索进程重新加载 (只比较修改时间, 开销很小)"""
+        if self._stats_mtime is None and not os.path.exists(self.path):
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._stats_mtime:
+            with self._lock:
+                if mtime != self._stats_mtime:
+                    self.stats = CorpusStats.load(self.path)
+                    self._stats_mtime = mtime
+                    log.info(f"已重新加载 BM25 语料统计: {self.stats.num_docs} 篇文档, {len(self.stats.df)} 个词")
+
+    def encode_query(self, text: str) -> Dict[int, float]:
+        """查询向量 每个在语料中出现过的词取其 idf, 查询中重复的词只计一次 (与服务端 BM25 一致)"""
+        self._maybe_reload()
+        stats = self.stats
+        return {tid: stats.idf(tid) for tid in self.term_frequencies(text) if tid in stats.df}
+
+    def encode_queries(self, texts: List[str]) -> List[Dict[int, float]]:
+        return [self.encode_query(text) for text in texts]
+
+    def save_stats(self):
+        self.stats.save(self.path)
+        self._stats_mtime = os.path.getmtime(self.path)
+
+
+if __name__ == "__main__":
+    texts = ["干法刻蚀是利用等离子体进行刻蚀的工艺", "湿法刻蚀使用化学溶液", "光刻胶的涂布与显影"]
+    encoder = BM25SparseEncoder(stats=CorpusStats())
+    delta = CorpusStats()
+    vectors = encoder.encode_documents(texts, delta)
+    encoder.stats.merge(delta)
+    query = encoder.encode_query("干法刻蚀")
+    for text, vector in zip(texts, vectors):
+        score = sum(weight * vector.get(tid, 0.0) for tid, weight in query.items())
+        print(f"{score:.4f} {text} {encoder.tokenize(text)}")
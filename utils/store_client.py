@@ -0,0 +1,73 @@
+import sys
+import os
+from typing import Any, Iterable, List, Optional, Protocol, runtime_checkable
+
+# 添加项目根目录到Python路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""
+向量库客户端接口 项目中的建表 / 写入 / 检索代码只依赖这里列出的方法
+- pymilvus.MilvusClient: 连接 Milvus 服务
+- utils.local_milvus.LocalMilvusClient: 进程内的本地向量库 (uri 为 "local://<目录>")
+两者都由 utils.milvus_connection.get_milvus_client 按 uri 返回; 新增后端时实现这些方法即可接入
+"""
+
+
+@runtime_checkable
+class VectorStoreClient(Protocol):
+    """MilvusClient 的接口子集 参数名与 pymilvus 保持一致"""
+
+    # ---- schema ----
+    def create_schema(self, **kwargs) -> Any: ...
+
+    def prepare_index_params(self, **kwargs) -> Any: ...
+
+    # ---- 集合管理 ----
+    def list_collections(self, **kwargs) -> List[str]: ...
+
+    def has_collection(self, collection_name: str, **kwargs) -> bool: ...
+
+    def create_collection(self, collection_name: str, dimension: Optional[int] = None, **kwargs): ...
+
+    def drop_collection(self, collection_name: str, **kwargs): ...
+
+    def describe_collection(self, collection_name: str, **kwargs) -> dict: ...
+
+    def get_collection_stats(self, collection_name: str, **kwargs) -> dict: ...
+
+    def load_collection(self, collection_name: str, **kwargs): ...
+
+    def release_collection(self, collection_name: str, **kwargs): ...
+
+    def flush(self, collection_name: str, **kwargs): ...
+
+    def close(self): ...
+
+    # ---- 索引 ----
+    def list_indexes(self, collection_name: str, **kwargs) -> List[str]: ...
+
+    def describe_index(self, collection_name: str, index_name: str, **kwargs) -> dict: ...
+
+    def create_index(self, collection_name: str, index_params: Any, **kwargs): ...
+
+    def drop_index(self, collection_name: str, index_name: str, **kwargs): ...
+
+    # ---- 读写 ----
+    def insert(self, collection_name: str, data: Any, **kwargs) -> dict: ...
+
+    def upsert(self, collection_name: str, data: Any, **kwargs) -> dict: ...
+
+    def delete(self, collection_name: str, ids: Optional[list] = None, filter: str = "", **kwargs) -> dict: ...
+
+    def query(self, collection_name: str, filter: str = "", output_fields: Optional[List[str]] = None,
+              **kwargs) -> List[dict]: ...
+
+    def query_iterator(self, collection_name: str, batch_size: int = 1000, limit: Optional[int] = None,
+                       filter: str = "", output_fields: Optional[List[str]] = None, **kwargs) -> Any: ...
+
+    def search(self, collection_name: str, data: list, filter: str = "", limit: int = 10,
+               output_fields: Optional[List[str]] = None, search_params: Optional[dict] = None,
+               anns_field: Optional[str] = None, **kwargs) -> List[List[dict]]: ...
+
+    def hybrid_search(self, collection_name: str, reqs: Iterable, ranker: Any, limit: int = 10,
+                      output_fields: Optional[List[str]] = None, **kwargs) -> List[List[dict]]: ...